@@ -4,13 +4,14 @@ Created on Apr 10, 2014
 @author: u0490822
 '''
 
-import nornir_volumecontroller
-import nornir_volumemodel
-
 
 def CreateVolumeController(vol_model):
     '''Given a volume model create a controller for the model'''
 
+    # Imported on first use, the controller and volume model packages load the SciPy image stack
+    import nornir_volumecontroller
+    import nornir_volumemodel
+
     if(isinstance(vol_model, str)):
         vol_model = nornir_volumemodel.Load_Xml(vol_model)
 
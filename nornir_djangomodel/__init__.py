@@ -1 +1 @@
-__all__ = ['import_xml', 'models']
\ No newline at end of file
+__all__ = ['import_xml', 'models', 'import_plan', 'inverse_lookup', 'dry_run', 'generations', 'keyset', 'bulk_load', 'bulk_sql', 'composed_transforms', 'partitions', 'profiling', 'read_rows', 'scale_conversion', 'schema', 'section_extents', 'staging', 'tile_adjacency', 'tile_grid', 'tile_index', 'transform_blobs', 'transform_bounds', 'volume_xml_stream']
\ No newline at end of file
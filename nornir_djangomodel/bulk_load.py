@@ -0,0 +1,185 @@
+'''
+Created on Oct 19, 2026
+
+Bulk-load mode for large imports.
+
+Inside BulkLoad the secondary indexes of BoundingBox, Data2D and Mapping2D are
+dropped, so inserts only maintain the primary key and unique constraints, and
+the database runs with relaxed durability:
+
+    SQLite      journal_mode=WAL, synchronous=OFF
+    PostgreSQL  synchronous_commit=off, larger maintenance_work_mem for the rebuild
+
+On exit each index is recreated from the DDL read out of the database catalog
+before it was dropped, so the rebuilt index is identical.  Every table is then
+checked: the database's own consistency check, and a scan for rows that
+reference missing bounding boxes.  A failed check raises IntegrityError.
+
+Indexes the importer itself reads from, listed in KeepIndexes, stay in place.
+
+    with bulk_load.BulkLoad(using='default'):
+        ...
+'''
+
+import re
+
+from django.db import connections, DEFAULT_DB_ALIAS, IntegrityError
+
+from . import bulk_sql
+from . import models
+
+# Tables whose secondary indexes are dropped during a bulk load
+BulkLoadModels = (models.BoundingBox, models.Data2D, models.Mapping2D)
+
+# (model, field) pairs whose indexes the importer queries while loading
+KeepIndexes = ((models.Mapping2D, 'dest_coordinate_space'),)
+
+
+class BulkLoad():
+    '''Context manager deferring secondary index maintenance and relaxing durability for an import'''
+
+    @property
+    def dropped_indexes(self):
+        ''':return: List of (index name, CREATE INDEX statement) dropped on entry'''
+        return self._dropped
+
+    def __init__(self, using=None, model_list=None, check=True):
+        '''
+        :param str using: Database alias to load
+        :param model_list: Models whose indexes are dropped, defaults to BulkLoadModels
+        :param bool check: Run integrity checks after rebuilding the indexes
+        '''
+        self._using = DEFAULT_DB_ALIAS if using is None else using
+        self._models = BulkLoadModels if model_list is None else model_list
+        self._check = check
+        self._dropped = []
+        self._restore_settings = []
+
+    @property
+    def connection(self):
+        return connections[self._using]
+
+    @property
+    def vendor(self):
+        return self.connection.vendor
+
+    def __enter__(self):
+        if self.vendor not in ('sqlite', 'postgresql'):
+            print("Bulk load mode is not supported for %s databases, importing normally" % self.vendor)
+            return self
+
+        cursor = self.connection.cursor()
+        try:
+            self._ApplySettings(cursor)
+
+            for model in self._models:
+                for (name, sql) in self._SecondaryIndexes(cursor, model):
+                    cursor.execute("DROP INDEX %s" % self.connection.ops.quote_name(name))
+                    self._dropped.append((name, sql))
+        except:
+            cursor.close()
+            self._Restore()
+            raise
+
+        cursor.close()
+        print("Bulk load: dropped %d indexes" % len(self._dropped))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._Restore()
+
+        if exc_type is None and self._check:
+            self.Check()
+
+    def _ApplySettings(self, cursor):
+        if self.connection.in_atomic_block:
+            # Journal and sync settings cannot change inside a transaction
+            return
+
+        if self.vendor == 'sqlite':
+            for (pragma, value) in (('journal_mode', 'WAL'), ('synchronous', 'OFF')):
+                cursor.execute("PRAGMA %s" % pragma)
+                self._restore_settings.append("PRAGMA %s = %s" % (pragma, cursor.fetchone()[0]))
+                cursor.execute("PRAGMA %s = %s" % (pragma, value))
+        elif self.vendor == 'postgresql':
+            for (setting, value) in (('synchronous_commit', 'off'), ('maintenance_work_mem', "'1GB'")):
+                cursor.execute("SHOW %s" % setting)
+                self._restore_settings.append("SET %s TO '%s'" % (setting, cursor.fetchone()[0]))
+                cursor.execute("SET %s TO %s" % (setting, value))
+
+    def _Restore(self):
+        '''Recreate the dropped indexes, then restore the database settings'''
+        cursor = self.connection.cursor()
+        try:
+            for (name, sql) in self._dropped:
+                cursor.execute(sql)
+
+            if len(self._dropped) > 0:
+                print("Bulk load: rebuilt %d indexes" % len(self._dropped))
+
+            self._dropped = []
+
+            for sql in reversed(self._restore_settings):
+                cursor.execute(sql)
+
+            self._restore_settings = []
+        finally:
+            cursor.close()
+
+    def _KeptColumns(self, model):
+        return [model._meta.get_field(field_name).column for (keep_model, field_name) in KeepIndexes if keep_model is model]
+
+    def _SecondaryIndexes(self, cursor, model):
+        ''':return: List of (name, CREATE INDEX statement) for the non-unique indexes of a model's table'''
+        table = model._meta.db_table
+        if self.vendor == 'sqlite':
+            # Indexes backing PRIMARY KEY and UNIQUE constraints have no sql
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL", [table])
+        else:
+            cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s " +
+                           "AND indexname NOT IN (SELECT conname FROM pg_constraint)", [table])
+
+        kept_columns = self._KeptColumns(model)
+        indexes = []
+        for (name, sql) in cursor.fetchall():
+            if sql.upper().startswith('CREATE UNIQUE'):
+                continue
+
+            if any([re.search(r'\(\s*"?%s"?\s*\)' % re.escape(column), sql) for column in kept_columns]):
+                continue
+
+            indexes.append((name, sql))
+
+        return indexes
+
+    def Check(self):
+        '''Verify the database after a bulk load
+        :raises IntegrityError: If the database reports corruption or rows reference missing bounding boxes'''
+        cursor = self.connection.cursor()
+        try:
+            if self.vendor == 'sqlite':
+                cursor.execute("PRAGMA quick_check")
+                problems = [row[0] for row in cursor.fetchall() if row[0] != 'ok']
+                if len(problems) > 0:
+                    raise IntegrityError("SQLite quick_check failed: %s" % "; ".join(problems))
+            elif self.vendor == 'postgresql':
+                cursor.execute("SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid " +
+                               "JOIN pg_class t ON t.oid = i.indrelid WHERE NOT i.indisvalid AND t.relname IN (%s)" % ", ".join(["%s"] * len(self._models)),
+                               [model._meta.db_table for model in self._models])
+                invalid = [row[0] for row in cursor.fetchall()]
+                if len(invalid) > 0:
+                    raise IntegrityError("Invalid indexes after bulk load: %s" % ", ".join(invalid))
+
+            s = bulk_sql.ImportStatements(using=self._using)
+            for (model, field_name) in bulk_sql.BoundingBoxReferences:
+                sql = "SELECT COUNT(*) FROM %s WHERE %s IS NOT NULL AND NOT EXISTS (SELECT 1 FROM %s WHERE %s.%s = %s.%s)" % (
+                    s.Table(model), s.Column(model, field_name),
+                    s.Table(models.BoundingBox),
+                    s.Table(models.BoundingBox), s.Column(models.BoundingBox, 'id'),
+                    s.Table(model), s.Column(model, field_name))
+                cursor.execute(sql)
+                num_missing = cursor.fetchone()[0]
+                if num_missing > 0:
+                    raise IntegrityError("%d %s rows reference missing bounding boxes through %s" % (num_missing, model.__name__, field_name))
+        finally:
+            cursor.close()
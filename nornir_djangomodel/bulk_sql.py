@@ -0,0 +1,306 @@
+'''
+Created on Oct 19, 2026
+
+Fixed-shape SQL used by the importer for statements it repeats once per tile.
+
+Building these through the ORM means compiling the same query millions of
+times during a large import.  The statements here are formatted once per
+connection and then executed with parameters, or batched with executemany.
+'''
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+from . import generations
+from . import keyset
+from . import models
+from . import partitions
+from . import schema
+from . import section_extents
+from . import transform_blobs
+
+class ImportStatements():
+    '''Holds a single cursor for the duration of an import and issues the
+       fixed query shapes the importer repeats for every tile'''
+
+    @property
+    def connection(self):
+        return self._connection
+
+    @property
+    def cursor(self):
+        if self._cursor is None:
+            self._cursor = self._connection.cursor()
+
+        return self._cursor
+
+    def __init__(self, using=None):
+        if using is None:
+            using = DEFAULT_DB_ALIAS
+
+        self._connection = connections[using]
+        self._cursor = None
+        self._sql = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+
+    def Table(self, model):
+        return self._connection.ops.quote_name(model._meta.db_table)
+
+    def Column(self, model, field_name):
+        return self._connection.ops.quote_name(model._meta.get_field(field_name).column)
+
+    def _Statement(self, key, create_func):
+        '''Format a statement the first time it is requested and reuse the text afterward'''
+        sql = self._sql.get(key, None)
+        if sql is None:
+            sql = create_func()
+            self._sql[key] = sql
+
+        return sql
+
+    def _InsertSQL(self, model, field_names):
+        columns = ", ".join([self.Column(model, name) for name in field_names])
+        placeholders = ", ".join(["%s"] * len(field_names))
+        return "INSERT INTO %s (%s) VALUES (%s)" % (self.Table(model), columns, placeholders)
+
+    def _UpdateSQL(self, model, field_names, key_name):
+        assignments = ", ".join(["%s = %%s" % self.Column(model, name) for name in field_names])
+        return "UPDATE %s SET %s WHERE %s = %%s" % (self.Table(model), assignments, self.Column(model, key_name))
+
+    def _Insert(self, key, model, field_names, params):
+        '''Insert a single row and return its primary key'''
+        features = self._connection.features
+        sql = self._Statement(key, lambda: self._InsertSQL(model, field_names))
+
+        if features.can_return_id_from_insert:
+            (returning_sql, returning_params) = self._connection.ops.return_insert_id()
+            self.cursor.execute(sql + " " + returning_sql % self.Column(model, model._meta.pk.name), list(params) + list(returning_params))
+            return self._connection.ops.fetch_returned_insert_id(self.cursor)
+
+        self.cursor.execute(sql, params)
+        return self._connection.ops.last_insert_id(self.cursor, model._meta.db_table, model._meta.pk.column)
+
+    BoundingBoxFields = ('minX', 'minY', 'minZ', 'maxX', 'maxY', 'maxZ')
+
+    def InsertBoundingBox(self, minX, minY, minZ, maxX, maxY, maxZ):
+        '''Insert a bounding box row.
+        :return: Unsaved BoundingBox model carrying the id of the new row'''
+        params = (minX, minY, minZ, maxX, maxY, maxZ)
+        db_id = self._Insert('insert_boundingbox', models.BoundingBox, ImportStatements.BoundingBoxFields, params)
+        return models.BoundingBox(id=db_id, minX=minX, minY=minY, minZ=minZ, maxX=maxX, maxY=maxY, maxZ=maxZ)
+
+    MappingFields = ('transform_string', 'transform_blob', 'src_coordinate_space', 'src_bounding_box', 'dest_coordinate_space', 'dest_bounding_box')
+
+    def MappingIDsForDestination(self, dest_coordinate_space_name):
+        ''':return: Dictionary mapping source coordinate space name to Mapping2D id for every mapping into the destination space'''
+        sql = self._Statement('select_mapping_by_dest',
+                              lambda: "SELECT %s, %s FROM %s WHERE %s = %%s" % (self.Column(models.Mapping2D, 'src_coordinate_space'),
+                                                                                self.Column(models.Mapping2D, 'id'),
+                                                                                self.Table(models.Mapping2D),
+                                                                                self.Column(models.Mapping2D, 'dest_coordinate_space')))
+        self.cursor.execute(sql, [dest_coordinate_space_name])
+        return dict(self.cursor.fetchall())
+
+    def InsertMappings(self, rows):
+        ''':param list rows: (transform_string, transform_blob_hash, src_space_name, src_bbox_id, dest_space_name, dest_bbox_id) tuples'''
+        if len(rows) == 0:
+            return
+
+        sql = self._Statement('insert_mapping', lambda: self._InsertSQL(models.Mapping2D, ImportStatements.MappingFields))
+        self.cursor.executemany(sql, rows)
+
+    def UpdateMappings(self, rows):
+        '''Rewrite the transform and bounding boxes of existing mappings.
+        :param list rows: (transform_string, transform_blob_hash, src_bbox_id, dest_bbox_id, mapping_id) tuples'''
+        if len(rows) == 0:
+            return
+
+        sql = self._Statement('update_mapping', lambda: self._UpdateSQL(models.Mapping2D, ('transform_string', 'transform_blob', 'src_bounding_box', 'dest_bounding_box'), 'id'))
+        self.cursor.executemany(sql, rows)
+
+    Data2DFields = ('name', 'relative_path', 'image', 'level', 'filter', 'coord_space', 'width', 'height')
+
+    def ExistingData2DPaths(self, relative_paths):
+        ''':return: The subset of relative_paths which already have a Data2D row'''
+        found = set()
+        for chunk in partitions.Chunks(relative_paths):
+            sql = "SELECT %s FROM %s WHERE %s IN (%s)" % (self.Column(models.Data2D, 'relative_path'),
+                                                          self.Table(models.Data2D),
+                                                          self.Column(models.Data2D, 'relative_path'),
+                                                          ", ".join(["%s"] * len(chunk)))
+            self.cursor.execute(sql, chunk)
+            found.update([row[0] for row in self.cursor.fetchall()])
+
+        return found
+
+    def InsertData2D(self, rows):
+        ''':param list rows: Tuples in the order of ImportStatements.Data2DFields'''
+        if len(rows) == 0:
+            return
+
+        sql = self._Statement('insert_data2d', lambda: self._InsertSQL(models.Data2D, ImportStatements.Data2DFields))
+        self.cursor.executemany(sql, rows)
+
+    def UpdateData2D(self, rows):
+        ''':param list rows: (image, level, filter_id, coord_space_name, width, height, relative_path) tuples'''
+        if len(rows) == 0:
+            return
+
+        sql = self._Statement('update_data2d', lambda: self._UpdateSQL(models.Data2D, ('image', 'level', 'filter', 'coord_space', 'width', 'height'), 'relative_path'))
+        self.cursor.executemany(sql, rows)
+
+
+def BackfillCoordSpaceIdentity(dataset):
+    '''Fill the kind, section_number, channel and tile_number columns of coordinate spaces
+       imported before those columns existed by parsing their names.
+       Adds the columns first if the database predates them.
+       Names that parse but are not tiles keep a null kind, their section_number marks them done.
+       :param dataset: Dataset model or dataset name
+       :return: Number of coordinate spaces updated
+    '''
+    dataset_name = partitions.DatasetName(dataset)
+    alias = partitions.DatabaseForDataset(dataset_name)
+    schema.UpgradeSchema(using=alias)
+
+    channel_names = set(models.Channel.objects.using(alias).values_list('name', flat=True))
+    mosaic_names = set(models.Mapping2D.objects.using(alias).filter(dest_coordinate_space__dataset=dataset_name).values_list('dest_coordinate_space', flat=True).distinct())
+
+    rows = []
+    for (name,) in keyset.StreamValues(models.CoordSpace.objects.using(alias).filter(dataset=dataset_name, kind__isnull=True, section_number__isnull=True), ('name',)):
+        parsed = models.CoordSpace.ParseSectionChannelName(name)
+        if parsed is not None:
+            (section_number, channel_name, transform_name, tile_number) = parsed
+            kind = models.CoordSpace.TILE if tile_number is not None else None
+            channel_id = channel_name if channel_name in channel_names else None
+            rows.append((kind, section_number, channel_id, tile_number, name))
+        elif name in mosaic_names:
+            rows.append((models.CoordSpace.MOSAIC, None, None, None, name))
+
+    with transaction.atomic(using=alias), ImportStatements(using=alias) as statements:
+        sql = statements._UpdateSQL(models.CoordSpace, ('kind', 'section_number', 'channel', 'tile_number'), 'name')
+        statements.cursor.executemany(sql, rows)
+
+        if len(rows) > 0:
+            # Mosaic spaces are shared by sections, so backfilling one changes the whole dataset
+            section_list = [row[1] for row in rows]
+            if None in section_list:
+                section_list = None
+
+            generations.BumpGeneration(dataset_name, section_list, using=alias)
+
+    print("Backfilled identity columns of %d coordinate spaces in %s" % (len(rows), dataset_name))
+    return len(rows)
+
+
+def PurgeSection(dataset, section_number):
+    '''Delete the tile data, tile coordinate spaces, mappings, transform blobs only they used, composed transforms, tile adjacencies, tile grids, bounding boxes and import checkpoints of one section,
+       recompute its section extents and advance the dataset generation
+       with set-based DELETE statements, in dependency order, inside one transaction.
+       Avoids Django's cascade collector, which loads every related row before deleting.
+       :param dataset: Dataset model or dataset name
+       :param int section_number: Section to remove.  Coordinate spaces are found by their section_number column,
+                                 run BackfillCoordSpaceIdentity first on databases imported before that column existed.
+       :return: Dictionary of model name to number of rows deleted
+    '''
+    dataset_name = partitions.DatasetName(dataset)
+    alias = partitions.DatabaseForDataset(dataset_name)
+    deleted = {}
+
+    with transaction.atomic(using=alias), ImportStatements(using=alias) as statements:
+        s = statements
+        section_spaces_sql = "SELECT %s FROM %s WHERE %s = %%s AND %s = %%s" % (s.Column(models.CoordSpace, 'name'),
+                                                                                s.Table(models.CoordSpace),
+                                                                                s.Column(models.CoordSpace, 'dataset'),
+                                                                                s.Column(models.CoordSpace, 'section_number'))
+        section_spaces_params = [dataset_name, section_number]
+        summarized_spaces = section_extents.SummarizedCoordSpaces(dataset_name, section_number, using=alias)
+
+        sql = "DELETE FROM %s WHERE %s IN (%s)" % (s.Table(models.Data2D), s.Column(models.Data2D, 'coord_space'), section_spaces_sql)
+        s.cursor.execute(sql, section_spaces_params)
+        deleted['Data2D'] = s.cursor.rowcount
+
+        section_mappings_sql = "FROM %s WHERE %s IN (%s) OR %s IN (%s)" % (s.Table(models.Mapping2D),
+                                                                          s.Column(models.Mapping2D, 'src_coordinate_space'), section_spaces_sql,
+                                                                          s.Column(models.Mapping2D, 'dest_coordinate_space'), section_spaces_sql)
+        s.cursor.execute("SELECT DISTINCT %s %s" % (s.Column(models.Mapping2D, 'transform_blob'), section_mappings_sql), section_spaces_params + section_spaces_params)
+        blob_hashes = [row[0] for row in s.cursor.fetchall() if row[0] is not None]
+
+        s.cursor.execute("DELETE " + section_mappings_sql, section_spaces_params + section_spaces_params)
+        deleted['Mapping2D'] = s.cursor.rowcount
+
+        deleted['TransformBlob'] = transform_blobs.DeleteUnreferencedTransforms(using=alias, hash_list=blob_hashes)
+
+        sql = "DELETE FROM %s WHERE %s = %%s AND %s = %%s" % (s.Table(models.ComposedTransform),
+                                                              s.Column(models.ComposedTransform, 'dataset'),
+                                                              s.Column(models.ComposedTransform, 'section_number'))
+        s.cursor.execute(sql, section_spaces_params)
+        deleted['ComposedTransform'] = s.cursor.rowcount
+
+        sql = "DELETE FROM %s WHERE %s = %%s AND %s = %%s" % (s.Table(models.TileAdjacency),
+                                                              s.Column(models.TileAdjacency, 'dataset'),
+                                                              s.Column(models.TileAdjacency, 'section_number'))
+        s.cursor.execute(sql, section_spaces_params)
+        deleted['TileAdjacency'] = s.cursor.rowcount
+
+        for model in (models.TileGridCell, models.TileGrid):
+            sql = "DELETE FROM %s WHERE %s = %%s AND %s = %%s" % (s.Table(model),
+                                                                  s.Column(model, 'dataset'),
+                                                                  s.Column(model, 'section_number'))
+            s.cursor.execute(sql, section_spaces_params)
+            deleted[model.__name__] = s.cursor.rowcount
+
+        sql = "DELETE FROM %s WHERE %s = %%s AND %s = %%s" % (s.Table(models.CoordSpace),
+                                                              s.Column(models.CoordSpace, 'dataset'),
+                                                              s.Column(models.CoordSpace, 'section_number'))
+        s.cursor.execute(sql, section_spaces_params)
+        deleted['CoordSpace'] = s.cursor.rowcount
+
+        deleted['BoundingBox'] = _DeleteUnreferencedBoundingBoxes(s, section_number)
+
+        for coord_space_name in summarized_spaces:
+            section_extents.UpdateSectionExtent(dataset_name, coord_space_name, section_number, using=alias)
+
+        sql = "DELETE FROM %s WHERE %s = %%s AND %s = %%s" % (s.Table(models.ImportCheckpoint),
+                                                              s.Column(models.ImportCheckpoint, 'dataset'),
+                                                              s.Column(models.ImportCheckpoint, 'section_number'))
+        s.cursor.execute(sql, [dataset_name, section_number])
+        deleted['ImportCheckpoint'] = s.cursor.rowcount
+
+        generations.BumpGeneration(dataset_name, [section_number], using=alias)
+
+    print("Purged section %d of %s: %s" % (section_number, dataset_name, ", ".join(["%d %s" % (deleted[name], name) for name in sorted(deleted.keys())])))
+    return deleted
+
+
+# Every (model, field) holding a foreign key to BoundingBox
+BoundingBoxReferences = ((models.CoordSpace, 'bounds'),
+                         (models.Mapping2D, 'src_bounding_box'),
+                         (models.Mapping2D, 'dest_bounding_box'))
+
+
+def _DeleteUnreferencedBoundingBoxes(statements, Z):
+    '''Delete bounding boxes lying in section Z which no row references any longer.
+       This also collects boxes orphaned by earlier re-imports of the section.
+       :return: Number of rows deleted'''
+    s = statements
+    bbox_id = "%s.%s" % (s.Table(models.BoundingBox), s.Column(models.BoundingBox, 'id'))
+
+    not_referenced = []
+    for (model, field_name) in BoundingBoxReferences:
+        not_referenced.append("NOT EXISTS (SELECT 1 FROM %s WHERE %s = %s)" % (s.Table(model), s.Column(model, field_name), bbox_id))
+
+    sql = "DELETE FROM %s WHERE %s = %%s AND %s = %%s AND %s" % (s.Table(models.BoundingBox),
+                                                                 s.Column(models.BoundingBox, 'minZ'),
+                                                                 s.Column(models.BoundingBox, 'maxZ'),
+                                                                 " AND ".join(not_referenced))
+    s.cursor.execute(sql, [Z, Z])
+    return s.cursor.rowcount
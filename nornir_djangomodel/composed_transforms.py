@@ -0,0 +1,228 @@
+'''
+Created on Oct 19, 2026
+
+Precomputed tile to target space transforms.
+
+Placing a tile in a volume means chaining its tile to mosaic Mapping2D with
+every mapping onward from the mosaic.  MaterializeComposedTransforms walks
+those chains once and stores the result in ComposedTransform, one row per
+(tile space, target space) pair:
+
+    points   the tile's control points carried through every mapping of the chain,
+             (fixedY, fixedX, mappedY, mappedX) float64 rows compressed with zlib
+    bounds   the extent of the composed points in the target space
+
+The read path is a single lookup, see ComposedTransformFor and BuildTransform.
+
+Each row records the section generation it was composed at, see generations.
+Later runs only recompose sections whose generation has moved since.  Mappings
+shared by every section, such as mosaic to volume mappings, do not belong to a
+section, so pass force=True after changing them.
+
+Tile spaces are found by their kind and section_number columns, run
+bulk_sql.BackfillCoordSpaceIdentity first on databases imported before those
+columns existed.
+'''
+
+import zlib
+
+import numpy
+from django.db import transaction
+from django.db.models import Min
+
+from . import generations
+from . import models
+from . import partitions
+from . import transform_blobs
+from . import transform_bounds
+
+# Points sampled along each axis of a tile whose transform has no control points we can read directly
+SamplesPerAxis = 8
+
+
+def EncodePoints(points):
+    ''':param points: Nx4 array of point pairs
+       :return: Compressed bytes for ComposedTransform.points'''
+    return zlib.compress(numpy.ascontiguousarray(points, dtype='<f8').tobytes())
+
+
+def DecodePoints(blob):
+    ''':return: Nx4 array of (fixedY, fixedX, mappedY, mappedX) point pairs'''
+    return numpy.frombuffer(zlib.decompress(bytes(blob)), dtype='<f8').reshape((-1, 4))
+
+
+def _LoadTransform(transform_string):
+    import nornir_imageregistration.transforms.factory
+    return nornir_imageregistration.transforms.factory.LoadTransform(transform_string)
+
+
+def TilePoints(transform_string):
+    '''Point pairs of a tile to mosaic transform.  Grid transforms are read directly,
+       other transforms are sampled over the tile's mapped bounds.
+    :return: Nx4 array of (fixedY, fixedX, mappedY, mappedX) point pairs'''
+    points = transform_bounds.ParseGridTransformPoints(transform_string)
+    if points is not None:
+        return points
+
+    transform = _LoadTransform(transform_string)
+    (minY, minX, maxY, maxX) = list(transform.MappedBoundingBox)
+    (gridY, gridX) = numpy.meshgrid(numpy.linspace(minY, maxY, SamplesPerAxis), numpy.linspace(minX, maxX, SamplesPerAxis), indexing='ij')
+    mapped = numpy.column_stack((gridY.flat, gridX.flat))
+    fixed = numpy.asarray(transform.Transform(mapped), dtype=numpy.float64)
+    return numpy.column_stack((fixed, mapped))
+
+
+class _Onward():
+    '''Mappings leaving non-tile spaces, with their transforms loaded on first use'''
+
+    def __init__(self, dataset_name, using):
+        self._using = using
+        self._mappings = {}
+        self._transforms = {}
+        rows = models.Mapping2D.objects.using(using).filter(src_coordinate_space__dataset=dataset_name).exclude(src_coordinate_space__kind=models.CoordSpace.TILE)
+        for (src_name, dest_name, transform_string, blob_hash) in rows.values_list('src_coordinate_space', 'dest_coordinate_space', 'transform_string', 'transform_blob'):
+            self._mappings.setdefault(src_name, []).append((dest_name, transform_string, blob_hash))
+
+    def Destinations(self, space_name):
+        return [mapping[0] for mapping in self._mappings.get(space_name, [])]
+
+    def Apply(self, src_name, dest_name, fixed_points):
+        ''':return: Points of the src space mapped into the dest space'''
+        key = (src_name, dest_name)
+        transform = self._transforms.get(key, None)
+        if transform is None:
+            (transform_string, blob_hash) = [(t, h) for (d, t, h) in self._mappings[src_name] if d == dest_name][0]
+            if blob_hash is not None:
+                transform_string = transform_blobs.LoadTransform(blob_hash, using=self._using)
+
+            transform = _LoadTransform(transform_string)
+            self._transforms[key] = transform
+
+        return numpy.asarray(transform.Transform(fixed_points), dtype=numpy.float64)
+
+
+def _Compose(onward, space_name, points, num_mappings, target_names, visited):
+    '''Carry points from a space along every chain of onward mappings
+    :return: Generator of (target space name, points, number of mappings composed)'''
+    is_target = space_name in target_names if target_names is not None else len(onward.Destinations(space_name)) == 0
+    if is_target:
+        yield (space_name, points, num_mappings)
+        if target_names is not None:
+            return
+
+    for dest_name in onward.Destinations(space_name):
+        if dest_name in visited:
+            continue
+
+        fixed = onward.Apply(space_name, dest_name, points[:, 0:2])
+        for result in _Compose(onward, dest_name, numpy.column_stack((fixed, points[:, 2:4])), num_mappings + 1, target_names, visited | set([dest_name])):
+            yield result
+
+
+def StaleSections(dataset, section_list=None, target_space_list=None, using=None):
+    ''':return: Sorted list of sections with tiles whose composed transforms are missing or older than the section's generation'''
+    dataset_name = partitions.DatasetName(dataset)
+    if using is None:
+        using = partitions.DatabaseForDataset(dataset_name)
+
+    tile_spaces = models.CoordSpace.objects.using(using).filter(dataset=dataset_name, kind=models.CoordSpace.TILE)
+    composed = models.ComposedTransform.objects.using(using).filter(dataset=dataset_name)
+    if section_list is not None:
+        section_list = [int(section_number) for section_number in section_list]
+        tile_spaces = tile_spaces.filter(section_number__in=section_list)
+        composed = composed.filter(section_number__in=section_list)
+
+    if target_space_list is not None:
+        composed = composed.filter(target_space__in=[partitions.CoordSpaceName(space) for space in target_space_list])
+
+    sections = set(tile_spaces.values_list('section_number', flat=True).distinct())
+    section_generations = generations.SectionGenerations(dataset_name, sections)
+    composed_generations = dict(composed.values('section_number').annotate(oldest=Min('generation')).values_list('section_number', 'oldest'))
+
+    return sorted([section_number for section_number in sections
+                   if section_number not in composed_generations or composed_generations[section_number] < section_generations.get(section_number, 0)])
+
+
+def MaterializeComposedTransforms(dataset, section_list=None, target_space_list=None, force=False):
+    '''Compose and store the transform from every tile space of the sections to each target space.
+    :param dataset: Dataset model or name
+    :param section_list: Sections to compose, defaults to every section with tiles
+    :param target_space_list: CoordSpace models or names to compose into, defaults to the spaces at the ends of the mapping chains
+    :param bool force: Recompose every section, not only those whose generation has moved
+    :return: Number of transforms written'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+
+    target_names = None
+    if target_space_list is not None:
+        target_names = set([partitions.CoordSpaceName(space) for space in target_space_list])
+
+    if force:
+        tile_spaces = models.CoordSpace.objects.using(using).filter(dataset=dataset_name, kind=models.CoordSpace.TILE)
+        if section_list is not None:
+            tile_spaces = tile_spaces.filter(section_number__in=[int(section_number) for section_number in section_list])
+        sections = sorted(set(tile_spaces.values_list('section_number', flat=True).distinct()))
+    else:
+        sections = StaleSections(dataset_name, section_list, target_space_list, using=using)
+
+    if len(sections) == 0:
+        return 0
+
+    onward = _Onward(dataset_name, using)
+    section_generations = generations.SectionGenerations(dataset_name, sections)
+    num_written = 0
+
+    for section_number in sections:
+        generation = section_generations.get(section_number, 0)
+        tile_mappings = models.Mapping2D.objects.using(using).filter(src_coordinate_space__dataset=dataset_name,
+                                                                     src_coordinate_space__kind=models.CoordSpace.TILE,
+                                                                     src_coordinate_space__section_number=section_number)
+
+        tiles = list(tile_mappings.values_list('src_coordinate_space', 'dest_coordinate_space', 'transform_string', 'transform_blob'))
+        transform_strings = transform_blobs.ResolveTransforms([tile[2:4] for tile in tiles], using=using)
+
+        rows = []
+        for ((tile_name, dest_name, stored_string, blob_hash), transform_string) in zip(tiles, transform_strings):
+            for (target_name, points, num_mappings) in _Compose(onward, dest_name, TilePoints(transform_string), 1, target_names, set([dest_name])):
+                mins = points[:, 0:2].min(0)
+                maxs = points[:, 0:2].max(0)
+                rows.append(models.ComposedTransform(dataset_id=dataset_name,
+                                                     tile_space_id=tile_name,
+                                                     target_space_id=target_name,
+                                                     section_number=section_number,
+                                                     generation=generation,
+                                                     num_mappings=num_mappings,
+                                                     num_points=len(points),
+                                                     points=EncodePoints(points),
+                                                     minX=float(mins[1]), minY=float(mins[0]),
+                                                     maxX=float(maxs[1]), maxY=float(maxs[0])))
+
+        with transaction.atomic(using=using):
+            existing = models.ComposedTransform.objects.using(using).filter(dataset=dataset_name, section_number=section_number)
+            if target_names is not None:
+                existing = existing.filter(target_space__in=target_names)
+            existing.delete()
+            models.ComposedTransform.objects.using(using).bulk_create(rows)
+
+        num_written += len(rows)
+
+    print("Composed %d transforms for %d sections of %s" % (num_written, len(sections), dataset_name))
+    return num_written
+
+
+def ComposedTransformFor(dataset, tile_space, target_space):
+    ''':return: ComposedTransform from the tile space to the target space, None if it has not been composed'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+    rows = list(models.ComposedTransform.objects.using(using).filter(tile_space=partitions.CoordSpaceName(tile_space), target_space=partitions.CoordSpaceName(target_space))[:1])
+    if len(rows) == 0:
+        return None
+
+    return rows[0]
+
+
+def BuildTransform(composed):
+    ''':param ComposedTransform composed: Row from ComposedTransformFor
+       :return: nornir_imageregistration mesh transform from tile pixels to the target space'''
+    import nornir_imageregistration.transforms.meshwithrbffallback
+    return nornir_imageregistration.transforms.meshwithrbffallback.MeshWithRBFFallback(DecodePoints(composed.points))
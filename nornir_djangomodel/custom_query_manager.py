@@ -11,6 +11,9 @@ Used because Django admin was crazy slow
 
 from django.db import models, connections 
 from django.db.models.query import QuerySet
+from . import keyset
+from . import partitions
+from . import read_rows
 
 class FastCountQuerySet(QuerySet):
     '''
@@ -21,7 +24,7 @@ class FastCountQuerySet(QuerySet):
         Override entire table count queries only. Any WHERE or other altering
         statements will default back to an actual COUNT query.
         '''
-        if self._result_cache is not None and not self._iter:
+        if self._result_cache is not None:
             return len(self._result_cache)
 
         is_mysql = 'mysql' in connections[self.db].client.executable_name.lower()
@@ -47,4 +50,47 @@ class FastCountQuerySet(QuerySet):
 
 class NoCountManager(models.Manager):
         def get_query_set(self):
-            return FastCountQuerySet(self.model, using=self._db)
\ No newline at end of file
+            return FastCountQuerySet(self.model, using=self._db)
+
+
+class SectionQuerySet(FastCountQuerySet):
+    '''
+    QuerySet for tables whose rows belong to a single section.  The model
+    names the field holding the section Z in its SectionZField attribute.
+    '''
+    def ForDataset(self, dataset):
+        '''Route the query to the database holding the dataset'''
+        return self.using(partitions.DatabaseForDataset(dataset))
+
+    def ForSection(self, Z, dataset=None):
+        '''Rows of a single section, routed to the dataset's database if it is known'''
+        queryset = self
+        if dataset is not None:
+            queryset = queryset.ForDataset(dataset)
+
+        return queryset.filter(**{self.model.SectionZField: Z})
+
+    def Rows(self):
+        '''Iterate the results as read_rows row tuples instead of model instances'''
+        return read_rows.Rows(self)
+
+    def Stream(self, page_size=None):
+        '''Iterate the results as read_rows row tuples, fetched in primary key order one page per query.  See keyset.py'''
+        return keyset.StreamRows(self, page_size)
+
+
+class SectionManager(NoCountManager):
+        def get_queryset(self):
+            return SectionQuerySet(self.model, using=self._db)
+
+        def ForDataset(self, dataset):
+            return self.get_queryset().ForDataset(dataset)
+
+        def ForSection(self, Z, dataset=None):
+            return self.get_queryset().ForSection(Z, dataset)
+
+        def Rows(self):
+            return self.get_queryset().Rows()
+
+        def Stream(self, page_size=None):
+            return self.get_queryset().Stream(page_size)
@@ -0,0 +1,205 @@
+'''
+Created on Oct 19, 2026
+
+Compute the changes an import would make without writing to the database.
+
+The rows that already exist for the sections of an ImportPlan are read once
+in bulk.  The plan is then replayed in memory the same way
+VolumeXMLImporter would run it, classifying every Data2D, CoordSpace,
+Mapping2D and BoundingBox row as created, updated, unchanged or stale.
+'''
+
+import glob
+import os
+
+from . import import_xml
+from . import models
+from . import partitions
+from . import transform_blobs
+
+CREATE = 'create'
+UPDATE = 'update'
+UNCHANGED = 'unchanged'
+STALE = 'stale'
+
+Actions = (CREATE, UPDATE, UNCHANGED, STALE)
+ModelNames = ('Data2D', 'CoordSpace', 'Mapping2D', 'BoundingBox')
+
+
+class ImportChangeset():
+    '''Counts, and optionally the keys, of the rows an import would touch'''
+
+    @property
+    def counts(self):
+        ''':return: Dictionary of model name to dictionary of action to row count'''
+        return self._counts
+
+    def __init__(self, detailed=False):
+        self._counts = dict([(model_name, dict([(action, 0) for action in Actions])) for model_name in ModelNames])
+        self._details = [] if detailed else None
+
+    def Add(self, model_name, action, key=None, count=1):
+        self._counts[model_name][action] += count
+        if self._details is not None and key is not None:
+            self._details.append((action, model_name, key))
+
+    def Summary(self):
+        ''':return: One line per model listing the count of each action'''
+        lines = []
+        for model_name in ModelNames:
+            model_counts = self._counts[model_name]
+            lines.append("%-12s %s" % (model_name, "  ".join(["%s: %d" % (action, model_counts[action]) for action in Actions])))
+
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.Summary()
+
+    def WriteDiff(self, path):
+        '''Write one line per row that would change, prefixed with +, ~ or -.  Requires detailed=True.'''
+        if self._details is None:
+            raise ValueError("Changeset was not created with detailed=True")
+
+        prefix = {CREATE: '+', UPDATE: '~', STALE: '-'}
+        with open(path, 'w') as diff_file:
+            for (action, model_name, key) in self._details:
+                if action in prefix:
+                    diff_file.write("%s %s %s\n" % (prefix[action], model_name, key))
+
+
+class _SectionSnapshot():
+    '''Keys of the rows already in the database for one section'''
+
+    def __init__(self, dataset_name, section_number):
+        using = partitions.DatabaseForDataset(dataset_name)
+
+        self.coord_spaces = set(models.CoordSpace.objects.using(using).filter(dataset=dataset_name,
+                                                                             section_number=section_number).values_list('name', flat=True))
+
+        self.data = {}
+        for row in models.Data2D.objects.using(using).filter(coord_space__dataset=dataset_name,
+                                                           coord_space__section_number=section_number).values_list('relative_path', 'image', 'level', 'filter__name', 'coord_space', 'width', 'height'):
+            self.data[row[0]] = row[1:]
+
+        # Transforms are compared by hash so the text of blobs is never read
+        self.mappings = {}
+        for row in models.Mapping2D.objects.using(using).filter(src_coordinate_space__dataset=dataset_name,
+                                                              src_coordinate_space__section_number=section_number).values_list('src_coordinate_space', 'dest_coordinate_space', 'transform_string', 'transform_blob'):
+            self.mappings[(row[0], row[1])] = row[3] if row[3] is not None else transform_blobs.TransformHash(row[2])
+
+
+def _LevelChanges(changeset, snapshot, task, planned_data, planned_spaces):
+    level = task.level
+    image_paths = glob.glob(os.path.join(level.FullPath, '*' + task.filter.TilePyramid.ImageFormatExt))
+    if len(image_paths) == 0:
+        return
+
+    # The importer reads the size of the first image only and creates one bounding box per level
+    (height, width) = import_xml._GetImageSize(image_paths[0])
+    changeset.Add('BoundingBox', CREATE)
+
+    for image_path in image_paths:
+        img_name = os.path.basename(image_path)
+        (img_number, ext) = os.path.splitext(img_name)
+        coord_space_name = models.CoordSpace.SectionChannelName(task.section, task.channel.Name, 'Tile%d' % int(img_number))
+        img_rel_path = os.path.join(level.RelativePath, img_name)
+
+        if img_rel_path in planned_data:
+            continue
+
+        planned_data.add(img_rel_path)
+        planned_spaces.add(coord_space_name)
+
+        existing = snapshot.data.get(img_rel_path, None)
+        if existing is None:
+            changeset.Add('Data2D', CREATE, img_rel_path)
+        elif existing == (os.path.abspath(image_path), level.Number, task.filter.Name, coord_space_name, width, height):
+            changeset.Add('Data2D', UNCHANGED, img_rel_path)
+        else:
+            changeset.Add('Data2D', UPDATE, img_rel_path)
+
+
+def _MosaicSpaces(dataset_name):
+    ''':return: Names of the coordinate spaces of a dataset shared by sections, such as mosaic spaces'''
+    using = partitions.DatabaseForDataset(dataset_name)
+    return set(models.CoordSpace.objects.using(using).filter(dataset=dataset_name, section_number__isnull=True).values_list('name', flat=True))
+
+
+def _MosaicChanges(changeset, snapshot, task, planned_mappings, planned_spaces):
+    ''':return: True if the importer would write the mosaic'''
+    mosaic_batch = import_xml.ParseMosaicFile(task.transform.FullPath, task.section)
+    if mosaic_batch is None:
+        return False
+
+    # Mosaic bounds, shared source tile bounds, and one destination box per tile
+    changeset.Add('BoundingBox', CREATE, count=2 + len(mosaic_batch.Tiles))
+
+    num_existing = 0
+    for (tile_number, transform_string, mapped_bounds, fixed_bounds) in mosaic_batch.Tiles:
+        coord_space_name = models.CoordSpace.SectionChannelName(task.section, task.channel.Name, 'Tile%d' % tile_number)
+        planned_spaces.add(coord_space_name)
+
+        key = (coord_space_name, task.transform.Name)
+        planned_mappings.add(key)
+
+        existing = snapshot.mappings.get(key, None)
+        if existing is None:
+            changeset.Add('Mapping2D', CREATE, "%s -> %s" % key)
+        else:
+            # Updated mappings always receive new bounding boxes, leaving the old destination box behind
+            num_existing += 1
+            changeset.Add('BoundingBox', STALE)
+            changeset.Add('Mapping2D', UNCHANGED if existing == transform_blobs.TransformHash(transform_string) else UPDATE, "%s -> %s" % key)
+
+    if num_existing > 0:
+        # The source tile bounds shared by the old mappings
+        changeset.Add('BoundingBox', STALE)
+
+    return True
+
+
+def ComputeChangeset(plan, dataset_name, detailed=False):
+    '''Compute the changes importing the plan into the dataset would make.  Does not write to the database.
+    :param ImportPlan plan: Work to evaluate
+    :param str dataset_name: Dataset the plan would be imported into
+    :param bool detailed: Record the key of every changed row so WriteDiff can be used
+    :return: ImportChangeset'''
+
+    changeset = ImportChangeset(detailed)
+
+    # Mosaic spaces are named by transform alone and shared by every section, so they are counted once per import
+    mosaic_spaces = _MosaicSpaces(dataset_name)
+    planned_mosaic_spaces = set()
+
+    for section_number in plan.Sections:
+        section_plan = plan.ForSections([section_number])
+        snapshot = _SectionSnapshot(dataset_name, section_number)
+
+        planned_data = set()
+        planned_spaces = set()
+        planned_mappings = set()
+
+        for task in section_plan.TileLevelTasks:
+            _LevelChanges(changeset, snapshot, task, planned_data, planned_spaces)
+
+        for task in section_plan.MosaicTasks:
+            if not _MosaicChanges(changeset, snapshot, task, planned_mappings, planned_spaces):
+                continue
+
+            if task.transform.Name not in planned_mosaic_spaces:
+                planned_mosaic_spaces.add(task.transform.Name)
+                changeset.Add('CoordSpace', UNCHANGED if task.transform.Name in mosaic_spaces else CREATE, task.transform.Name)
+
+        for coord_space_name in sorted(planned_spaces):
+            changeset.Add('CoordSpace', UNCHANGED if coord_space_name in snapshot.coord_spaces else CREATE, coord_space_name)
+
+        for coord_space_name in sorted(snapshot.coord_spaces - planned_spaces):
+            changeset.Add('CoordSpace', STALE, coord_space_name)
+
+        for img_rel_path in sorted(set(snapshot.data.keys()) - planned_data):
+            changeset.Add('Data2D', STALE, img_rel_path)
+
+        for key in sorted(set(snapshot.mappings.keys()) - planned_mappings):
+            changeset.Add('Mapping2D', STALE, "%s -> %s" % key)
+
+    return changeset
@@ -0,0 +1,162 @@
+'''
+Created on Oct 19, 2026
+
+Change notification for caches built on top of the model.
+
+Every write to a dataset increments Dataset.generation in the same
+transaction as the write, and records the new generation against each
+section it touched in SectionGeneration.  A cache stores the generation it
+was filled at and stays valid until the generation moves:
+
+    generation = generations.CurrentGeneration('RC1')
+    ...
+    changed = generations.ChangedSections('RC1', since=cached_generation)
+
+Changes are also pushed, once the writing transaction commits, through the
+dataset_changed Django signal and to every local Subscription.  A
+Subscription is an in-process queue standing in for an external message bus.
+'''
+
+import queue
+import threading
+
+import django.dispatch
+from django.db import transaction
+from django.db.models import F
+
+from . import models
+from . import partitions
+
+# Sent with dataset (name), generation (int) and sections (list of section numbers, None if the whole dataset changed)
+dataset_changed = django.dispatch.Signal(providing_args=['dataset', 'generation', 'sections'])
+
+_subscriptions = []
+_subscriptions_lock = threading.Lock()
+
+
+class Subscription():
+    '''Receives (dataset, generation, sections) tuples for every change committed in this process'''
+
+    def __init__(self, dataset=None):
+        ''':param dataset: Only receive changes to this dataset, None for every dataset'''
+        self.dataset_name = partitions.DatasetName(dataset)
+        self._queue = queue.Queue()
+
+    def __enter__(self):
+        Subscribe(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Unsubscribe(self)
+
+    def _Put(self, event):
+        if self.dataset_name is None or self.dataset_name == event[0]:
+            self._queue.put(event)
+
+    def Get(self, timeout=None):
+        ''':return: The next (dataset, generation, sections) tuple, None if timeout seconds pass without one'''
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def Drain(self):
+        ''':return: Every queued event without waiting'''
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+
+def Subscribe(subscription):
+    with _subscriptions_lock:
+        _subscriptions.append(subscription)
+
+
+def Unsubscribe(subscription):
+    with _subscriptions_lock:
+        if subscription in _subscriptions:
+            _subscriptions.remove(subscription)
+
+
+def _Publish(dataset_name, generation, sections):
+    dataset_changed.send(sender=models.Dataset, dataset=dataset_name, generation=generation, sections=sections)
+
+    with _subscriptions_lock:
+        subscriptions = list(_subscriptions)
+
+    for subscription in subscriptions:
+        subscription._Put((dataset_name, generation, sections))
+
+
+def _PublishOnCommit(using, dataset_name, generation, sections):
+    on_commit = getattr(transaction, 'on_commit', None)
+    if on_commit is None:
+        # Django versions without on_commit publish immediately.  A rolled back write then
+        # causes an unnecessary invalidation, never a missed one.
+        _Publish(dataset_name, generation, sections)
+    else:
+        on_commit(lambda: _Publish(dataset_name, generation, sections), using=using)
+
+
+def BumpGeneration(dataset, section_list=None, using=None):
+    '''Increment the dataset generation and stamp the sections written with it.  Call inside the writing transaction.
+    :param dataset: Dataset model or name
+    :param section_list: Sections that changed, None if the whole dataset changed
+    :return: The new generation'''
+    dataset_name = partitions.DatasetName(dataset)
+    if using is None:
+        using = partitions.DatabaseForDataset(dataset_name)
+
+    with transaction.atomic(using=using):
+        models.Dataset.objects.using(using).filter(name=dataset_name).update(generation=F('generation') + 1)
+        generation = models.Dataset.objects.using(using).filter(name=dataset_name).values_list('generation', flat=True)[0]
+
+        sections = None
+        if section_list is not None:
+            sections = sorted(set([int(section_number) for section_number in section_list]))
+            for section_number in sections:
+                rows = models.SectionGeneration.objects.using(using).filter(dataset=dataset_name, section_number=section_number)
+                if rows.update(generation=generation) == 0:
+                    models.SectionGeneration.objects.using(using).create(dataset_id=dataset_name, section_number=section_number, generation=generation)
+
+    _PublishOnCommit(using, dataset_name, generation, sections)
+    return generation
+
+
+def AnnounceDataset(dataset):
+    '''Publish the current generation of a dataset whose database was replaced as a whole, such as by a staged import'''
+    dataset_name = partitions.DatasetName(dataset)
+    _Publish(dataset_name, CurrentGeneration(dataset_name), None)
+
+
+def CurrentGeneration(dataset):
+    ''':return: Generation of the dataset, 0 if it has never been written'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+    result = list(models.Dataset.objects.using(using).filter(name=dataset_name).values_list('generation', flat=True))
+    if len(result) == 0:
+        return 0
+
+    return result[0]
+
+
+def SectionGenerations(dataset, section_list=None):
+    ''':return: Dictionary of section number to the generation of its last write'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+    rows = models.SectionGeneration.objects.using(using).filter(dataset=dataset_name)
+    if section_list is not None:
+        rows = rows.filter(section_number__in=list(section_list))
+
+    return dict(rows.values_list('section_number', 'generation'))
+
+
+def ChangedSections(dataset, since):
+    ''':return: Sorted list of sections written after generation since'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+    rows = models.SectionGeneration.objects.using(using).filter(dataset=dataset_name, generation__gt=since)
+    return sorted(rows.values_list('section_number', flat=True))
@@ -0,0 +1,157 @@
+'''
+Created on Oct 19, 2026
+
+The work an import performs, built once from the volume model.
+
+Every phase of VolumeXMLImporter walks the same list of tasks instead of
+walking the volume tree and testing section membership again.  A plan can be
+inspected and sized before the database is touched, and split into shards
+that each own whole sections.
+'''
+
+import collections
+import os
+
+ImportTask = collections.namedtuple('ImportTask', ['kind', 'section', 'channel', 'filter', 'level', 'transform'])
+'''One unit of import work.
+   :param str kind: One of ImportPlan.FILTER, ImportPlan.TILE_LEVEL or ImportPlan.MOSAIC
+   :param int section: Section number
+   :param channel: Channel from the volume model
+   :param filter: Filter from the volume model, None for mosaic tasks
+   :param level: Tile pyramid level, only set for tile level tasks
+   :param transform: Mosaic transform, only set for mosaic tasks
+'''
+
+
+def TaskKey(task):
+    '''A string identifying the task within its dataset, stable between runs
+    :param ImportTask task: Task to identify'''
+    if task.kind == ImportPlan.TILE_LEVEL:
+        return '%04d.%s.%s.%d' % (task.section, task.channel.Name, task.filter.Name, task.level.Number)
+    elif task.kind == ImportPlan.MOSAIC:
+        return '%04d.%s.mosaic.%s' % (task.section, task.channel.Name, task.transform.Name)
+
+    return '%04d.%s.%s' % (task.section, task.channel.Name, task.filter.Name)
+
+
+class ImportPlan():
+    '''Ordered list of ImportTasks for a volume'''
+
+    FILTER = 'filter'
+    TILE_LEVEL = 'level'
+    MOSAIC = 'mosaic'
+
+    @property
+    def tasks(self):
+        return self._tasks
+
+    @property
+    def Sections(self):
+        ''':return: Sorted list of section numbers in the plan'''
+        return sorted(set([task.section for task in self._tasks]))
+
+    @property
+    def FilterTasks(self):
+        return self.Tasks(ImportPlan.FILTER)
+
+    @property
+    def TileLevelTasks(self):
+        return self.Tasks(ImportPlan.TILE_LEVEL)
+
+    @property
+    def MosaicTasks(self):
+        return self.Tasks(ImportPlan.MOSAIC)
+
+    def __init__(self, tasks):
+        self._tasks = list(tasks)
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __iter__(self):
+        return iter(self._tasks)
+
+    def __str__(self):
+        summary = self.Summary()
+        return "%d sections, %d filters, %d tile levels, %d mosaics" % (summary['sections'],
+                                                                        summary[ImportPlan.FILTER],
+                                                                        summary[ImportPlan.TILE_LEVEL],
+                                                                        summary[ImportPlan.MOSAIC])
+
+    def Tasks(self, kind=None):
+        if kind is None:
+            return list(self._tasks)
+
+        return [task for task in self._tasks if task.kind == kind]
+
+    def Summary(self):
+        ''':return: Dictionary with the number of sections and the number of tasks of each kind'''
+        counts = collections.Counter([task.kind for task in self._tasks])
+        return {'sections': len(self.Sections),
+                ImportPlan.FILTER: counts[ImportPlan.FILTER],
+                ImportPlan.TILE_LEVEL: counts[ImportPlan.TILE_LEVEL],
+                ImportPlan.MOSAIC: counts[ImportPlan.MOSAIC]}
+
+    def ForSections(self, section_list):
+        ''':return: A plan containing only tasks for the listed sections'''
+        section_set = frozenset(section_list)
+        return ImportPlan([task for task in self._tasks if task.section in section_set])
+
+    def Exclude(self, task_keys):
+        ''':return: A plan without the tasks whose TaskKey is in task_keys'''
+        return ImportPlan([task for task in self._tasks if TaskKey(task) not in task_keys])
+
+    def Shard(self, num_shards):
+        '''Split the plan into plans which each contain whole sections
+        :return: List of at most num_shards non-empty plans'''
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least one")
+
+        shard_of_section = {}
+        for (iSection, section_number) in enumerate(self.Sections):
+            shard_of_section[section_number] = iSection % num_shards
+
+        shard_tasks = [[] for i in range(num_shards)]
+        for task in self._tasks:
+            shard_tasks[shard_of_section[task.section]].append(task)
+
+        return [ImportPlan(tasks) for tasks in shard_tasks if len(tasks) > 0]
+
+    @classmethod
+    def Build(cls, volume_model, section_list=None):
+        '''Walk the volume once and list the work for the requested sections
+        :param section_list: Section numbers to import, None for every section
+        '''
+        if section_list is not None:
+            section_list = frozenset(section_list)
+
+        tasks = []
+        for block in volume_model.Blocks:
+            for section in block.Sections:
+                if section_list is not None and section.Number not in section_list:
+                    continue
+
+                for channel in section.Channels:
+                    tasks.extend(cls._ChannelTasks(section.Number, channel))
+
+        return ImportPlan(tasks)
+
+    @classmethod
+    def _ChannelTasks(cls, section_number, channel):
+        tasks = []
+        for filter_obj in channel.Filters.values():
+            tasks.append(ImportTask(ImportPlan.FILTER, section_number, channel, filter_obj, None, None))
+
+            tile_pyramid = filter_obj.TilePyramid
+            if tile_pyramid is None:
+                continue
+
+            for level in tile_pyramid.Levels:
+                tasks.append(ImportTask(ImportPlan.TILE_LEVEL, section_number, channel, filter_obj, level, None))
+
+        for transform_obj in channel.Transforms.values():
+            (base, ext) = os.path.splitext(transform_obj.Path)
+            if ext == '.mosaic':
+                tasks.append(ImportTask(ImportPlan.MOSAIC, section_number, channel, None, None, transform_obj))
+
+        return tasks
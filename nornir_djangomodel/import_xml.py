@@ -4,19 +4,65 @@ Created on Jun 11, 2014
 @author: u0490822
 '''
 import os
-import copy
-import nornir_volumemodel
-import nornir_imageregistration
-import nornir_imageregistration.files
-import nornir_imageregistration.transforms
-from nornir_imageregistration.spatial import *
+import collections
+import concurrent.futures
 import glob
+from django.db import transaction
 from . import models
+from . import bulk_load
+from . import bulk_sql
+from . import generations
+from . import import_plan
+from . import partitions
+from . import profiling
+from . import section_extents
+from . import tile_adjacency
+from . import tile_grid
+from . import transform_blobs
+from . import transform_bounds
+from . import volume_xml_stream
 import pickle
 
 import nornir_djangomodel.settings as settings
 
 
+# nornir_volumemodel and nornir_imageregistration pull in the SciPy image stack.  They are
+# imported where they are used so reading the models never pays for them.
+
+class iRect:
+    '''Indices into a (minY, minX, maxY, maxX) rectangle, the layout of nornir_imageregistration.spatial.iRect'''
+    MinY = 0
+    MinX = 1
+    MaxY = 2
+    MaxX = 3
+
+
+class iBox:
+    '''Indices into a (minZ, minY, minX, maxZ, maxY, maxX) box, the layout of nornir_imageregistration.spatial.iBox'''
+    MinZ = 0
+    MinY = 1
+    MinX = 2
+    MaxZ = 3
+    MaxY = 4
+    MaxX = 5
+
+
+def _LoadVolumeXml(path):
+    import nornir_volumemodel
+    return nornir_volumemodel.Load_Xml(path)
+
+
+def _GetImageSize(image_path):
+    ''':return: (height, width) of an image'''
+    import nornir_imageregistration
+    return nornir_imageregistration.GetImageSize(image_path)
+
+
+def _IsRectangle(bounds):
+    import nornir_imageregistration.spatial
+    return isinstance(bounds, nornir_imageregistration.spatial.Rectangle)
+
+
 class QuickPickleHelper():
     cachepath = os.curdir
 
@@ -159,7 +205,7 @@ def ConvertToDBBounds(bounds, ZLevel=None):
     if not bounds is None:
         if isinstance(bounds, models.BoundingBox):
             db_bounds = bounds
-        elif isinstance(bounds, Rectangle):
+        elif _IsRectangle(bounds):
             if ZLevel is None:
                 raise ValueError("ZLevel must be specified if a rectangle is passed")
             db_bounds = CreateBoundingRect(bounds.ToArray(), ZLevel)
@@ -177,17 +223,18 @@ def ConvertToDBBounds(bounds, ZLevel=None):
     return db_bounds
 
 
-def GetOrCreateCoordSpace(db_dataset, coord_space_name, bounds, ForceSaveOnCreate=False):
+def GetOrCreateCoordSpace(db_dataset, coord_space_name, bounds, ForceSaveOnCreate=False, defaults=None):
     '''
     :param Channel channel: The nornir channel which our space originates from
     :param name name: The name of the space, usually derived from the transform
     :param Rectangle bounds: Bounding box for coord space 
+    :param dict defaults: Field values for a newly created space, such as kind, section_number and tile_number
     :return: section#.channel.name
     '''
 
     db_bounds = ConvertToDBBounds(bounds) 
 
-    (db_coordspace, created) = models.CoordSpace.objects.get_or_create(name=coord_space_name, dataset=db_dataset)
+    (db_coordspace, created) = models.CoordSpace.objects.get_or_create(name=coord_space_name, dataset=db_dataset, defaults=defaults)
 
     need_save = created
     if not db_bounds is None:
@@ -205,23 +252,55 @@ def GetOrCreateCoordSpace(db_dataset, coord_space_name, bounds, ForceSaveOnCreat
     return (db_coordspace, created)
 
 
-def _iterate_volume_channels(volumexml_model):
-    '''Yield a tuple of (filter, parent_dict) for each channel in the volume'''
-    for block in volumexml_model.Blocks:
-        for section in block.Sections:
-            for channel in section.Channels:
-                yield (channel, {'volume': volumexml_model,
-                       'block': block,
-                       'section': section,
-                       'channel': channel})
+class _NoBulkLoad():
+    '''Stands in for bulk_load.BulkLoad when an import maintains indexes as it goes'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
 
+class MosaicBatch():
+    '''The contents of a .mosaic file reduced to what the importer writes.  Contains only
+       plain values so it can be returned from a parser process.'''
 
-def _iterate_volume_filters(volumexml_model):
-    '''Yield a tuple of (filter, parent_dict) for each filter in the volume'''
-    for (channel, parent_dict) in _iterate_volume_channels(volumexml_model):
-        for filter_obj in channel.Filters.values():
-            parent_dict['filter'] = filter_obj
-            yield (filter_obj, parent_dict)
+    def __init__(self, ZLevel, FixedBoundingBox, Tiles):
+        '''
+        :param float ZLevel: Section number of the mosaic
+        :param FixedBoundingBox: (minY minX MaxY maxX) of the whole mosaic
+        :param list Tiles: (tile_number, transform_string, mapped_bounds, fixed_bounds) tuples
+        '''
+        self.ZLevel = ZLevel
+        self.FixedBoundingBox = FixedBoundingBox
+        self.Tiles = Tiles
+
+
+def ParseMosaicFile(mosaic_fullpath, ZLevel):
+    '''Load a .mosaic file and compute the bounding boxes of each tile without touching the database
+    :return: MosaicBatch, or None if the file could not be loaded'''
+
+    import nornir_imageregistration.files
+    mosaicfile = nornir_imageregistration.files.MosaicFile.Load(mosaic_fullpath)
+    if mosaicfile is None:
+        return None
+
+    # Reads control points straight from the transform strings instead of building a Mosaic
+    (tile_bounds, mosaic_bounds) = transform_bounds.MosaicBounds(mosaicfile.ImageToTransformString)
+    if mosaic_bounds is None:
+        return None
+
+    tiles = []
+    for (name, transform_string) in mosaicfile.ImageToTransformString.items():
+        (tile_number, ext) = os.path.splitext(name)
+        (mapped_bounds, fixed_bounds) = tile_bounds[name]
+        tiles.append((int(tile_number),
+                      transform_string,
+                      mapped_bounds,
+                      fixed_bounds))
+
+    return MosaicBatch(ZLevel, mosaic_bounds, tiles)
 
 
 class VolumeXMLImporter():
@@ -244,101 +323,254 @@ class VolumeXMLImporter():
 
         return self._db_dataset
 
-    def __init__(self, volumexml_model):
+    @property
+    def db_alias(self):
+        '''The database holding the rows of the dataset'''
+        return partitions.DatabaseForDataset(self.dataset_name)
+
+    @property
+    def statements(self):
+        '''Fixed-shape SQL statements shared by every phase of the import'''
+        if self._statements is None:
+            self._statements = bulk_sql.ImportStatements(using=self.db_alias)
+
+        return self._statements
+
+    def __init__(self, volumexml_model, dataset_name=None):
+        if dataset_name is None:
+            dataset_name = volumexml_model.Name
+
         self._volumexml_model = volumexml_model
-        self._dataset_name = volumexml_model.Name
+        self._dataset_name = dataset_name
         self._db_dataset = None
+        self._statements = None
+
+        # Tile coordinate spaces are requested once per tile for every filter and level, cache them by name
+        self._coord_space_cache = {}
+        self._filter_cache = {}
+
+    def close(self):
+        if self._statements is not None:
+            self._statements.close()
+            self._statements = None
 
     @classmethod
     def _LoadVolumeFromCacheIfPossible(cls, vol_model):
         assert(isinstance(vol_model, str))
         import_dirname = os.path.dirname(vol_model)
         QuickPickleHelper.cachepath = import_dirname
-        vol_model = QuickPickleHelper.ReadOrCreateVariable(varname='vol_model', createfunc=nornir_volumemodel.Load_Xml, VolumePath=vol_model)
+        vol_model = QuickPickleHelper.ReadOrCreateVariable(varname='vol_model', createfunc=_LoadVolumeXml, VolumePath=vol_model)
         return vol_model
 
     @classmethod
-    def Import(cls, vol_model, dataset_name=None, section_list=None):
+    def _LoadVolume(cls, path_str, section_list=None):
+        if section_list is not None and settings.NORNIR_DJANGOMODEL_STREAMVOLUMEXML:
+            # Only read the requested sections instead of building the whole volume
+            vol_model = volume_xml_stream.LoadVolumeSections(path_str, section_list)
+            if len(vol_model.Blocks) > 0:
+                return vol_model
+
+        if settings.NORNIR_DJANGOMODEL_USEVOLUMEXMLCACHE:
+            vol_model = VolumeXMLImporter._LoadVolumeFromCacheIfPossible(path_str)
+        else:
+            vol_model = _LoadVolumeXml(path_str)
+
+        vol_model.Path = os.path.dirname(path_str)
+        return vol_model
+
+    @classmethod
+    def Import(cls, vol_model, dataset_name=None, section_list=None, num_parse_workers=None, plan=None, resume=False,
+               dry_run=False, diff_path=None, profile=None, bulk=False, staged=False):
         '''Given a nornir volume model populate the django model.
-        :return volume volume: Volume model'''
+        :param int num_parse_workers: Number of processes parsing mosaic files while the database is written, defaults to the number of CPUs
+        :param ImportPlan plan: Import only the tasks of this plan, such as a shard of a larger plan, instead of section_list
+        :param bool resume: Skip tasks checkpointed by an earlier, interrupted import.  Otherwise the checkpoints of the imported sections are cleared first.
+        :param bool dry_run: Compute the changes the import would make without writing to the database
+        :param str diff_path: With dry_run, write every row that would change to this file
+        :param profile: Output directory for a deterministic profile of every phase, or a profiling.ImportProfiler
+                        selecting the mode and phases.  Reports are written when the import ends.
+        :param bool bulk: Load inside bulk_load.BulkLoad, deferring secondary index maintenance until the end.  Intended for first-time imports of large volumes.
+        :param bool staged: Import into a copy of the dataset's database and publish it atomically when the import succeeds, see staging.py
+        :return volume volume: Volume model, or an ImportChangeset if dry_run is set'''
+
+        if plan is not None:
+            section_list = plan.Sections
 
         if isinstance(vol_model, str):
-            path_str = vol_model
-            
-            if settings.NORNIR_DJANGOMODEL_USEVOLUMEXMLCACHE:
-                vol_model = VolumeXMLImporter._LoadVolumeFromCacheIfPossible(vol_model)
-            else:
-                vol_model = nornir_volumemodel.Load_Xml(vol_model)
-                
-            vol_model.Path = os.path.dirname(path_str)
-
-        importer_obj = VolumeXMLImporter(vol_model)
+            vol_model = cls._LoadVolume(vol_model, section_list)
 
         if dataset_name is None:
             dataset_name = vol_model.Name
 
-        GetOrCreateDataset(dataset_name, Path=vol_model.Path)
+        if staged and not dry_run:
+            from . import staging
+            return staging.StagedImport(vol_model, dataset_name=dataset_name, section_list=section_list, num_parse_workers=num_parse_workers,
+                                        plan=plan, resume=resume, profile=profile, bulk=bulk)
+
+        importer_obj = VolumeXMLImporter(vol_model, dataset_name)
+
+        if dry_run:
+            return importer_obj.DryRun(section_list, plan, diff_path)
+
+        profiler = profiling.ImportProfiler.FromArgument(profile, using=importer_obj.db_alias)
+
+        with partitions.UsingDataset(dataset_name):
+            try:
+                with profiler.Phase('plan'):
+                    GetOrCreateDataset(dataset_name, Path=vol_model.Path)
+
+                    if plan is None:
+                        plan = importer_obj.Plan(section_list)
+
+                    if resume:
+                        plan = plan.Exclude(importer_obj.CompletedTaskKeys())
+                    else:
+                        importer_obj.ClearCheckpoints(plan.Sections)
 
-        importer_obj.AddChannelsAndFilters()
-        importer_obj.AddTiles(section_list)
-        importer_obj.AddChannelDetails(section_list)
+                print("Import plan: %s" % str(plan))
+
+                with (bulk_load.BulkLoad(using=importer_obj.db_alias) if bulk else _NoBulkLoad()):
+                    with profiler.Phase('channels', importer_obj.statements):
+                        importer_obj.AddChannelsAndFilters(plan)
+
+                    with profiler.Phase('tiles', importer_obj.statements):
+                        importer_obj.AddTiles(plan=plan)
+
+                    with profiler.Phase('mosaics', importer_obj.statements):
+                        importer_obj.AddChannelDetails(num_parse_workers=num_parse_workers, plan=plan)
+            finally:
+                importer_obj.close()
+                profiler.WriteReport()
 
         return dataset_name
 
-    def AddChannelsAndFilters(self):
-        db_dataset = self.db_dataset
+    @classmethod
+    def ReplaceSection(cls, vol_model, section_number, dataset_name=None):
+        '''Remove every row imported for a section and import it again in a single transaction.
+           Readers see either the old section or the new one, never a mix.
+        :return: Dictionary of model name to number of rows deleted before the import'''
+
+        if dataset_name is None:
+            if isinstance(vol_model, str):
+                vol_model = cls._LoadVolume(vol_model, [section_number])
+
+            dataset_name = vol_model.Name
+
+        with transaction.atomic(using=partitions.DatabaseForDataset(dataset_name)):
+            deleted = bulk_sql.PurgeSection(dataset_name, section_number)
+            cls.Import(vol_model, dataset_name=dataset_name, section_list=[section_number])
+
+        return deleted
+
+    def CompletedTaskKeys(self):
+        ''':return: Set of import_plan.TaskKey values with a checkpoint in the dataset'''
+        return set(models.ImportCheckpoint.objects.filter(dataset=self.db_dataset).values_list('task_key', flat=True))
+
+    def ClearCheckpoints(self, section_list):
+        '''Forget completed tasks of the listed sections so they are imported again'''
+        models.ImportCheckpoint.objects.filter(dataset=self.db_dataset, section_number__in=list(section_list)).delete()
+
+    def CompleteTask(self, task):
+        '''Record that a task finished.  Call inside the transaction that wrote the task's rows.'''
+        models.ImportCheckpoint.objects.get_or_create(dataset=self.db_dataset,
+                                                      task_key=import_plan.TaskKey(task),
+                                                      section_number=task.section)
+        generations.BumpGeneration(self.db_dataset, [task.section], using=self.db_alias)
 
-        for (filter_obj, parent_dict) in _iterate_volume_filters(self.volumexml_model):
-            channel_obj = parent_dict['channel']
-            (db_channel, created) = models.Channel.objects.get_or_create(name=channel_obj.Name, dataset=db_dataset)
+    def DryRun(self, section_list=None, plan=None, diff_path=None):
+        '''Compute the changes importing the sections would make without writing to the database
+        :param str diff_path: Write every row that would change to this file
+        :return: ImportChangeset'''
+        from . import dry_run
+
+        if plan is None:
+            plan = self.Plan(section_list)
+
+        print("Import plan: %s" % str(plan))
+
+        changeset = dry_run.ComputeChangeset(plan, self.dataset_name, detailed=diff_path is not None)
+        print(changeset.Summary())
+
+        if diff_path is not None:
+            changeset.WriteDiff(diff_path)
+
+        return changeset
+
+    def Plan(self, section_list=None):
+        ''':return: ImportPlan listing the work needed to import the requested sections'''
+        return import_plan.ImportPlan.Build(self.volumexml_model, section_list)
+
+    def GetOrCreateChannelAndFilter(self, channel_obj, filter_name):
+        ''':return: (db_channel, db_filter) tuple, cached for the lifetime of the importer'''
+        key = (channel_obj.Name, filter_name)
+        db_objects = self._filter_cache.get(key, None)
+        if db_objects is None:
+            (db_channel, created) = models.Channel.objects.get_or_create(name=channel_obj.Name, dataset=self.db_dataset)
             if created:
                 db_channel.save()
 
-            (db_filter, created) = models.Filter.objects.get_or_create(name=filter_obj.Name, channel=db_channel)
+            (db_filter, created) = models.Filter.objects.get_or_create(name=filter_name, channel=db_channel)
             if created:
                 db_filter.save()
 
+            db_objects = (db_channel, db_filter)
+            self._filter_cache[key] = db_objects
+
+        return db_objects
+
+    def AddChannelsAndFilters(self, plan=None):
+        if plan is None:
+            plan = self.Plan()
+
+        for task in plan.FilterTasks:
+            self.GetOrCreateChannelAndFilter(task.channel, task.filter.Name)
+
         return
 
-    def AddTiles(self, section_list=None):
-        for (filter_obj, parent_dict) in _iterate_volume_filters(self.volumexml_model):
-            channel_obj = parent_dict['channel']
-            ZLevel = parent_dict['section'].Number
-            if section_list is None or ZLevel in section_list:
-                self.AddTilePyramid(channel_obj, filter_obj.Name, ZLevel, filter_obj.TilePyramid)
-
-    def AddChannelDetails(self, section_list=None):
-        for (channel_obj, parent_dict) in _iterate_volume_channels(self.volumexml_model):
-            ZLevel = parent_dict['section'].Number
-            if section_list is None or ZLevel in section_list:    
-                for transform_obj in channel_obj.Transforms.values():
-                    (base, ext) = os.path.splitext(transform_obj.Path)
-                    if ext == '.mosaic': 
-                        self.AddChannelMosaic(channel_obj, transform_obj, ZLevel)
-            
-        #Transforms sometimes live in different sections than the filters they create, such as Registered_* filters.  Run this as a second loop to 
-        #ensure all the coord_space rows have been created 
-        #=======================================================================
-        # for (channel_obj, parent_dict) in _iterate_volume_channels(self.volumexml_model):
-        #     ZLevel = parent_dict['section'].Number
-        #     if section_list is None or ZLevel in section_list:           
-        #         for filter_obj in channel_obj.Filters.values():
-        #             if filter_obj.ImageSet is None:
-        #                 continue 
-        #             
-        #             self.AddOrUpdateFilterImageSet(channel_obj, filter_obj, filter_obj.ImageSet, ZLevel) 
-        #=======================================================================
-               
-         
+    def AddTiles(self, section_list=None, plan=None):
+        if plan is None:
+            plan = self.Plan(section_list)
+
+        for task in plan.TileLevelTasks:
+            self.AddTileLevel(task)
+
+    def AddChannelDetails(self, section_list=None, num_parse_workers=None, plan=None):
+        if plan is None:
+            plan = self.Plan(section_list)
+
+        mosaic_tasks = [(task.channel, task.transform, task.section) for task in plan.MosaicTasks]
+        self.AddChannelMosaics(mosaic_tasks, num_workers=num_parse_workers)
+
     def GetOrCreateTileCoordSpace(self, channel, name, bounds, scale=None):
 
         section = channel.Parent
         coord_space_name = models.CoordSpace.SectionChannelName(section.Number, channel.Name, name)
         needsave = False 
+        created = False
         
-        (db_coordspace, created) = GetOrCreateCoordSpace(self.db_dataset, coord_space_name, bounds)
-
-        if db_coordspace.xscale is None or db_coordspace.xscale.value != channel.Scale.X.UnitsPerPixel or db_coordspace.yscale.value != channel.Scale.Y.UnitsPerPixel:
+        db_coordspace = self._coord_space_cache.get(coord_space_name, None)
+        if db_coordspace is None:
+            (section_number, channel_name, transform_name, tile_number) = models.CoordSpace.ParseSectionChannelName(coord_space_name)
+            identity = {'kind': models.CoordSpace.TILE,
+                        'section_number': section_number,
+                        'channel_id': channel_name,
+                        'tile_number': tile_number}
+
+            (db_coordspace, created) = GetOrCreateCoordSpace(self.db_dataset, coord_space_name, bounds, defaults=identity)
+            self._coord_space_cache[coord_space_name] = db_coordspace
+
+            # Spaces imported before the identity columns existed
+            if db_coordspace.section_number is None:
+                for (field_name, value) in identity.items():
+                    setattr(db_coordspace, field_name, value)
+
+                needsave = True
+
+        # Compare the stored columns directly rather than building Scale objects for every tile
+        if db_coordspace.scale_value_X != channel.Scale.X.UnitsPerPixel or \
+           db_coordspace.scale_value_Y != channel.Scale.Y.UnitsPerPixel or \
+           db_coordspace.scale_units_X != channel.Scale.X.UnitsOfMeasure or \
+           db_coordspace.scale_units_Y != channel.Scale.Y.UnitsOfMeasure:
             db_coordspace.xscale = models.Scale(value=channel.Scale.X.UnitsPerPixel, units=channel.Scale.X.UnitsOfMeasure)
             db_coordspace.yscale = models.Scale(value=channel.Scale.Y.UnitsPerPixel, units=channel.Scale.Y.UnitsOfMeasure)
             db_coordspace.zscale = None
@@ -363,6 +595,20 @@ class VolumeXMLImporter():
         # This doesn't update the ids of the DB bounds, so they can't be used for other purposes
         models.BoundingBox.objects.bulk_create(dbBounds_list)
         return ImageToBounds
+
+    def InsertBoundingRect(self, rect_bounds, minZ, maxZ=None):
+        '''Equivalent to CreateBoundingRect, but inserts through the prepared statement instead of the ORM
+        :param rect bounds: (minY minX MaxY maxX)
+        '''
+        if maxZ is None:
+            maxZ = minZ
+
+        return self.statements.InsertBoundingBox(minX=rect_bounds[iRect.MinX],
+                                                 minY=rect_bounds[iRect.MinY],
+                                                 minZ=minZ,
+                                                 maxX=rect_bounds[iRect.MaxX],
+                                                 maxY=rect_bounds[iRect.MaxY],
+                                                 maxZ=maxZ)
     
     
     def AddOrUpdateFilterImageSet(self, channel_obj, filter_obj, imageset_obj, ZLevel):
@@ -380,7 +626,7 @@ class VolumeXMLImporter():
         
         for (level_number, image) in imageset_obj.GetImages():
             img_name = os.path.basename(image.fullpath) 
-            (height, width) = nornir_imageregistration.GetImageSize(image.fullpath)
+            (height, width) = _GetImageSize(image.fullpath)
             db_data = models.Data2D(name=img_name,
                                      image=os.path.abspath(image.fullpath),
                                      filter=db_filter,
@@ -393,107 +639,163 @@ class VolumeXMLImporter():
         
     def AddChannelMosaic(self, channel, transform_obj, ZLevel):
         '''Add all of the tiles associated with the transforms in a mosaic file'''
-        
+
+        mosaic_batch = ParseMosaicFile(transform_obj.FullPath, ZLevel)
+        self.WriteMosaicBatch(channel, transform_obj, mosaic_batch)
+
+    def AddChannelMosaics(self, mosaic_tasks, num_workers=None, max_pending=None):
+        '''Add the tiles of many mosaic files.  Worker processes parse the mosaic files and compute
+           bounding boxes while this process writes the finished batches to the database in order.
+        :param list mosaic_tasks: (channel, transform_obj, ZLevel) tuples
+        :param int num_workers: Number of parser processes, defaults to the number of CPUs.  Zero or one parses in this process
+        :param int max_pending: Maximum number of parsed batches held in memory, defaults to twice the number of workers
+        '''
+        if num_workers is None:
+            num_workers = os.cpu_count()
+
+        if num_workers is None or num_workers <= 1 or len(mosaic_tasks) <= 1:
+            for (channel, transform_obj, ZLevel) in mosaic_tasks:
+                self.AddChannelMosaic(channel, transform_obj, ZLevel)
+            return
+
+        if max_pending is None:
+            max_pending = num_workers * 2
+
+        pending = collections.deque()
+        task_iter = iter(mosaic_tasks)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+
+            def SubmitNext():
+                task = next(task_iter, None)
+                if task is None:
+                    return False
+
+                (channel, transform_obj, ZLevel) = task
+                future = executor.submit(ParseMosaicFile, transform_obj.FullPath, ZLevel)
+                pending.append((channel, transform_obj, future))
+                return True
+
+            while len(pending) < max_pending and SubmitNext():
+                pass
+
+            # Write in submission order so the result matches a serial import
+            while len(pending) > 0:
+                (channel, transform_obj, future) = pending.popleft()
+                mosaic_batch = future.result()
+                SubmitNext()
+                self.WriteMosaicBatch(channel, transform_obj, mosaic_batch)
+
+    def WriteMosaicBatch(self, channel, transform_obj, mosaic_batch):
+        '''Write the mappings of a parsed mosaic file to the database
+        :param MosaicBatch mosaic_batch: Output of ParseMosaicFile, nothing is written if None'''
+
+        if mosaic_batch is None:
+            return
+
+        ZLevel = mosaic_batch.ZLevel
+
         (db_channel, created) = models.Channel.objects.get_or_create(name=channel.Name)
         if created:
             db_channel.save()
 
-        mosaicfile = nornir_imageregistration.files.MosaicFile.Load(transform_obj.FullPath)
-        if mosaicfile is None:
-            return
+        with transaction.atomic(using=self.db_alias):
+            db_bounds = CreateBoundingRect(mosaic_batch.FixedBoundingBox, minZ=ZLevel)
+            db_mosaic_coordspace = GetOrCreateCoordSpace(self.db_dataset, transform_obj.Name, bounds=db_bounds, ForceSaveOnCreate=True,
+                                                         defaults={'kind': models.CoordSpace.MOSAIC})
 
-        mosaic = nornir_imageregistration.mosaic.Mosaic(copy.copy(mosaicfile.ImageToTransformString))
-        db_bounds = CreateBoundingRect(mosaic.FixedBoundingBox, minZ=ZLevel)
-        db_mosaic_coordspace = GetOrCreateCoordSpace(self.db_dataset, transform_obj.Name, bounds=db_bounds, ForceSaveOnCreate=True)
+            print("Importing mappings from %s into %s" % (transform_obj.FullPath, db_mosaic_coordspace.name))
 
-        db_mapping_list = []
+            # One query for the mappings already present instead of an exists() check per tile
+            existing_mapping_ids = self.statements.MappingIDsForDestination(db_mosaic_coordspace.name)
 
-        print("Importing mappings from %s into %s" % (transform_obj.FullPath, db_mosaic_coordspace.name))
+            new_mapping_rows = []
+            updated_mapping_rows = []
 
-        # Batch create destination bounding rectangles for each transform
+            db_src_tile_bounds = None
 
-        # ImageToDestinationBounds = VolumeXMLImporter.BatchCreateDestinationBoundingRects(mosaic.ImageToTransform, ZLevel)
+            # Transforms already stored, for example by an earlier import of this mosaic, are not written again
+            blob_hashes = {}
+            if settings.NORNIR_DJANGOMODEL_TRANSFORMBLOBS:
+                blob_hashes = transform_blobs.StoreTransforms([tile[1] for tile in mosaic_batch.Tiles], using=self.db_alias)
 
-        db_src_tile_bounds = None
+            for (tile_number, transform_string, mapped_bounds, fixed_bounds) in mosaic_batch.Tiles:
 
-        for (name, transform) in mosaic.ImageToTransform.items():
+                blob_hash = blob_hashes.get(transform_string, None)
+                if blob_hash is not None:
+                    transform_string = ''
 
-            (tile_number, ext) = os.path.splitext(name)
-            tile_number = int(tile_number)
+                if db_src_tile_bounds is None:
+                    db_src_tile_bounds = self.InsertBoundingRect(mapped_bounds, minZ=ZLevel)
 
-            if db_src_tile_bounds is None:
-                db_src_tile_bounds = CreateBoundingRect(transform.MappedBoundingBox, minZ=ZLevel)
+                (db_tile_coordspace, created_tile_coordspace) = self.GetOrCreateTileCoordSpace(channel, 'Tile%d' % tile_number, db_src_tile_bounds, ZLevel)
 
-            (db_tile_coordspace, created_tile_coordspace) = self.GetOrCreateTileCoordSpace(channel, 'Tile%d' % tile_number, db_src_tile_bounds, ZLevel)
+                db_dest_bounding_box = self.InsertBoundingRect(fixed_bounds, ZLevel)
+                assert(db_dest_bounding_box is not None)
 
-    #         (db_tile, created) = models.Tile.objects.get_or_create(number=int(tile_number),
-    #                                                                name=name,
-    #                                                                channel=db_channel,
-    #                                                                coord_space=db_tile_coordspace)
-    #         if created:
-    #             db_tile.save()
+                existing_mapping_id = existing_mapping_ids.get(db_tile_coordspace.name, None)
+                if existing_mapping_id is not None:
+                    updated_mapping_rows.append((transform_string,
+                                                 blob_hash,
+                                                 db_src_tile_bounds.id,
+                                                 db_dest_bounding_box.id,
+                                                 existing_mapping_id))
+                else:
+                    new_mapping_rows.append((transform_string,
+                                             blob_hash,
+                                             db_tile_coordspace.name,
+                                             db_src_tile_bounds.id,
+                                             db_mosaic_coordspace.name,
+                                             db_dest_bounding_box.id))
 
-            # transform_string = nornir_imageregistration.transforms.factory.TransformToIRToolsString(transform)
-            transform_string = mosaicfile.ImageToTransformString[name]
-            # db_dest_bounding_box = ImageToDestinationBounds[name]
-            db_dest_bounding_box = CreateBoundingRect(transform.FixedBoundingBox, ZLevel)
-            assert(db_dest_bounding_box is not None)
-            
-            existing_db_mapping = models.Mapping2D.objects.filter(src_coordinate_space=db_tile_coordspace,
-                                                                  dest_coordinate_space=db_mosaic_coordspace) 
-            if existing_db_mapping.exists():
-                db_mapping = existing_db_mapping.first()
-                db_mapping.transform_string = transform_string
-                db_mapping.src_bounding_box = db_src_tile_bounds
-                db_mapping.dest_bounding_box = db_dest_bounding_box
-                
-                db_mapping.save()
-
-            else:
-                db_mapping = models.Mapping2D(src_coordinate_space=db_tile_coordspace,
-                                                     src_bounding_box=db_src_tile_bounds,
-                                                     transform_string=transform_string,
-                                                     dest_coordinate_space=db_mosaic_coordspace,
-                                                     dest_bounding_box=db_dest_bounding_box)
-
-                db_mapping_list.append(db_mapping)
-            
-            db_mosaic_coordspace.UpdateBounds(db_dest_bounding_box)
+                db_mosaic_coordspace.UpdateBounds(db_dest_bounding_box)
 
-        models.Mapping2D.objects.bulk_create(db_mapping_list)
-        
-        #Save the updated coordspace bounding box
-        db_mosaic_coordspace.bounds.save()
-        
-        
-    
+            self.statements.UpdateMappings(updated_mapping_rows)
+            self.statements.InsertMappings(new_mapping_rows)
+
+            # A section purged since StoreTransforms may have deleted blobs these mappings now reference
+            transform_blobs.EnsureTransforms(blob_hashes, using=self.db_alias)
+
+            # Save the updated coordspace bounding box
+            db_mosaic_coordspace.bounds.save()
+            section_extents.UpdateSectionExtent(self.db_dataset, db_mosaic_coordspace, ZLevel, using=self.db_alias)
+            tile_adjacency.UpdateTileAdjacency(self.db_dataset, db_mosaic_coordspace, ZLevel, using=self.db_alias)
+            tile_grid.BuildTileGrid(self.db_dataset, db_mosaic_coordspace, ZLevel, using=self.db_alias)
+
+            self.CompleteTask(import_plan.ImportTask(import_plan.ImportPlan.MOSAIC, ZLevel, channel, None, None, transform_obj))
 
     def AddTilePyramid(self, channel, filter_name, ZLevel, tile_pyramid):
 
         if tile_pyramid is None:
             return
 
-        (db_channel, created) = models.Channel.objects.get_or_create(name=channel.Name)
-        if created:
-            db_channel.save()
+        for level in tile_pyramid.Levels:
+            self.AddTileLevel(import_plan.ImportTask(import_plan.ImportPlan.TILE_LEVEL, ZLevel, channel, channel.Filters[filter_name], level, None))
 
-        (db_filter, created) = models.Filter.objects.get_or_create(name=filter_name, channel=db_channel)
-        if created:
-            db_filter.save()
+    def AddTileLevel(self, task):
+        '''Add the tiles of one pyramid level
+        :param ImportTask task: Tile level task from an ImportPlan'''
 
-        for level in tile_pyramid.Levels:
-            level_number = level.Number
+        channel = task.channel
+        filter_obj = task.filter
+        level = task.level
+        ZLevel = task.section
+
+        (db_channel, db_filter) = self.GetOrCreateChannelAndFilter(channel, filter_obj.Name)
 
-            print("Adding %d.%s.%s.%d" % (ZLevel, channel.Name, filter_name, level.Number))
+        print("Adding %d.%s.%s.%d" % (ZLevel, channel.Name, filter_obj.Name, level.Number))
 
+        with transaction.atomic(using=self.db_alias):
             self.BulkAddData2D(channel,
                           level.FullPath,
                           level.RelativePath,
-                          tile_pyramid.ImageFormatExt,
+                          filter_obj.TilePyramid.ImageFormatExt,
                           db_channel,
                           db_filter,
                           ZLevel,
-                          level_number)
+                          level.Number)
+
+            self.CompleteTask(task)
 
     def BulkAddData2D(self, channel, full_path, rel_path, extension, db_channel, db_filter, ZLevel, level_number):
         image_paths = glob.glob(os.path.join(full_path, '*' + extension))
@@ -501,59 +803,42 @@ class VolumeXMLImporter():
         if len(image_paths) == 0:
             return
 
-        (height, width) = nornir_imageregistration.GetImageSize(image_paths[0])
+        (height, width) = _GetImageSize(image_paths[0])
         db_bounds = CreateBoundingBox((ZLevel, 0, 0, ZLevel, height, width))
 
-        db_data_list = []
         img_rel_path_table = {}
+        pending_rows = []
 
-        for image_path in image_paths:
-            # if os.path.exists(image_path):
-            img_name = os.path.basename(image_path)
-            (img_number, ext) = os.path.splitext(img_name)
+        with transaction.atomic(using=self.db_alias):
+            for image_path in image_paths:
+                # if os.path.exists(image_path):
+                img_name = os.path.basename(image_path)
+                (img_number, ext) = os.path.splitext(img_name)
 
-            # (height, width) = nornir_imageregistration.GetImageSize(image_path)
-            # db_bounds = CreateBoundingRect(Rectangle.CreateFromPointAndArea((0, 0), (height, width)), minZ=ZLevel)
-            (db_tile_coordspace, created_tile_coordspace) = self.GetOrCreateTileCoordSpace(channel, 'Tile%d' % int(img_number), bounds=db_bounds)
+                (db_tile_coordspace, created_tile_coordspace) = self.GetOrCreateTileCoordSpace(channel, 'Tile%d' % int(img_number), bounds=db_bounds)
 
-            # db_tile_mapping = GetTileMapping(tile_number=img_number, Z=ZLevel, )
+                img_rel_path = os.path.join(rel_path, img_name)
 
-            img_rel_path = os.path.join(rel_path, img_name)
+                if img_rel_path in img_rel_path_table:
+                    print("Trying to create this tile twice: %s" % (img_rel_path))
+                    continue
 
-            if img_rel_path in img_rel_path_table:
-                print("Trying to create this tile twice: %s" % (img_rel_path))
-                continue
+                img_rel_path_table[img_rel_path] = True
+                pending_rows.append((img_name, img_rel_path, os.path.abspath(image_path), db_tile_coordspace.name))
 
-            img_rel_path_table[img_rel_path] = True
-            
-            existing_db_data = models.Data2D.objects.filter(relative_path=img_rel_path) 
-            if existing_db_data.exists():
-                #Update path
-                db_data = existing_db_data.first()
-                db_data.image = os.path.abspath(image_path)
-                db_data.filter = db_filter
-                db_data.level = level_number
-                db_data.coord_space = db_tile_coordspace
-                db_data.width = width
-                db_data.height = height
-                
-                db_data.save()
-                
-            else:
-                #Create new, bulk update path
-                db_data = models.Data2D(name=img_name,
-                             image=os.path.abspath(image_path),
-                             filter=db_filter,
-                             level=level_number,
-                             relative_path=img_rel_path,
-                             coord_space=db_tile_coordspace,
-                             width=width,
-                             height=height)
-
-                db_data_list.append(db_data)
-
-        if len(db_data_list) > 0:
-            models.Data2D.objects.bulk_create(db_data_list)
+            # One query for the whole level instead of an exists() check per tile
+            existing_paths = self.statements.ExistingData2DPaths(img_rel_path_table.keys())
+
+            new_data_rows = []
+            updated_data_rows = []
+            for (img_name, img_rel_path, image, coord_space_name) in pending_rows:
+                if img_rel_path in existing_paths:
+                    updated_data_rows.append((image, level_number, db_filter.id, coord_space_name, width, height, img_rel_path))
+                else:
+                    new_data_rows.append((img_name, img_rel_path, image, level_number, db_filter.id, coord_space_name, width, height))
+
+            self.statements.UpdateData2D(updated_data_rows)
+            self.statements.InsertData2D(new_data_rows)
 
 #        db_data.save()
 
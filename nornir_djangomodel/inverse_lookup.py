@@ -0,0 +1,187 @@
+'''
+Created on Oct 19, 2026
+
+Find the tiles under points or regions of a mosaic or volume space.
+
+Candidates are narrowed in the database by comparing the query's extent with
+the indexed columns of the destination bounding boxes, so only tiles near the
+query are read.  Each candidate's transform is then loaded once and inverted
+for every query point inside its bounds in a single call.
+
+    hits = inverse_lookup.SourcePoints('RC1', 'Grid', 691, [[y0, x0], [y1, x1]])
+    for hit in hits:
+        print(hit.tile_space, points[hit.indices], hit.source_points)
+
+Spaces the tiles map into directly are searched through Mapping2D.  Spaces
+further along the mapping chain are searched through ComposedTransform, so
+run composed_transforms.MaterializeComposedTransforms for them first.
+
+Points and rectangles are (Y, X) and (minY, minX, maxY, maxX), the same
+layout as nornir_imageregistration.
+'''
+
+import collections
+
+import numpy
+
+from . import composed_transforms
+from . import models
+from . import partitions
+from . import transform_blobs
+
+# Points sampled along each axis of the overlap of a query region and a tile
+SamplesPerAxis = 8
+
+# Distance in tile pixels a source point may fall outside the tile and still count as covered
+EdgeTolerance = 0.5
+
+
+class SourceHit(collections.namedtuple('SourceHit', ('tile_space', 'indices', 'source_points'))):
+    '''Query points covered by one tile.  indices are positions in the query's points array,
+       source_points the matching (Y, X) tile pixel coordinates'''
+    __slots__ = ()
+
+
+class SourceRegion(collections.namedtuple('SourceRegion', ('tile_space', 'rect', 'source_rect'))):
+    '''Part of a query region covered by one tile.  rect is the overlap in the queried space,
+       source_rect the matching (minY, minX, maxY, maxX) tile pixel rectangle'''
+    __slots__ = ()
+
+
+class _Candidate():
+    '''A tile that may cover part of a query, with its transform loaded on first use'''
+
+    def __init__(self, tile_space, dest_rect, src_rect, load_transform):
+        self.tile_space = tile_space
+        self.dest_rect = dest_rect
+        self.src_rect = src_rect
+        self._load_transform = load_transform
+        self._transform = None
+
+    @property
+    def transform(self):
+        if self._transform is None:
+            self._transform = self._load_transform()
+
+        return self._transform
+
+    def Contains(self, points):
+        ''':return: Boolean mask of the (Y, X) points inside the tile's destination bounds'''
+        (minY, minX, maxY, maxX) = self.dest_rect
+        return (points[:, 0] >= minY) & (points[:, 0] <= maxY) & (points[:, 1] >= minX) & (points[:, 1] <= maxX)
+
+    def InSource(self, source_points):
+        ''':return: Boolean mask of the (Y, X) tile points inside the tile's image'''
+        (minY, minX, maxY, maxX) = self.src_rect
+        return ((source_points[:, 0] >= minY - EdgeTolerance) & (source_points[:, 0] <= maxY + EdgeTolerance) &
+                (source_points[:, 1] >= minX - EdgeTolerance) & (source_points[:, 1] <= maxX + EdgeTolerance))
+
+
+def _LoadTransform(transform_string, blob_hash=None, using=None):
+    import nornir_imageregistration.transforms.factory
+    if blob_hash is not None:
+        transform_string = transform_blobs.LoadTransform(blob_hash, using=using)
+
+    return nornir_imageregistration.transforms.factory.LoadTransform(transform_string)
+
+
+def _MappingCandidates(using, coord_space_name, section_number, rect):
+    (minY, minX, maxY, maxX) = rect
+    rows = models.Mapping2D.objects.using(using).filter(dest_coordinate_space=coord_space_name,
+                                                        dest_bounding_box__minZ__lte=section_number,
+                                                        dest_bounding_box__maxZ__gte=section_number,
+                                                        dest_bounding_box__minY__lte=maxY,
+                                                        dest_bounding_box__maxY__gte=minY,
+                                                        dest_bounding_box__minX__lte=maxX,
+                                                        dest_bounding_box__maxX__gte=minX)
+    rows = rows.values_list('src_coordinate_space', 'transform_string', 'transform_blob',
+                            'dest_bounding_box__minY', 'dest_bounding_box__minX', 'dest_bounding_box__maxY', 'dest_bounding_box__maxX',
+                            'src_bounding_box__minY', 'src_bounding_box__minX', 'src_bounding_box__maxY', 'src_bounding_box__maxX')
+
+    return [_Candidate(row[0], row[3:7], row[7:11], lambda transform_string=row[1], blob_hash=row[2]: _LoadTransform(transform_string, blob_hash, using)) for row in rows]
+
+
+def _ComposedCandidates(using, dataset_name, coord_space_name, section_number, rect):
+    (minY, minX, maxY, maxX) = rect
+    rows = models.ComposedTransform.objects.using(using).filter(dataset=dataset_name,
+                                                                target_space=coord_space_name,
+                                                                section_number=section_number,
+                                                                minY__lte=maxY, maxY__gte=minY,
+                                                                minX__lte=maxX, maxX__gte=minX)
+
+    candidates = []
+    for composed in rows:
+        mapped = composed_transforms.DecodePoints(composed.points)[:, 2:4]
+        src_rect = tuple(mapped.min(0)) + tuple(mapped.max(0))
+        candidates.append(_Candidate(composed.tile_space_id, composed.as_tuple(), src_rect,
+                                     lambda composed=composed: composed_transforms.BuildTransform(composed)))
+
+    return candidates
+
+
+def _Candidates(dataset, coord_space, section_number, rect):
+    '''Tiles whose bounds in the space overlap a rectangle, read through the bounding box indexes
+    :return: List of candidates'''
+    dataset_name = partitions.DatasetName(dataset)
+    coord_space_name = partitions.CoordSpaceName(coord_space)
+    using = partitions.DatabaseForDataset(dataset_name)
+
+    candidates = _MappingCandidates(using, coord_space_name, int(section_number), rect)
+    if len(candidates) == 0:
+        candidates = _ComposedCandidates(using, dataset_name, coord_space_name, int(section_number), rect)
+
+    return candidates
+
+
+def SourcePoints(dataset, coord_space, section_number, points):
+    '''Map points of a space back to the tiles that cover them.  A point covered by overlapping tiles is reported once per tile.
+    :param dataset: Dataset model or name
+    :param coord_space: Mosaic or volume CoordSpace model or name
+    :param int section_number: Section to search
+    :param points: Nx2 array of (Y, X) points
+    :return: List of SourceHit, one per tile covering at least one point'''
+    points = numpy.asarray(points, dtype=numpy.float64).reshape((-1, 2))
+    if len(points) == 0:
+        return []
+
+    rect = tuple(points.min(0)) + tuple(points.max(0))
+    hits = []
+    for candidate in _Candidates(dataset, coord_space, section_number, rect):
+        indices = numpy.flatnonzero(candidate.Contains(points))
+        if len(indices) == 0:
+            continue
+
+        source_points = numpy.asarray(candidate.transform.InverseTransform(points[indices]), dtype=numpy.float64)
+        covered = candidate.InSource(source_points)
+        if not covered.any():
+            continue
+
+        hits.append(SourceHit(candidate.tile_space, indices[covered], source_points[covered]))
+
+    return hits
+
+
+def SourceRegions(dataset, coord_space, section_number, rect):
+    '''Map a rectangle of a space back to the tiles under it
+    :param rect: (minY, minX, maxY, maxX) in the space
+    :return: List of SourceRegion, one per tile overlapping the rectangle'''
+    (minY, minX, maxY, maxX) = rect
+    regions = []
+    for candidate in _Candidates(dataset, coord_space, section_number, rect):
+        (tile_minY, tile_minX, tile_maxY, tile_maxX) = candidate.dest_rect
+        overlap = (max(minY, tile_minY), max(minX, tile_minX), min(maxY, tile_maxY), min(maxX, tile_maxX))
+
+        (gridY, gridX) = numpy.meshgrid(numpy.linspace(overlap[0], overlap[2], SamplesPerAxis),
+                                        numpy.linspace(overlap[1], overlap[3], SamplesPerAxis), indexing='ij')
+        samples = numpy.column_stack((gridY.flat, gridX.flat))
+        source_points = numpy.asarray(candidate.transform.InverseTransform(samples), dtype=numpy.float64)
+        source_points = source_points[candidate.InSource(source_points)]
+        if len(source_points) == 0:
+            continue
+
+        (src_minY, src_minX, src_maxY, src_maxX) = candidate.src_rect
+        source_rect = (max(float(source_points[:, 0].min()), src_minY), max(float(source_points[:, 1].min()), src_minX),
+                       min(float(source_points[:, 0].max()), src_maxY), min(float(source_points[:, 1].max()), src_maxX))
+        regions.append(SourceRegion(candidate.tile_space, overlap, source_rect))
+
+    return regions
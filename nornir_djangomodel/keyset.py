@@ -0,0 +1,140 @@
+'''
+Created on Oct 19, 2026
+
+Streaming iteration over large tables, one page of rows per query.
+
+Iterating a Data2D or Mapping2D queryset with iterator() holds one cursor,
+and on some backends one transaction, open for the whole scan.  Paging with
+OFFSET avoids that but rescans every skipped row, so the scan slows down
+quadratically.  The functions here order by primary key and fetch each page
+with pk > last key of the previous page, which the primary key index answers
+directly however deep into the table the page is.
+
+    for row in keyset.StreamRows(models.Data2D.objects.filter(level=1)):
+        print(row.relative_path, row.width, row.height)
+
+    for batch in keyset.RecordBatches(models.BoundingBox.objects.ForSection(691), ('minX', 'minY', 'maxX', 'maxY')):
+        print(batch['maxX'].max())
+
+Each page is a separate query, so no transaction outlives a page unless the
+caller wraps the scan in one.  Rows inserted or deleted during a scan are seen
+if their key is past the current page.  The queryset must not repeat a primary
+key, which joins across a to-many relation can do; add distinct() if it might.
+'''
+
+from . import read_rows
+
+DefaultPageSize = 2000
+
+
+def _KeyName(queryset):
+    return queryset.model._meta.pk.name
+
+
+def _Paginate(queryset, page_size, read_page, key_of):
+    '''Read pages until one comes back short
+    :param read_page: Function returning the list of results of a page queryset
+    :param key_of: Function returning the primary key of a result'''
+    if page_size is None:
+        page_size = DefaultPageSize
+
+    if not queryset.query.can_filter():
+        raise ValueError("Cannot page a sliced queryset")
+
+    key_name = _KeyName(queryset)
+    queryset = queryset.order_by(key_name)
+    page = queryset
+    while True:
+        results = read_page(page[:page_size])
+        if len(results) > 0:
+            yield results
+
+        if len(results) < page_size:
+            return
+
+        page = queryset.filter(**{key_name + '__gt': key_of(results[-1])})
+
+
+def Pages(queryset, page_size=None):
+    ''':return: Generator of lists of model instances, at most page_size each, in primary key order'''
+    return _Paginate(queryset, page_size, list, lambda obj: obj.pk)
+
+
+def Stream(queryset, page_size=None):
+    ''':return: Generator of model instances in primary key order'''
+    for page in Pages(queryset, page_size):
+        for obj in page:
+            yield obj
+
+
+def RowPages(queryset, page_size=None):
+    ''':return: Generator of lists of read_rows rows, see read_rows.Rows'''
+    key_name = _KeyName(queryset)
+    return _Paginate(queryset, page_size, lambda page: list(read_rows.Rows(page)), lambda row: getattr(row, key_name))
+
+
+def StreamRows(queryset, page_size=None):
+    ''':return: Generator of read_rows rows in primary key order'''
+    for page in RowPages(queryset, page_size):
+        for row in page:
+            yield row
+
+
+def ValuePages(queryset, fields, page_size=None):
+    '''Pages of values_list tuples
+    :param fields: Field names passed to values_list
+    :return: Generator of lists of tuples'''
+    fields = tuple(fields)
+    columns = (_KeyName(queryset),) + fields
+    for page in _Paginate(queryset, page_size, lambda page: list(page.values_list(*columns)), lambda values: values[0]):
+        yield [values[1:] for values in page]
+
+
+def StreamValues(queryset, fields, page_size=None):
+    ''':return: Generator of values_list tuples in primary key order'''
+    for page in ValuePages(queryset, fields, page_size):
+        for values in page:
+            yield values
+
+
+def _FieldDtype(model, field_path):
+    '''numpy type for a values_list column.  Nullable integer columns become floats so NULL can be NaN.'''
+    from django.db import models as django_models
+
+    field = None
+    for name in field_path.split('__'):
+        if field is not None:
+            model = field.rel.to
+        field = model._meta.get_field(name)
+
+    if field.rel is not None:
+        field = field.rel.to._meta.pk
+
+    if isinstance(field, django_models.BooleanField):
+        return '?'
+    if isinstance(field, (django_models.IntegerField, django_models.AutoField)):
+        return '<f8' if field.null else '<i8'
+    if isinstance(field, (django_models.FloatField, django_models.DecimalField)):
+        return '<f8'
+
+    return 'O'
+
+
+def RecordDtype(model, fields):
+    ''':return: numpy dtype of the RecordBatches of the fields of a model'''
+    import numpy
+    return numpy.dtype([(field_path, _FieldDtype(model, field_path)) for field_path in fields])
+
+
+def RecordBatches(queryset, fields, page_size=None, dtype=None):
+    '''Pages of values as numpy structured arrays.  numpy is imported on first use.
+    :param fields: Field names passed to values_list, also the names of the array fields
+    :param dtype: numpy dtype of each record, defaults to RecordDtype
+    :return: Generator of numpy structured arrays'''
+    import numpy
+
+    if dtype is None:
+        dtype = RecordDtype(queryset.model, fields)
+
+    for page in ValuePages(queryset, fields, page_size):
+        yield numpy.array(page, dtype=dtype)
@@ -3,8 +3,11 @@ Created on Jun 10, 2014
 
 @author: u0490822
 '''
-from django.db import models
+import collections
+
+from django.db import models, router
 from . import  custom_query_manager
+from . import schema
 
 ######################################
 
@@ -21,6 +24,9 @@ class BoundingBox(models.Model):
     maxY = models.FloatField(db_index=True)
     maxZ = models.FloatField(db_index=True)
 
+    objects = custom_query_manager.SectionManager()
+    SectionZField = 'minZ'
+
     @property
     def ndims(self):
         ''':return: Number of dimensions.  A null value in minZ or maxZ determines if there are 2 or 3 dimensions to the boundary'''
@@ -53,8 +59,10 @@ class BoundingBox(models.Model):
                                                             self.maxY,
                                                             self.maxX)
 
-    # class Meta:
-    #    unique_together = (("minX", "minY", "minZ", "maxZ", "maxY", "maxX"),)
+    class Meta:
+        # Keeps the rows of one section together for ForSection queries
+        index_together = (("minZ", "maxZ"),)
+        # unique_together = (("minX", "minY", "minZ", "maxZ", "maxY", "maxX"),)
 
 class Dataset(models.Model):
     def get_query_set(self):
@@ -63,6 +71,7 @@ class Dataset(models.Model):
     '''A collection of data and coordinate spaces which are part of the same experiment or dataset.'''
     name = models.CharField("Name", max_length=64, primary_key=True)
     path = models.FilePathField("Dataset root", unique=True)
+    generation = models.BigIntegerField(default=0, help_text="Incremented by every write to the dataset, see generations.py")
 
     def __str__(self):
         return self.name
@@ -89,33 +98,93 @@ class Filter(models.Model):
 
 
 class Scale():
-    '''Not a django database model.  It is a helper object used for scales'''
+    '''Not a django database model.  It is a helper object used for scales.
+
+       Scales are immutable and interned, constructing a scale with the same value and units
+       returns the existing object.  The intern table holds strong references to the most
+       recently created InternTableSize scales, a dataset uses only a handful.'''
+
+    # Nanometers in one unit of each known unit of measure
+    NanometersPerUnit = {'nm': 1.0,
+                         'um': 1000.0}
+
+    __slots__ = ('_value', '_units')
+
+    InternTableSize = 1024
+
+    _interned = collections.OrderedDict()
 
     @property
     def value(self):
         return self._value
 
-    @value.setter
-    def value(self, val):
-        if not isinstance(val, float):
-            raise ValueError("Scale value must be float")
-
-        self._value = val
-
     @property
     def units(self):
         return self._units
 
-    @units.setter
-    def units(self, val):
-        if not isinstance(val, str):
+    @property
+    def nanometers(self):
+        ''':return: The scale value in nanometers'''
+        return self._value * Scale.UnitScale(self._units, 'nm')
+
+    def __new__(cls, value, units):
+        if not isinstance(value, float):
+            raise ValueError("Scale value must be float")
+
+        if not isinstance(units, str):
             raise ValueError("Scale value must be string")
 
-        self._units = val
+        key = (value, units)
+        obj = Scale._interned.get(key, None)
+        if obj is None:
+            obj = object.__new__(cls)
+            object.__setattr__(obj, '_value', value)
+            object.__setattr__(obj, '_units', units)
+            Scale._interned[key] = obj
+            if len(Scale._interned) > Scale.InternTableSize:
+                Scale._interned.popitem(last=False)
+
+        return obj
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Scale is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, Scale):
+            return NotImplemented
+
+        return self._value == other._value and self._units == other._units
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+
+        return not result
 
-    def __init__(self, value, units):
-        self.value = value
-        self.units = units
+    def __hash__(self):
+        return hash((self._value, self._units))
+
+    def __reduce__(self):
+        return (Scale, (self._value, self._units))
+
+    def __repr__(self):
+        return "Scale(%r, %r)" % (self._value, self._units)
+
+    @classmethod
+    def UnitScale(cls, from_units, to_units):
+        ''':return: Factor converting a length in from_units to to_units'''
+        try:
+            return cls.NanometersPerUnit[from_units] / cls.NanometersPerUnit[to_units]
+        except KeyError:
+            raise ValueError("Cannot convert %s to %s" % (from_units, to_units))
+
+    def ConvertTo(self, units):
+        ''':return: An equivalent scale expressed in other units'''
+        if units == self._units:
+            return self
+
+        return Scale(self._value * Scale.UnitScale(self._units, units), units)
 
 
 class ScaleBase(models.Model):
@@ -207,13 +276,44 @@ class CoordSpace(ScaleBase):
     dataset = models.ForeignKey("Dataset", related_name="coord_spaces", related_query_name="coord_space")
     bounds = models.ForeignKey(BoundingBox, null=True, help_text="Bounding box of known points in the space")
 
+    TILE = 'T'
+    MOSAIC = 'M'
+    KINDS = ((TILE, 'Tile'),
+             (MOSAIC, 'Mosaic'))
+
+    # Identity also encoded in the name, stored as columns so sections and tiles can be queried by integer
+    kind = models.CharField(max_length=1, choices=KINDS, null=True)
+    section_number = models.IntegerField(null=True, help_text="Section of a tile space, null for spaces shared by sections")
+    channel = models.ForeignKey("Channel", null=True, related_name="coord_spaces")
+    tile_number = models.IntegerField(null=True)
+
+    objects = custom_query_manager.SectionManager()
+    SectionZField = 'section_number'
+
     @classmethod
     def SectionChannelName(cls, section_number, channel_name, transform_name):
         '''Generate a reasonable name based on a section number, channel name, and transform name'''
         return '%04d.%s.%s' % (section_number, channel_name, transform_name)
 
+    @classmethod
+    def ParseSectionChannelName(cls, name):
+        '''Inverse of SectionChannelName
+        :return: (section_number, channel_name, transform_name, tile_number) or None if the name was not built by SectionChannelName.
+                 tile_number is None unless the transform name has the form Tile#'''
+        parts = name.split('.', 2)
+        if len(parts) != 3 or not parts[0].isdigit():
+            return None
+
+        (section, channel_name, transform_name) = parts
+        tile_number = None
+        if transform_name.startswith('Tile') and transform_name[4:].isdigit():
+            tile_number = int(transform_name[4:])
+
+        return (int(section), channel_name, transform_name, tile_number)
+
     class Meta:
         unique_together = (("dataset", "name"),)
+        index_together = (("dataset", "section_number", "kind", "tile_number"),)
 
     def __str__(self):
         return self.name
@@ -225,8 +325,9 @@ class CoordSpace(ScaleBase):
         
         #TODO: Shrink the bounding box if needed
         
-        for mapping in self.incoming_mappings.select_related('dest_bounding_box').iterator():
-            if self.UpdateBounds(mapping.dest_bounding_box):
+        dest_boxes = BoundingBox.objects.filter(incoming_mappings_bounding_boxes__dest_coordinate_space=self)
+        for dest_bounding_box in dest_boxes.Stream():
+            if self.UpdateBounds(dest_bounding_box):
                 updated = True
             
         if updated: 
@@ -236,7 +337,8 @@ class CoordSpace(ScaleBase):
                 
     
     def UpdateBounds(self, db_bounding_box):
-        '''Update our bounds to include the provided bounding box'''
+        '''Update our bounds to include the provided bounding box
+        :param db_bounding_box: BoundingBox or read_rows.BoundingBoxRow'''
         
         updated = False
     
@@ -298,6 +400,9 @@ class Data2D(models.Model):
     height = models.PositiveIntegerField()
     # tile = models.ForeignKey(Tile, null=True, blank=True, help_text="If Data represents a tile, this can be set to the tile ID")
 
+    objects = custom_query_manager.SectionManager()
+    SectionZField = 'coord_space__section_number'
+
     @property
     def channel(self):
         return self.filter.channel
@@ -309,21 +414,51 @@ class Data2D(models.Model):
         return self.name
 
 
+class TransformBlob(models.Model):
+    '''Compressed text of one distinct transform, keyed by the SHA-256 of the text.  Maintained by transform_blobs.'''
+    hash = models.CharField(max_length=64, primary_key=True)
+    codec = models.CharField(max_length=4, help_text="Compression of data, zlib or zstd")
+    length = models.PositiveIntegerField(help_text="Length of the uncompressed text")
+    data = models.BinaryField()
+
+    def __str__(self):
+        return "%s %s %d" % (self.hash, self.codec, self.length)
+
 class Mapping2D(models.Model):
     
     def get_query_set(self):
         return custom_query_manager.NoCountManager()
 
         
-    transform_string = models.TextField("Transform string") 
+    transform_string = models.TextField("Transform string", blank=True, help_text="Empty when the text is stored in transform_blob")
+    transform_blob = models.ForeignKey(TransformBlob, null=True, related_name="mappings")
     dest_coordinate_space = models.ForeignKey(CoordSpace, related_name="incoming_mappings")
     dest_bounding_box = models.ForeignKey(BoundingBox, related_name="incoming_mappings_bounding_boxes", help_text="Bounding box for this mapping's control points in the destination coordinate space")
     src_coordinate_space = models.ForeignKey(CoordSpace, related_name="outgoing_mappings")
     src_bounding_box = models.ForeignKey(BoundingBox, related_name="outgoing_mappings_bounding_boxes", help_text="Bounding box for this mapping's control points in the source coordinate space")
 
+    objects = custom_query_manager.SectionManager()
+    SectionZField = 'dest_bounding_box__minZ'
+
     @property
     def Z(self):
         return self.dest_bounding_box.minZ
+
+    @property
+    def transform(self):
+        '''Text of the transform, from transform_blob when the mapping has one'''
+        if self.transform_blob_id is None:
+            return self.transform_string
+
+        from . import transform_blobs
+        return transform_blobs.LoadTransform(self.transform_blob_id, using=router.db_for_read(Mapping2D, instance=self))
+
+    @transform.setter
+    def transform(self, text):
+        '''Store the text in the database the mapping will be saved to'''
+        from . import transform_blobs
+        self.transform_blob_id = transform_blobs.StoreTransform(text, using=router.db_for_write(Mapping2D, instance=self))
+        self.transform_string = ''
     
     class Meta:
         unique_together = (("src_coordinate_space", "dest_coordinate_space"),)
@@ -331,6 +466,150 @@ class Mapping2D(models.Model):
     def __str__(self):
         return self.src_coordinate_space.name + " -> " + self.dest_coordinate_space.name
 
+class ImportCheckpoint(models.Model):
+    '''A unit of import work committed in the same transaction as the rows it wrote'''
+    dataset = models.ForeignKey("Dataset", related_name="import_checkpoints")
+    task_key = models.CharField("Task", max_length=255, help_text="import_plan.TaskKey of the completed task")
+    section_number = models.IntegerField(db_index=True)
+    completed = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("dataset", "task_key"),)
+
+    def __str__(self):
+        return self.task_key
+
+class SectionGeneration(models.Model):
+    '''The dataset generation of the last write to a section'''
+    dataset = models.ForeignKey("Dataset", related_name="section_generations")
+    section_number = models.IntegerField()
+    generation = models.BigIntegerField(db_index=True)
+
+    class Meta:
+        unique_together = (("dataset", "section_number"),)
+
+    def __str__(self):
+        return "%s %d @ %d" % (self.dataset_id, self.section_number, self.generation)
+
+class SectionExtent(models.Model):
+    '''XY extent of the mappings into a coordinate space for a run of sections.
+
+       Rows with span 1 hold the extent of a single section.  Rows with larger spans
+       summarize the aligned run of sections [start, start + span) so range queries
+       read a handful of rows instead of every mapping.  Maintained by section_extents.'''
+    dataset = models.ForeignKey("Dataset", related_name="section_extents")
+    coord_space = models.ForeignKey(CoordSpace, related_name="section_extents")
+    span = models.PositiveIntegerField(help_text="Number of sections summarized by the row")
+    start = models.IntegerField(help_text="First section number summarized by the row, a multiple of span")
+
+    minX = models.FloatField()
+    minY = models.FloatField()
+    maxX = models.FloatField()
+    maxY = models.FloatField()
+
+    def as_tuple(self):
+        ''':return: (minY, minX, maxY, maxX)'''
+        return (self.minY, self.minX, self.maxY, self.maxX)
+
+    class Meta:
+        unique_together = (("dataset", "coord_space", "span", "start"),)
+
+    def __str__(self):
+        return "%s %d-%d %s" % (self.coord_space_id, self.start, self.start + self.span - 1, str(self.as_tuple()))
+
+class ComposedTransform(models.Model):
+    '''The chain of mappings from a tile space to a target space, composed into one set of point pairs.
+
+       points holds the zlib compressed little-endian float64 point pairs, see composed_transforms.
+       Maintained by composed_transforms.MaterializeComposedTransforms.'''
+    dataset = models.ForeignKey("Dataset", related_name="composed_transforms")
+    tile_space = models.ForeignKey(CoordSpace, related_name="composed_transforms")
+    target_space = models.ForeignKey(CoordSpace, related_name="incoming_composed_transforms")
+    section_number = models.IntegerField()
+    generation = models.BigIntegerField(help_text="Section generation the transform was composed at")
+    num_mappings = models.PositiveIntegerField(help_text="Number of mappings composed")
+    num_points = models.PositiveIntegerField()
+    points = models.BinaryField()
+
+    minX = models.FloatField()
+    minY = models.FloatField()
+    maxX = models.FloatField()
+    maxY = models.FloatField()
+
+    def as_tuple(self):
+        ''':return: (minY, minX, maxY, maxX) of the tile in the target space'''
+        return (self.minY, self.minX, self.maxY, self.maxX)
+
+    class Meta:
+        unique_together = (("tile_space", "target_space"),)
+        index_together = (("dataset", "section_number"),
+                          ("target_space", "section_number"))
+
+    def __str__(self):
+        return "%s => %s" % (self.tile_space_id, self.target_space_id)
+
+class TileAdjacency(models.Model):
+    '''Two tiles whose bounds overlap in a mosaic space.  Each pair is stored in both directions
+       so the neighbors of a tile are one indexed query.  Maintained by tile_adjacency.'''
+    dataset = models.ForeignKey("Dataset", related_name="tile_adjacencies")
+    coord_space = models.ForeignKey(CoordSpace, related_name="tile_adjacencies", help_text="Mosaic space the tiles overlap in")
+    section_number = models.IntegerField()
+    tile_space = models.ForeignKey(CoordSpace, related_name="adjacencies")
+    neighbor_space = models.ForeignKey(CoordSpace, related_name="neighbor_adjacencies")
+    overlap_area = models.FloatField(help_text="Area of the intersection of the tiles' bounds in the mosaic space")
+
+    class Meta:
+        unique_together = (("coord_space", "tile_space", "neighbor_space"),)
+        index_together = (("coord_space", "section_number"),)
+
+    def __str__(self):
+        return "%s ~ %s %g" % (self.tile_space_id, self.neighbor_space_id, self.overlap_area)
+
+class TileGrid(models.Model):
+    '''Uniform grid laid over the tiles of one section of a mosaic space.  Maintained by tile_grid.'''
+    dataset = models.ForeignKey("Dataset", related_name="tile_grids")
+    coord_space = models.ForeignKey(CoordSpace, related_name="tile_grids")
+    section_number = models.IntegerField()
+    cell_size = models.FloatField(help_text="Width and height of a cell in the mosaic space")
+    originX = models.FloatField()
+    originY = models.FloatField()
+    num_rows = models.PositiveIntegerField()
+    num_columns = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = (("coord_space", "section_number"),)
+
+    def Cell(self, Y, X):
+        ''':return: (row, column) of the cell holding a point, which may lie outside the grid'''
+        return (int((Y - self.originY) // self.cell_size), int((X - self.originX) // self.cell_size))
+
+    def __str__(self):
+        return "%s %d %dx%d of %g" % (self.coord_space_id, self.section_number, self.num_rows, self.num_columns, self.cell_size)
+
+class TileGridCell(models.Model):
+    '''A tile overlapping one cell of a TileGrid, with the tile's bounds in the mosaic space'''
+    dataset = models.ForeignKey("Dataset", related_name="tile_grid_cells")
+    coord_space = models.ForeignKey(CoordSpace, related_name="tile_grid_cells")
+    section_number = models.IntegerField()
+    row = models.IntegerField()
+    column = models.IntegerField()
+    tile_space = models.ForeignKey(CoordSpace, related_name="grid_cells")
+
+    minX = models.FloatField()
+    minY = models.FloatField()
+    maxX = models.FloatField()
+    maxY = models.FloatField()
+
+    def as_tuple(self):
+        ''':return: (minY, minX, maxY, maxX) of the tile in the mosaic space'''
+        return (self.minY, self.minX, self.maxY, self.maxX)
+
+    class Meta:
+        index_together = (("coord_space", "section_number", "row", "column"),)
+
+    def __str__(self):
+        return "%s (%d, %d) %s" % (self.coord_space_id, self.row, self.column, self.tile_space_id)
+
 #
 # class Mapping2D(Mapping2DBase):
 #
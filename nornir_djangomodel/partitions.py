@@ -0,0 +1,191 @@
+'''
+Created on Oct 19, 2026
+
+Optional per-dataset storage.
+
+Each dataset may be assigned its own database alias through the
+NORNIR_DJANGOMODEL_DATASET_DATABASES setting, for example one SQLite file per
+dataset or a PostgreSQL database/schema per dataset.  Rows for that dataset
+then never share tables or indexes with other datasets, and the whole dataset
+can be replaced by swapping its database file.
+
+Datasets without an entry use the default database.
+
+Partitioning stops at the dataset.  Sections of a dataset share its tables and
+queries are not routed by Z; the SectionZField indexes used by ForSection keep
+single section queries narrow, and bulk_sql.PurgeSection removes a section
+with set-based deletes rather than by swapping a partition.  Replacing a whole
+dataset is a swap, see ReplaceDatasetDatabase and staging.py.
+
+DatasetName, CoordSpaceName and Chunks are shared by the modules that take
+either a model or a name and that build queries from lists of keys.
+
+    DATABASES = {'default': {...},
+                 'RC1': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'RC1.sqlite3'}}
+    DATABASE_ROUTERS = ['nornir_djangomodel.partitions.DatasetRouter']
+    NORNIR_DJANGOMODEL_DATASET_DATABASES = {'RC1': 'RC1'}
+'''
+
+import os
+import threading
+
+from django.db import connections, DEFAULT_DB_ALIAS
+
+import nornir_djangomodel.settings as settings
+
+_active = threading.local()
+
+# SQLite refuses statements with more than 999 parameters
+MaxParametersPerQuery = 900
+
+
+def DatasetName(dataset):
+    ''':param dataset: Dataset model, dataset name or None
+       :return: Name of the dataset, or None'''
+    if dataset is None:
+        return None
+
+    if isinstance(dataset, str):
+        return dataset
+
+    return dataset.name
+
+
+def CoordSpaceName(coord_space):
+    ''':param coord_space: CoordSpace model or coordinate space name
+       :return: Name of the coordinate space'''
+    if isinstance(coord_space, str):
+        return coord_space
+
+    return coord_space.name
+
+
+def Chunks(items, chunk_size=MaxParametersPerQuery):
+    '''Split items into lists small enough to pass as the parameters of one query
+       :return: Generator of lists of at most chunk_size items'''
+    items = list(items)
+    for iStart in range(0, len(items), chunk_size):
+        yield items[iStart:iStart + chunk_size]
+
+
+def DatabaseForDataset(dataset):
+    ''':param dataset: Dataset model or dataset name
+       :return: Database alias holding the rows of the dataset'''
+    name = DatasetName(dataset)
+    if name is None:
+        return DEFAULT_DB_ALIAS
+
+    redirects = getattr(_active, 'redirects', None)
+    if redirects and name in redirects:
+        return redirects[name][-1]
+
+    return settings.NORNIR_DJANGOMODEL_DATASET_DATABASES.get(name, DEFAULT_DB_ALIAS)
+
+
+def ActiveDataset():
+    ''':return: Name of the dataset set by the innermost UsingDataset block, or None'''
+    stack = getattr(_active, 'stack', None)
+    if not stack:
+        return None
+
+    return stack[-1]
+
+
+class UsingDataset():
+    '''Context manager routing ORM queries that do not specify a database to the dataset's database.
+       Requires DatasetRouter in DATABASE_ROUTERS.'''
+
+    def __init__(self, dataset):
+        self.dataset_name = DatasetName(dataset)
+
+    def __enter__(self):
+        if not hasattr(_active, 'stack'):
+            _active.stack = []
+
+        _active.stack.append(self.dataset_name)
+        return DatabaseForDataset(self.dataset_name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active.stack.pop()
+
+
+class RedirectDataset():
+    '''Context manager sending the current thread's queries for a dataset to another database alias,
+       such as a staging copy being imported.  Other threads keep using the dataset's own database.'''
+
+    def __init__(self, dataset, alias):
+        self.dataset_name = DatasetName(dataset)
+        self.alias = alias
+
+    def __enter__(self):
+        if not hasattr(_active, 'redirects'):
+            _active.redirects = {}
+
+        _active.redirects.setdefault(self.dataset_name, []).append(self.alias)
+        return self.alias
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        aliases = _active.redirects[self.dataset_name]
+        aliases.pop()
+        if len(aliases) == 0:
+            del _active.redirects[self.dataset_name]
+
+
+class DatasetRouter():
+    '''Django database router sending queries to the database of the active dataset'''
+
+    def _db(self, model, **hints):
+        instance = hints.get('instance', None)
+        if instance is not None and instance._state.db is not None:
+            return instance._state.db
+
+        dataset_name = ActiveDataset()
+        if dataset_name is None:
+            return None
+
+        return DatabaseForDataset(dataset_name)
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return obj1._state.db == obj2._state.db
+
+    def allow_syncdb(self, db, model):
+        # Every dataset database carries the full schema
+        return True
+
+    def allow_migrate(self, db, *args, **hints):
+        return True
+
+
+def ReplaceDatasetDatabase(dataset, replacement_path):
+    '''Replace a SQLite dataset database with another database file in a single rename.
+       Connections to the old file in this process are closed first, other processes
+       keep reading the old file until they reconnect.  The old file's -wal and -shm files
+       are removed, so the caller must hold the old file's write lock or know it has no writers.
+       :param dataset: Dataset model or dataset name
+       :param str replacement_path: Path to a fully populated SQLite database file
+       :return: Path of the database file that was replaced'''
+
+    alias = DatabaseForDataset(dataset)
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        raise ValueError("Only SQLite dataset databases can be replaced by file, %s uses %s" % (alias, connection.vendor))
+
+    if alias == DEFAULT_DB_ALIAS:
+        raise ValueError("Dataset %s does not have its own database" % DatasetName(dataset))
+
+    db_path = connection.settings_dict['NAME']
+    connection.close()
+    os.replace(replacement_path, db_path)
+
+    # The old file's write-ahead log and shared memory index would be applied to the new file
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    return db_path
@@ -0,0 +1,422 @@
+'''
+Created on Oct 19, 2026
+
+Profiling for production imports.
+
+VolumeXMLImporter.Import(..., profile=...) wraps each phase of the import in
+ImportProfiler.Phase.  Each profiled phase may be measured in one of two ways:
+
+    DETERMINISTIC  cProfile, written as <phase>.profile for pstats or snakeviz
+    SAMPLING       A background thread samples the importing thread's stack,
+                   written as <phase>.samples in collapsed stack format
+
+The SQL each phase sends is recorded through the connection's debug cursor
+hook.  Literals are replaced with placeholders so statements group by shape,
+with a count and total time per shape.  WriteReport writes report.json and report.txt to the
+output directory.  CompareReports diffs the report.json files of two runs.
+
+    profiler = profiling.ImportProfiler('/tmp/import_profile', mode=profiling.SAMPLING, phases=['mosaics'])
+    VolumeXMLImporter.Import(path, profile=profiler)
+
+MeasureImportTime times importing modules in fresh interpreters and reports
+which packages of the image stack the import pulled in.
+'''
+
+import collections
+import cProfile
+import json
+import os
+import pstats
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from django.db import connections, DEFAULT_DB_ALIAS
+
+DETERMINISTIC = 'deterministic'
+SAMPLING = 'sampling'
+
+# Phases VolumeXMLImporter.Import reports, in the order they run
+ImportPhases = ('plan', 'channels', 'tiles', 'mosaics')
+
+_StringLiteral = re.compile(r"'(?:[^']|'')*'")
+_NumberLiteral = re.compile(r"(?<![\w.\"])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?")
+_InList = re.compile(r"IN \((?:(?:\?|%s)(?:,\s*)?)+\)")
+_Whitespace = re.compile(r"\s+")
+
+
+def NormalizeSQL(sql):
+    '''Reduce a statement to its shape by replacing literals and IN lists with placeholders'''
+    sql = _StringLiteral.sub('?', sql)
+    sql = _NumberLiteral.sub('?', sql)
+    sql = _Whitespace.sub(' ', sql).strip()
+    return _InList.sub('IN (...)', sql)
+
+
+def _WrapCursor(connection, cursor):
+    '''The wrapper Django applies to cursors when debugging is off'''
+    make_cursor = getattr(connection, 'make_cursor', None)
+    if make_cursor is not None:
+        return make_cursor(cursor)
+
+    from django.db.backends.util import CursorWrapper
+    return CursorWrapper(cursor, connection)
+
+
+class _RecordingCursor():
+    '''Cursor wrapper adding the count and time of each statement to a dictionary of SQL shapes.
+       Unlike connection.queries it keeps one entry per shape, so memory does not grow with the import.'''
+
+    def __init__(self, cursor, shapes):
+        self.cursor = cursor
+        self._shapes = shapes
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _Record(self, sql, seconds):
+        entry = self._shapes.setdefault(NormalizeSQL(sql), [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def execute(self, sql, params=None):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self._Record(sql, time.time() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self._Record(sql, time.time() - start)
+
+
+class _StackSampler():
+    '''Samples the stack of one thread at a fixed interval'''
+
+    def __init__(self, thread_id, interval):
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.stacks = collections.Counter()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._Run, name='ImportProfilerSampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _Run(self):
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id, None)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+
+            if len(stack) > 0:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def Write(self, path):
+        with open(path, 'w') as samples_file:
+            for (stack, count) in self.stacks.most_common():
+                samples_file.write("%s %d\n" % (stack, count))
+
+
+class ImportProfiler():
+    '''Profiles selected phases of an import and records the SQL they send'''
+
+    @property
+    def output_dir(self):
+        return self._output_dir
+
+    @property
+    def phases(self):
+        ''':return: Dictionary of phase name to {'seconds': float, 'sql': {shape: [count, seconds]}}'''
+        return self._phases
+
+    def __init__(self, output_dir, mode=DETERMINISTIC, phases=None, sql=True, sample_interval=0.005, using=None):
+        '''
+        :param str output_dir: Directory the profiles and reports are written to
+        :param str mode: DETERMINISTIC or SAMPLING
+        :param phases: Names of the phases to profile, None for every phase
+        :param bool sql: Record the SQL statements of profiled phases
+        :param float sample_interval: Seconds between stack samples in SAMPLING mode
+        :param str using: Database alias whose queries are recorded
+        '''
+        if mode not in (DETERMINISTIC, SAMPLING):
+            raise ValueError("Unknown profiling mode %s" % mode)
+
+        self._output_dir = output_dir
+        self._mode = mode
+        self._selected = None if phases is None else frozenset(phases)
+        self._sql = sql
+        self._sample_interval = sample_interval
+        self._using = DEFAULT_DB_ALIAS if using is None else using
+        self._phases = collections.OrderedDict()
+        self._profile_paths = []
+
+    @classmethod
+    def FromArgument(cls, profile, using=None):
+        '''Interpret the profile argument of VolumeXMLImporter.Import
+        :param profile: None, an output directory, or an ImportProfiler
+        :return: ImportProfiler or NullProfiler'''
+        if profile is None or profile is False:
+            return NullProfiler()
+
+        if isinstance(profile, (ImportProfiler, NullProfiler)):
+            return profile
+
+        return ImportProfiler(profile, using=using)
+
+    def IsProfiled(self, name):
+        return self._selected is None or name in self._selected
+
+    def Phase(self, name, statements=None):
+        '''Context manager profiling one phase of the import
+        :param ImportStatements statements: Cursor holder closed when a profiled phase starts and ends,
+                                            so statements of the phase run on a recording cursor'''
+        return _Phase(self, name, statements)
+
+    def _StartSQL(self):
+        connection = connections[self._using]
+        self._shapes = {}
+        self._saved_debug_cursor = (getattr(connection, 'use_debug_cursor', None), getattr(connection, 'force_debug_cursor', None))
+
+        # Route new cursors through make_debug_cursor, use_debug_cursor is the Django 1.6 name and force_debug_cursor the later one
+        connection.use_debug_cursor = True
+        connection.force_debug_cursor = True
+        connection.make_debug_cursor = lambda cursor: _RecordingCursor(_WrapCursor(connection, cursor), self._shapes)
+
+    def _StopSQL(self):
+        connection = connections[self._using]
+        del connection.make_debug_cursor
+        (connection.use_debug_cursor, connection.force_debug_cursor) = self._saved_debug_cursor
+        return self._shapes
+
+    def _Record(self, name, seconds, shapes, profile_path):
+        phase = self._phases.setdefault(name, {'seconds': 0.0, 'sql': {}})
+        phase['seconds'] += seconds
+        for (shape, (count, sql_seconds)) in shapes.items():
+            entry = phase['sql'].setdefault(shape, [0, 0.0])
+            entry[0] += count
+            entry[1] += sql_seconds
+
+        if profile_path is not None:
+            self._profile_paths.append(profile_path)
+
+    def WriteReport(self):
+        '''Write report.json, report.txt and, for deterministic profiles, import.profile combining every phase
+        :return: Path to report.json'''
+        if not os.path.exists(self._output_dir):
+            os.makedirs(self._output_dir)
+
+        report_path = os.path.join(self._output_dir, 'report.json')
+        with open(report_path, 'w') as report_file:
+            json.dump({'mode': self._mode, 'phases': self._phases}, report_file, indent=1)
+
+        with open(os.path.join(self._output_dir, 'report.txt'), 'w') as report_file:
+            report_file.write(self.Summary())
+
+        if self._mode == DETERMINISTIC and len(self._profile_paths) > 0:
+            stats = pstats.Stats(*self._profile_paths)
+            stats.dump_stats(os.path.join(self._output_dir, 'import.profile'))
+
+        return report_path
+
+    def Summary(self, num_statements=10):
+        ''':return: Text listing the time of each phase and its most expensive SQL shapes'''
+        lines = []
+        for (name, phase) in self._phases.items():
+            shapes = phase['sql']
+            lines.append("%s: %.3fs, %d statements in %.3fs" % (name, phase['seconds'],
+                                                               sum([entry[0] for entry in shapes.values()]),
+                                                               sum([entry[1] for entry in shapes.values()])))
+
+            for (shape, (count, seconds)) in sorted(shapes.items(), key=lambda item: item[1][1], reverse=True)[:num_statements]:
+                lines.append("  %8d %9.3fs  %s" % (count, seconds, shape))
+
+        return "\n".join(lines) + "\n"
+
+
+class _Phase():
+
+    def __init__(self, profiler, name, statements):
+        self._profiler = profiler
+        self._name = name
+        self._statements = statements
+        self._active = profiler.IsProfiled(name)
+
+    def __enter__(self):
+        if not self._active:
+            return self
+
+        p = self._profiler
+        if not os.path.exists(p.output_dir):
+            os.makedirs(p.output_dir)
+
+        self._collector = None
+        if p._mode == DETERMINISTIC:
+            self._collector = cProfile.Profile()
+        else:
+            self._collector = _StackSampler(threading.current_thread().ident, p._sample_interval)
+
+        if p._sql:
+            p._StartSQL()
+            if self._statements is not None:
+                self._statements.close()
+
+        self._start = time.time()
+        if p._mode == DETERMINISTIC:
+            self._collector.enable()
+        else:
+            self._collector.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._active:
+            return
+
+        p = self._profiler
+        if p._mode == DETERMINISTIC:
+            self._collector.disable()
+        else:
+            self._collector.stop()
+
+        seconds = time.time() - self._start
+        shapes = {}
+        if p._sql:
+            if self._statements is not None:
+                self._statements.close()
+
+            shapes = p._StopSQL()
+
+        profile_path = None
+        if p._mode == DETERMINISTIC:
+            profile_path = os.path.join(p.output_dir, self._name + '.profile')
+            self._collector.dump_stats(profile_path)
+        else:
+            self._collector.Write(os.path.join(p.output_dir, self._name + '.samples'))
+
+        p._Record(self._name, seconds, shapes, profile_path)
+
+
+class NullProfiler():
+    '''Stands in for ImportProfiler when profiling is off'''
+
+    class _NullPhase():
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            pass
+
+    def Phase(self, name, statements=None):
+        return NullProfiler._NullPhase()
+
+    def WriteReport(self):
+        return None
+
+
+def LoadReport(path):
+    ''':param str path: report.json or the directory containing it'''
+    if os.path.isdir(path):
+        path = os.path.join(path, 'report.json')
+
+    with open(path, 'r') as report_file:
+        return json.load(report_file)
+
+
+def CompareReports(baseline_path, candidate_path, num_statements=10):
+    '''Compare the reports of two profiled imports
+    :return: Text listing the change in time of each phase and the SQL shapes whose time changed the most'''
+    baseline = LoadReport(baseline_path)['phases']
+    candidate = LoadReport(candidate_path)['phases']
+
+    lines = []
+    for name in [name for name in ImportPhases if name in baseline or name in candidate] + \
+                sorted((set(baseline.keys()) | set(candidate.keys())) - set(ImportPhases)):
+        base_phase = baseline.get(name, {'seconds': 0.0, 'sql': {}})
+        cand_phase = candidate.get(name, {'seconds': 0.0, 'sql': {}})
+        lines.append("%s: %.3fs -> %.3fs (%+.3fs)" % (name, base_phase['seconds'], cand_phase['seconds'],
+                                                     cand_phase['seconds'] - base_phase['seconds']))
+
+        changes = []
+        for shape in set(base_phase['sql'].keys()) | set(cand_phase['sql'].keys()):
+            (base_count, base_seconds) = base_phase['sql'].get(shape, (0, 0.0))
+            (cand_count, cand_seconds) = cand_phase['sql'].get(shape, (0, 0.0))
+            changes.append((cand_seconds - base_seconds, base_count, cand_count, shape))
+
+        for (delta, base_count, cand_count, shape) in sorted(changes, key=lambda change: abs(change[0]), reverse=True)[:num_statements]:
+            lines.append("  %+9.3fs  %8d -> %-8d %s" % (delta, base_count, cand_count, shape))
+
+    return "\n".join(lines) + "\n"
+
+
+# Packages of the SciPy image stack the importer uses, which readers of the models should never load
+HeavyModules = ('numpy', 'scipy', 'matplotlib', 'PIL', 'nornir_imageregistration', 'nornir_volumemodel', 'nornir_volumecontroller')
+
+# Modules serving the models to readers
+ReadPathModules = ('nornir_djangomodel.models',
+                   'nornir_djangomodel.custom_query_manager',
+                   'nornir_djangomodel.generations',
+                   'nornir_djangomodel.partitions',
+                   'nornir_djangomodel.read_rows',
+                   'nornir_djangomodel.section_extents',
+                   'nornir_djangomodel.tile_adjacency',
+                   'nornir_djangomodel.tile_grid',
+                   'nornir_djangomodel.tile_index')
+
+_ImportTimeScript = '''
+import json, sys, time
+start = time.time()
+import django
+if hasattr(django, 'setup'):
+    django.setup()
+for name in sys.argv[1:]:
+    __import__(name)
+elapsed = time.time() - start
+print(json.dumps({'seconds': elapsed, 'modules': sorted(set([name.split('.')[0] for name in sys.modules]))}))
+'''
+
+
+def MeasureImportTime(module_names, repeat=3):
+    '''Import modules, with Django, in fresh interpreters and time it
+    :param module_names: Modules to import
+    :param int repeat: Number of interpreters to start, the fastest is reported
+    :return: (seconds, sorted list of the HeavyModules the import loaded)'''
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'nornir_djangomodel.settings')
+    env['PYTHONPATH'] = os.pathsep.join([path for path in sys.path if len(path) > 0])
+
+    fastest = None
+    loaded = []
+    for i in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', _ImportTimeScript] + list(module_names), env=env)
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        if fastest is None or result['seconds'] < fastest:
+            fastest = result['seconds']
+
+        loaded = sorted(set(HeavyModules) & set(result['modules']))
+
+    return (fastest, loaded)
@@ -0,0 +1,119 @@
+'''
+Created on Oct 19, 2026
+
+Read-only row types for bulk reads.
+
+Django model instances carry a __dict__ and a _state object each, which
+dominates memory when a section's tiles or mappings are loaded at once.  The
+rows here are namedtuples, so they have __slots__ = () and no per-instance
+dictionary, and they are built straight from values_list results without
+running model __init__.
+
+    for row in read_rows.Rows(models.Data2D.objects.filter(level=1)):
+        print(row.relative_path, row.width, row.height)
+
+Rows are snapshots.  Use the model when a row needs to be changed and saved.
+Mapping2DRow.transform_string always holds the transform text, including for
+mappings whose text is stored in a TransformBlob.
+'''
+
+import collections
+
+from . import transform_blobs
+
+# Mapping2D rows whose transform blobs are read in one query
+_TransformBatchSize = 500
+
+BoundingBoxFields = ('id', 'minX', 'minY', 'minZ', 'maxX', 'maxY', 'maxZ')
+
+
+class BoundingBoxRow(collections.namedtuple('BoundingBoxRow', BoundingBoxFields)):
+    '''Read-only BoundingBox'''
+    __slots__ = ()
+
+    @property
+    def ndims(self):
+        if self.minZ is None or self.maxZ is None:
+            return 2
+
+        return 3
+
+    def as_tuple(self):
+        ''':return: (minZ, minY, minX, maxZ, maxY, maxX) or (minY, minX, maxY, maxX), the same as BoundingBox.as_tuple'''
+        if self.ndims == 2:
+            return (self.minY, self.minX, self.maxY, self.maxX)
+
+        return (self.minZ, self.minY, self.minX, self.maxZ, self.maxY, self.maxX)
+
+
+Data2DFields = ('relative_path', 'name', 'image', 'level', 'filter_id', 'coord_space_id', 'width', 'height')
+
+
+class Data2DRow(collections.namedtuple('Data2DRow', Data2DFields)):
+    '''Read-only Data2D'''
+    __slots__ = ()
+
+
+Mapping2DFields = ('id', 'transform_string', 'src_coordinate_space_id', 'dest_coordinate_space_id', 'src_bounding_box', 'dest_bounding_box')
+
+
+class Mapping2DRow(collections.namedtuple('Mapping2DRow', Mapping2DFields)):
+    '''Read-only Mapping2D.  src_bounding_box and dest_bounding_box are BoundingBoxRows read in the same query.'''
+    __slots__ = ()
+
+    @property
+    def Z(self):
+        return self.dest_bounding_box.minZ
+
+
+def _BoundingBoxColumns(prefix=''):
+    return [prefix + name for name in BoundingBoxFields]
+
+
+def _BoundingBoxRows(values, using):
+    make = BoundingBoxRow._make
+    for row in values:
+        yield make(row)
+
+
+def _Data2DRows(values, using):
+    make = Data2DRow._make
+    for row in values:
+        yield make(row)
+
+
+def _Mapping2DRows(values, using):
+    make_bounds = BoundingBoxRow._make
+    batch = []
+    for row in values:
+        batch.append(row)
+        if len(batch) >= _TransformBatchSize:
+            for mapping in _Mapping2DBatch(batch, using, make_bounds):
+                yield mapping
+            batch = []
+
+    for mapping in _Mapping2DBatch(batch, using, make_bounds):
+        yield mapping
+
+
+def _Mapping2DBatch(batch, using, make_bounds):
+    transform_strings = transform_blobs.ResolveTransforms([row[1:3] for row in batch], using=using)
+    for (row, transform_string) in zip(batch, transform_strings):
+        yield Mapping2DRow(row[0], transform_string, row[3], row[4], make_bounds(row[5:12]), make_bounds(row[12:19]))
+
+
+# Model name to (values_list columns, row generator)
+_RowReaders = {'BoundingBox': (_BoundingBoxColumns(), _BoundingBoxRows),
+               'Data2D': (['relative_path', 'name', 'image', 'level', 'filter', 'coord_space', 'width', 'height'], _Data2DRows),
+               'Mapping2D': (['id', 'transform_string', 'transform_blob', 'src_coordinate_space', 'dest_coordinate_space'] + _BoundingBoxColumns('src_bounding_box__') + _BoundingBoxColumns('dest_bounding_box__'), _Mapping2DRows)}
+
+
+def Rows(queryset):
+    '''Iterate a BoundingBox, Data2D or Mapping2D queryset as read-only rows instead of model instances
+    :return: Generator of BoundingBoxRow, Data2DRow or Mapping2DRow'''
+    model_name = queryset.model._meta.object_name
+    if model_name not in _RowReaders:
+        raise TypeError("No read-only row type for %s" % model_name)
+
+    (columns, reader) = _RowReaders[model_name]
+    return reader(queryset.values_list(*columns).iterator(), queryset.db)
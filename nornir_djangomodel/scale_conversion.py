@@ -0,0 +1,89 @@
+'''
+Created on Oct 19, 2026
+
+Vectorized conversion of point arrays between pixel, nm and um coordinates.
+
+A point in a CoordSpace may be expressed in the space's pixels or in physical
+units.  Pixels are converted with the space's scale_value_X/Y columns.  The
+scales of every space involved are read in one query, so an array of points
+drawn from many spaces converts with a handful of NumPy operations.
+
+Points are (Y, X) rows, the same ordering as the rest of the package.
+'''
+
+import numpy
+
+from . import models
+from . import partitions
+
+PIXEL = 'px'
+NANOMETER = models.ScaleBase.NANOMETER
+MICROMETER = models.ScaleBase.MICROMETER
+
+
+def NanometersPerPixel(coord_spaces):
+    '''Read the pixel scale of several coordinate spaces
+    :param coord_spaces: Iterable of CoordSpace models or names
+    :return: (N, 2) array of (Y, X) nanometers per pixel, in the order of coord_spaces'''
+    names = [partitions.CoordSpaceName(coord_space) for coord_space in coord_spaces]
+
+    scales = {}
+    unique_names = list(set(names))
+    for iStart in range(0, len(unique_names), 500):
+        chunk = unique_names[iStart:iStart + 500]
+        for (name, value_X, units_X, value_Y, units_Y) in models.CoordSpace.objects.filter(name__in=chunk).values_list('name',
+                                                                                                                      'scale_value_X', 'scale_units_X',
+                                                                                                                      'scale_value_Y', 'scale_units_Y'):
+            if value_X is None or value_Y is None:
+                raise ValueError("Coordinate space %s has no scale" % name)
+
+            scales[name] = (value_Y * models.Scale.UnitScale(units_Y, NANOMETER),
+                            value_X * models.Scale.UnitScale(units_X, NANOMETER))
+
+    missing = set(names) - set(scales.keys())
+    if len(missing) > 0:
+        raise ValueError("Unknown coordinate spaces: %s" % ", ".join(sorted(missing)))
+
+    return numpy.array([scales[name] for name in names], dtype=numpy.float64).reshape((-1, 2))
+
+
+def _NanometersPerUnit(units, coord_spaces, num_points):
+    ''':return: (N, 2) array converting points in units to nanometers'''
+    if units == PIXEL:
+        if coord_spaces is None:
+            raise ValueError("Pixel coordinates require a coordinate space")
+
+        if isinstance(coord_spaces, (str, models.CoordSpace)):
+            return NanometersPerPixel([coord_spaces])
+
+        if len(coord_spaces) != num_points:
+            raise ValueError("Expected one coordinate space per point")
+
+        return NanometersPerPixel(coord_spaces)
+
+    return numpy.array([[models.Scale.UnitScale(units, NANOMETER)] * 2], dtype=numpy.float64)
+
+
+def ConvertPoints(points, from_units, to_units, from_space=None, to_space=None):
+    '''Convert an array of points between pixel, nm and um coordinates.
+    :param ndarray points: (N, 2) array of (Y, X) points
+    :param str from_units: Units of the input, PIXEL, NANOMETER or MICROMETER
+    :param str to_units: Units of the output
+    :param from_space: CoordSpace or name whose pixels the input uses, or a list with one space per point.  Required when from_units is PIXEL.
+    :param to_space: CoordSpace or name whose pixels the output uses, or a list with one space per point.  Required when to_units is PIXEL.
+    :return: (N, 2) float array of converted points
+    '''
+    points = numpy.asarray(points, dtype=numpy.float64).reshape((-1, 2))
+    if from_units == to_units and (from_units != PIXEL or _SameSpace(from_space, to_space)):
+        return points.copy()
+
+    to_nm = _NanometersPerUnit(from_units, from_space, points.shape[0])
+    from_nm = _NanometersPerUnit(to_units, to_space, points.shape[0])
+    return points * (to_nm / from_nm)
+
+
+def _SameSpace(from_space, to_space):
+    if isinstance(from_space, (str, models.CoordSpace)) and isinstance(to_space, (str, models.CoordSpace)):
+        return partitions.CoordSpaceName(from_space) == partitions.CoordSpaceName(to_space)
+
+    return False
@@ -0,0 +1,183 @@
+'''
+Created on Oct 19, 2026
+
+Bring tables created by earlier versions of the models up to date.
+
+syncdb creates tables that are missing but never alters a table that exists,
+so a database built before a column or index was added to one of its models
+fails its first query naming that column.  Upgrades lists the columns and
+index_together entries added to existing models.  UpgradeSchema adds the ones
+a database lacks and leaves everything else alone, so it can be run any number
+of times:
+
+    schema.UpgradeSchema(using='default')
+
+It also runs once per database per process as each connection is opened,
+before Django sends any query through it.  Tables that do not exist yet are
+skipped; syncdb creates them with every column.  Columns are added as
+nullable, or NOT NULL with the field default, so existing rows stay valid.
+Coordinate spaces upgraded this way still need
+bulk_sql.BackfillCoordSpaceIdentity to fill their identity columns, and
+mappings need transform_blobs.MigrateTransformStrings to fill transform_blob.
+'''
+
+import hashlib
+import threading
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+
+from . import models
+
+# (model name, fields added to the existing table, index_together entries added to it)
+Upgrades = (('Dataset', ('generation',), ()),
+            ('BoundingBox', (), (('minZ', 'maxZ'),)),
+            ('CoordSpace', ('kind', 'section_number', 'channel', 'tile_number'), (('dataset', 'section_number', 'kind', 'tile_number'),)),
+            ('Mapping2D', ('transform_blob',), ()),
+           )
+
+_upgraded = set()
+_upgraded_lock = threading.Lock()
+
+
+def _Literal(value):
+    '''SQL text of a column default.  ALTER TABLE cannot take the default as a parameter.'''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int):
+        return '%d' % value
+
+    raise ValueError("No SQL literal for default %r" % (value,))
+
+
+def _ColumnSQL(connection, field, tables):
+    quote = connection.ops.quote_name
+    sql = "%s %s" % (quote(field.column), field.db_type(connection))
+    if field.null:
+        sql += " NULL"
+    else:
+        sql += " NOT NULL DEFAULT %s" % _Literal(field.get_default())
+
+    if field.rel is not None:
+        target = field.rel.to._meta
+        if target.db_table in tables:
+            sql += " REFERENCES %s (%s)" % (quote(target.db_table), quote(target.get_field(field.rel.field_name).column))
+            if connection.vendor == 'postgresql':
+                sql += " DEFERRABLE INITIALLY DEFERRED"
+
+    return sql
+
+
+def _IndexName(table, columns):
+    '''Deterministic index name, short enough for PostgreSQL's 63 character limit'''
+    digest = hashlib.md5(','.join(columns).encode('utf-8')).hexdigest()[:8]
+    return '%s_%s' % (table[:54], digest)
+
+
+def _IndexedColumns(connection, cursor, table):
+    ''':return: List of column name tuples, one per index of the table, or None if the backend cannot be inspected'''
+    quote = connection.ops.quote_name
+    if connection.vendor == 'sqlite':
+        cursor.execute("PRAGMA index_list(%s)" % quote(table))
+        index_names = [row[1] for row in cursor.fetchall()]
+        indexes = []
+        for index_name in index_names:
+            cursor.execute("PRAGMA index_info(%s)" % quote(index_name))
+            indexes.append(tuple([row[2] for row in sorted(cursor.fetchall())]))
+        return indexes
+
+    if connection.vendor == 'postgresql':
+        cursor.execute("SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i JOIN pg_class t ON t.oid = i.indrelid "
+                       "WHERE t.relname = %s AND pg_table_is_visible(t.oid)", [table])
+        indexes = []
+        for (definition,) in cursor.fetchall():
+            column_list = definition[definition.rindex('(') + 1:definition.rindex(')')]
+            indexes.append(tuple([column.strip().strip('"') for column in column_list.split(',')]))
+        return indexes
+
+    return None
+
+
+def _Covered(indexes, columns):
+    '''True if an existing index starts with the columns, in order'''
+    for index in indexes:
+        if tuple(index[:len(columns)]) == tuple(columns):
+            return True
+
+    return False
+
+
+def _UpgradeStatements(connection, cursor, tables):
+    quote = connection.ops.quote_name
+    statements = []
+    for (model_name, field_names, index_list) in Upgrades:
+        model = getattr(models, model_name)
+        table = model._meta.db_table
+        if table not in tables:
+            continue
+
+        existing_columns = set([column.name for column in connection.introspection.get_table_description(cursor, table)])
+
+        wanted_indexes = []
+        for field_name in field_names:
+            field = model._meta.get_field(field_name)
+            if field.column in existing_columns:
+                continue
+
+            statements.append("ALTER TABLE %s ADD COLUMN %s" % (quote(table), _ColumnSQL(connection, field, tables)))
+            if field.db_index:
+                wanted_indexes.append((field.column,))
+
+        for index_fields in index_list:
+            wanted_indexes.append(tuple([model._meta.get_field(field_name).column for field_name in index_fields]))
+
+        indexes = _IndexedColumns(connection, cursor, table)
+        if indexes is None:
+            indexes = []
+
+        for columns in wanted_indexes:
+            if _Covered(indexes, columns):
+                continue
+
+            statements.append("CREATE INDEX %s ON %s (%s)" % (quote(_IndexName(table, columns)), quote(table), ", ".join([quote(column) for column in columns])))
+            indexes.append(columns)
+
+    return statements
+
+
+def UpgradeSchema(using=None):
+    '''Add the columns and indexes in Upgrades that the tables of a database lack
+       :param str using: Database alias, defaults to the default database
+       :return: List of the SQL statements executed, empty if the schema was current
+    '''
+    if using is None:
+        using = DEFAULT_DB_ALIAS
+
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        cursor = connection.cursor()
+        try:
+            tables = set(connection.introspection.table_names(cursor))
+            statements = _UpgradeStatements(connection, cursor, tables)
+            for sql in statements:
+                cursor.execute(sql)
+        finally:
+            cursor.close()
+
+    if len(statements) > 0:
+        print("Upgraded schema of database %s with %d statements" % (using, len(statements)))
+
+    return statements
+
+
+def _UpgradeOnConnect(sender, connection, **kwargs):
+    key = (connection.alias, connection.settings_dict.get('NAME'))
+    with _upgraded_lock:
+        if key in _upgraded:
+            return
+        _upgraded.add(key)
+
+    UpgradeSchema(using=connection.alias)
+
+
+connection_created.connect(_UpgradeOnConnect)
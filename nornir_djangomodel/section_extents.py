@@ -0,0 +1,174 @@
+'''
+Created on Oct 19, 2026
+
+Summary table of section extents for fast range and volume bounds queries.
+
+SectionExtent holds the XY extent of every section of a mosaic coordinate
+space, plus rows summarizing aligned runs of 10, 100 and 1000 sections.  The
+extent of an arbitrary run of sections is the union of at most a few dozen
+rows, and the extent of the whole volume is the union of the coarsest rows.
+
+The summary is recomputed for one section, and the coarser rows above it,
+whenever the importer writes that section's mappings or PurgeSection removes
+them.
+'''
+
+from django.db.models import Min, Max, Q
+
+from . import models
+from . import partitions
+
+# Number of sections summarized by the rows of each level, finest first
+Spans = (1, 10, 100, 1000)
+
+
+def _Union(extents):
+    ''':param extents: Iterable of (minX, minY, maxX, maxY) tuples, entries may be None
+       :return: (minX, minY, maxX, maxY) or None if there were no extents'''
+    result = None
+    for extent in extents:
+        if extent is None or extent[0] is None:
+            continue
+
+        if result is None:
+            result = list(extent)
+        else:
+            result = [min(result[0], extent[0]),
+                      min(result[1], extent[1]),
+                      max(result[2], extent[2]),
+                      max(result[3], extent[3])]
+
+    return None if result is None else tuple(result)
+
+
+def _SaveExtent(using, dataset_name, coord_space_name, span, start, extent):
+    '''Write or remove the summary row for one run of sections'''
+    rows = models.SectionExtent.objects.using(using).filter(dataset=dataset_name, coord_space=coord_space_name, span=span, start=start)
+    if extent is None:
+        rows.delete()
+        return
+
+    (minX, minY, maxX, maxY) = extent
+    if rows.update(minX=minX, minY=minY, maxX=maxX, maxY=maxY) == 0:
+        models.SectionExtent.objects.using(using).create(dataset_id=dataset_name, coord_space_id=coord_space_name,
+                                                         span=span, start=start,
+                                                         minX=minX, minY=minY, maxX=maxX, maxY=maxY)
+
+
+def _MappingExtent(using, coord_space_name, section_number):
+    ''':return: Extent of the destination bounding boxes of the mappings into the space at section_number'''
+    result = models.Mapping2D.objects.using(using).filter(dest_coordinate_space=coord_space_name,
+                                                          dest_bounding_box__minZ=section_number).aggregate(Min('dest_bounding_box__minX'),
+                                                                                                            Min('dest_bounding_box__minY'),
+                                                                                                            Max('dest_bounding_box__maxX'),
+                                                                                                            Max('dest_bounding_box__maxY'))
+    return _Union([(result['dest_bounding_box__minX__min'],
+                    result['dest_bounding_box__minY__min'],
+                    result['dest_bounding_box__maxX__max'],
+                    result['dest_bounding_box__maxY__max'])])
+
+
+def UpdateSectionExtent(dataset, coord_space, section_number, using=None):
+    '''Recompute the extent of one section of a coordinate space from its mappings, then the summary rows above it.
+    :param dataset: Dataset model or name
+    :param coord_space: CoordSpace model or name the mappings are into
+    :param int section_number: Section whose mappings changed
+    :return: (minX, minY, maxX, maxY) of the section or None if it has no mappings'''
+    dataset_name = partitions.DatasetName(dataset)
+    coord_space_name = partitions.CoordSpaceName(coord_space)
+    if using is None:
+        using = partitions.DatabaseForDataset(dataset_name)
+
+    section_number = int(section_number)
+    section_extent = _MappingExtent(using, coord_space_name, section_number)
+    _SaveExtent(using, dataset_name, coord_space_name, Spans[0], section_number, section_extent)
+
+    for iLevel in range(1, len(Spans)):
+        span = Spans[iLevel]
+        child_span = Spans[iLevel - 1]
+        start = (section_number // span) * span
+
+        children = models.SectionExtent.objects.using(using).filter(dataset=dataset_name, coord_space=coord_space_name,
+                                                                    span=child_span, start__gte=start, start__lt=start + span)
+        extent = _Union(children.values_list('minX', 'minY', 'maxX', 'maxY'))
+        _SaveExtent(using, dataset_name, coord_space_name, span, start, extent)
+
+    return section_extent
+
+
+def SummarizedCoordSpaces(dataset, section_number, using=None):
+    ''':return: Names of the coordinate spaces with an extent recorded for the section'''
+    dataset_name = partitions.DatasetName(dataset)
+    if using is None:
+        using = partitions.DatabaseForDataset(dataset_name)
+
+    return list(models.SectionExtent.objects.using(using).filter(dataset=dataset_name, span=Spans[0],
+                                                                 start=int(section_number)).values_list('coord_space', flat=True))
+
+
+def RebuildSectionExtents(dataset):
+    '''Recompute every summary row of a dataset from its mappings.  Used for databases imported before the table existed.
+    :return: Number of sections summarized'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+
+    models.SectionExtent.objects.using(using).filter(dataset=dataset_name).delete()
+
+    sections = models.Mapping2D.objects.using(using).filter(dest_coordinate_space__dataset=dataset_name).values_list('dest_coordinate_space', 'dest_bounding_box__minZ').distinct()
+    sections = sorted(set(sections))
+    for (coord_space_name, Z) in sections:
+        UpdateSectionExtent(dataset_name, coord_space_name, Z, using=using)
+
+    return len(sections)
+
+
+def _RangeKeys(first, last):
+    '''Split the sections [first, last] into the fewest aligned summary rows
+    :return: List of (span, start) tuples'''
+    keys = []
+    start = first
+    while start <= last:
+        for span in reversed(Spans):
+            if start % span == 0 and start + span - 1 <= last:
+                break
+
+        keys.append((span, start))
+        start += span
+
+    return keys
+
+
+def SectionRangeExtent(dataset, coord_space, first_section, last_section):
+    '''XY extent of the sections first_section through last_section, inclusive
+    :return: (minY, minX, maxY, maxX) or None if no section in the range has mappings'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+
+    keys = _RangeKeys(int(first_section), int(last_section))
+    if len(keys) == 0:
+        return None
+
+    query = Q()
+    for (span, start) in keys:
+        query |= Q(span=span, start=start)
+
+    rows = models.SectionExtent.objects.using(using).filter(query, dataset=dataset_name, coord_space=partitions.CoordSpaceName(coord_space))
+    extent = _Union(rows.values_list('minX', 'minY', 'maxX', 'maxY'))
+    if extent is None:
+        return None
+
+    return (extent[1], extent[0], extent[3], extent[2])
+
+
+def VolumeExtent(dataset, coord_space):
+    '''XY extent of every section of the coordinate space
+    :return: (minY, minX, maxY, maxX) or None if the space has no mappings'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+
+    rows = models.SectionExtent.objects.using(using).filter(dataset=dataset_name, coord_space=partitions.CoordSpaceName(coord_space), span=Spans[-1])
+    extent = _Union(rows.values_list('minX', 'minY', 'maxX', 'maxY'))
+    if extent is None:
+        return None
+
+    return (extent[1], extent[0], extent[3], extent[2])
@@ -21,6 +21,17 @@ DEBUG = True
 
 NORNIR_DJANGOMODEL_USEVOLUMEXMLCACHE = getattr(settings, "VOLUME_SERVER_COORD_SPACE_RESOLUTION", True)
 
+# Read only the requested sections of VolumeData.xml when importing a section_list.  See volume_xml_stream.py
+# Off by default: the streamed model reimplements the parts of nornir_volumemodel the importer reads and is
+# checked against nornir_volumemodel.Load_Xml by test_volume_xml_stream.TestVolumeModelParity
+NORNIR_DJANGOMODEL_STREAMVOLUMEXML = getattr(settings, "NORNIR_DJANGOMODEL_STREAMVOLUMEXML", False)
+
+# Maps dataset names to the database alias holding that dataset's rows.  See partitions.py
+NORNIR_DJANGOMODEL_DATASET_DATABASES = getattr(settings, "NORNIR_DJANGOMODEL_DATASET_DATABASES", {})
+
+# Store Mapping2D transform text once per distinct transform, compressed.  See transform_blobs.py
+NORNIR_DJANGOMODEL_TRANSFORMBLOBS = getattr(settings, "NORNIR_DJANGOMODEL_TRANSFORMBLOBS", True)
+
 INSTALLED_APPS = (
     'nornir_djangomodel'
 )
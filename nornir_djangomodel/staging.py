@@ -0,0 +1,337 @@
+'''
+Created on Oct 19, 2026
+
+Staged imports published with a single atomic switch.
+
+StagedImport copies the dataset's database to a staging database, imports
+into the copy, and then publishes it in one step:
+
+    SQLite      The staging file is renamed over the dataset's file, see partitions.ReplaceDatasetDatabase
+    PostgreSQL  The dataset's schema and the staging schema are swapped by renaming them in one transaction
+
+Readers keep using the old database, without contending with the import,
+until the switch.  A failed import discards the staging copy and leaves the
+dataset untouched.  The replaced database is kept so RollbackDataset can
+switch back immediately.
+
+A SQLite dataset is copied and replaced while holding its write lock.  Writes
+committed to the live file after the copy would be lost by the switch, so
+publishing refuses, and discards the staging copy, if the live file changed
+since it was copied.
+
+Every staged import copies the whole dataset before importing, whatever the
+size of the import.  Staging a one section re-import of a large dataset costs
+a full copy of its database file or schema; use VolumeXMLImporter.ReplaceSection
+when readers only need to avoid seeing a half-imported section.
+
+The dataset needs its own database alias in NORNIR_DJANGOMODEL_DATASET_DATABASES,
+a separate SQLite file or a PostgreSQL alias whose search_path names a
+dedicated schema, and DatasetRouter in DATABASE_ROUTERS.  Only the importing
+thread is redirected to the staging copy, see partitions.RedirectDataset.
+'''
+
+import os
+import shutil
+import sqlite3
+
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.db.models import Model
+
+from . import generations
+from . import import_xml
+from . import models
+from . import partitions
+
+
+def _DatasetModels():
+    ''':return: Every concrete model of the package'''
+    return [value for value in vars(models).values()
+            if isinstance(value, type) and issubclass(value, Model) and value.__module__ == models.__name__ and not value._meta.abstract]
+
+
+def _AddAlias(alias, settings_dict):
+    connections.databases[alias] = settings_dict
+
+
+def _RemoveAlias(alias):
+    if alias not in connections.databases:
+        return
+
+    connections[alias].close()
+    try:
+        delattr(connections._connections, alias)
+    except AttributeError:
+        pass
+
+    del connections.databases[alias]
+
+
+def _RemoveSQLiteFile(path):
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+# Attempts to checkpoint the live file before giving up on writers that keep committing
+_CopyAttempts = 10
+
+
+def _WalSize(path):
+    wal_path = path + '-wal'
+    if not os.path.exists(wal_path):
+        return 0
+
+    return os.path.getsize(wal_path)
+
+
+def _Fingerprint(path):
+    ''':return: (mtime, size, file change counter, write-ahead log size) of a SQLite file.  Every committed write changes at least one.'''
+    stat = os.stat(path)
+    with open(path, 'rb') as db_file:
+        header = db_file.read(100)
+
+    return (stat.st_mtime_ns, stat.st_size, header[24:28], _WalSize(path))
+
+
+def _LockSQLiteFile(path, begin):
+    '''Open a connection outside Django holding a write lock on a SQLite file.  Closing the connection releases the lock.
+    :param str begin: BEGIN IMMEDIATE or BEGIN EXCLUSIVE'''
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        connection.execute(begin)
+    except:
+        connection.close()
+        raise
+
+    return connection
+
+
+class _SQLiteStage():
+    '''Stages a copy of a SQLite dataset file beside the original'''
+
+    def __init__(self, dataset_name, alias):
+        self.dataset_name = dataset_name
+        self.live_alias = alias
+        self.alias = alias + '__staging'
+        self.live_path = connections[alias].settings_dict['NAME']
+        self.staging_path = self.live_path + '.staging'
+        self.previous_path = self.live_path + '.previous'
+        self.fingerprint = None
+
+    def _CopyLive(self):
+        '''Copy the live file while holding its write lock, so no commit lands between the checkpoint and the copy
+        :return: Fingerprint of the live file when it was copied'''
+        for attempt in range(_CopyAttempts):
+            live = sqlite3.connect(self.live_path, isolation_level=None)
+            try:
+                # Fold any write-ahead log into the file so the copy is complete.  A checkpoint cannot run inside a transaction.
+                live.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                live.execute("BEGIN IMMEDIATE")
+                if _WalSize(self.live_path) == 0:
+                    shutil.copyfile(self.live_path, self.staging_path)
+                    return _Fingerprint(self.live_path)
+            finally:
+                live.close()
+
+        raise ValueError("Could not copy %s, its write-ahead log was never empty" % self.live_path)
+
+    def Create(self):
+        '''Copy the entire dataset file, so the cost grows with the dataset rather than the import'''
+        _RemoveSQLiteFile(self.staging_path)
+
+        existed = os.path.exists(self.live_path)
+        if existed:
+            connections[self.live_alias].close()
+            self.fingerprint = self._CopyLive()
+
+        _AddAlias(self.alias, dict(connections[self.live_alias].settings_dict, NAME=self.staging_path))
+
+        if not existed:
+            call_command('syncdb', database=self.alias, interactive=False, verbosity=0)
+
+    def Publish(self, keep_previous):
+        '''Replace the live file with the staging file.  Raises ValueError if the live file was written after Create copied it.'''
+        _RemoveAlias(self.alias)
+
+        if self.fingerprint is None:
+            if os.path.exists(self.live_path):
+                raise ValueError("%s was created while %s was staged, import again" % (self.live_path, self.dataset_name))
+
+            partitions.ReplaceDatasetDatabase(self.dataset_name, self.staging_path)
+            return
+
+        connections[self.live_alias].close()
+
+        # Readers continue, writers wait until the staging file has replaced the live one
+        live = _LockSQLiteFile(self.live_path, "BEGIN EXCLUSIVE")
+        try:
+            if _Fingerprint(self.live_path) != self.fingerprint:
+                raise ValueError("%s was written after staging began and publishing would lose those writes, import %s again" % (self.live_path, self.dataset_name))
+
+            # The write-ahead log is as empty as it was after the checkpoint in Create, so the live file is complete
+            if keep_previous:
+                _RemoveSQLiteFile(self.previous_path)
+                try:
+                    # A second name for the live file, which keeps the old data once the staging file replaces it
+                    os.link(self.live_path, self.previous_path)
+                except (OSError, AttributeError):
+                    shutil.copyfile(self.live_path, self.previous_path)
+
+            partitions.ReplaceDatasetDatabase(self.dataset_name, self.staging_path)
+        finally:
+            live.close()
+
+    def Discard(self):
+        _RemoveAlias(self.alias)
+        _RemoveSQLiteFile(self.staging_path)
+
+    def Rollback(self):
+        if not os.path.exists(self.previous_path):
+            raise ValueError("No previous database to restore for %s" % self.dataset_name)
+
+        if not os.path.exists(self.live_path):
+            partitions.ReplaceDatasetDatabase(self.dataset_name, self.previous_path)
+            return
+
+        connections[self.live_alias].close()
+        live = _LockSQLiteFile(self.live_path, "BEGIN EXCLUSIVE")
+        try:
+            partitions.ReplaceDatasetDatabase(self.dataset_name, self.previous_path)
+        finally:
+            live.close()
+
+
+class _PostgreSQLStage():
+    '''Stages a copy of a dataset's PostgreSQL schema in a sibling schema'''
+
+    def __init__(self, dataset_name, alias):
+        self.dataset_name = dataset_name
+        self.live_alias = alias
+        self.alias = alias + '__staging'
+
+        cursor = connections[alias].cursor()
+        cursor.execute("SELECT current_schema()")
+        self.live_schema = cursor.fetchone()[0]
+        cursor.close()
+
+        if self.live_schema == 'public':
+            raise ValueError("Dataset %s must use a dedicated schema to be staged, %s uses public" % (dataset_name, alias))
+
+        self.staging_schema = self.live_schema + '_staging'
+        self.previous_schema = self.live_schema + '_previous'
+
+    def _Execute(self, statements):
+        '''Run statements on the live database in one transaction'''
+        with transaction.atomic(using=self.live_alias):
+            cursor = connections[self.live_alias].cursor()
+            for sql in statements:
+                cursor.execute(sql)
+            cursor.close()
+
+    def _Schema(self, name):
+        return connections[self.live_alias].ops.quote_name(name)
+
+    def Create(self):
+        '''Copy every table of the dataset's schema, so the cost grows with the dataset rather than the import'''
+        self._Execute(["DROP SCHEMA IF EXISTS %s CASCADE" % self._Schema(self.staging_schema),
+                       "CREATE SCHEMA %s" % self._Schema(self.staging_schema)])
+
+        settings_dict = dict(connections[self.live_alias].settings_dict)
+        options = dict(settings_dict.get('OPTIONS', {}))
+        options['options'] = '-c search_path=%s' % self.staging_schema
+        settings_dict['OPTIONS'] = options
+        _AddAlias(self.alias, settings_dict)
+
+        call_command('syncdb', database=self.alias, interactive=False, verbosity=0)
+
+        # Foreign keys are deferred until commit, so tables can be copied in any order
+        staging = connections[self.alias]
+        model_list = _DatasetModels()
+        with transaction.atomic(using=self.alias):
+            cursor = staging.cursor()
+            for model in model_list:
+                columns = ", ".join([staging.ops.quote_name(field.column) for field in model._meta.local_fields])
+                table = staging.ops.quote_name(model._meta.db_table)
+                cursor.execute("INSERT INTO %s.%s (%s) SELECT %s FROM %s.%s" % (self._Schema(self.staging_schema), table, columns,
+                                                                              columns, self._Schema(self.live_schema), table))
+
+            for sql in staging.ops.sequence_reset_sql(no_style(), model_list):
+                cursor.execute(sql)
+
+            cursor.close()
+
+    def Publish(self, keep_previous):
+        _RemoveAlias(self.alias)
+
+        statements = ["DROP SCHEMA IF EXISTS %s CASCADE" % self._Schema(self.previous_schema),
+                      "ALTER SCHEMA %s RENAME TO %s" % (self._Schema(self.live_schema), self._Schema(self.previous_schema)),
+                      "ALTER SCHEMA %s RENAME TO %s" % (self._Schema(self.staging_schema), self._Schema(self.live_schema))]
+        if not keep_previous:
+            statements.append("DROP SCHEMA %s CASCADE" % self._Schema(self.previous_schema))
+
+        self._Execute(statements)
+
+    def Discard(self):
+        _RemoveAlias(self.alias)
+        self._Execute(["DROP SCHEMA IF EXISTS %s CASCADE" % self._Schema(self.staging_schema)])
+
+    def Rollback(self):
+        self._Execute(["DROP SCHEMA IF EXISTS %s CASCADE" % self._Schema(self.staging_schema),
+                       "ALTER SCHEMA %s RENAME TO %s" % (self._Schema(self.live_schema), self._Schema(self.staging_schema)),
+                       "ALTER SCHEMA %s RENAME TO %s" % (self._Schema(self.previous_schema), self._Schema(self.live_schema)),
+                       "DROP SCHEMA %s CASCADE" % self._Schema(self.staging_schema)])
+
+
+def _Stage(dataset_name):
+    alias = partitions.DatabaseForDataset(dataset_name)
+    if alias == DEFAULT_DB_ALIAS:
+        raise ValueError("Dataset %s needs its own database in NORNIR_DJANGOMODEL_DATASET_DATABASES to be staged" % dataset_name)
+
+    vendor = connections[alias].vendor
+    if vendor == 'sqlite':
+        return _SQLiteStage(dataset_name, alias)
+    elif vendor == 'postgresql':
+        return _PostgreSQLStage(dataset_name, alias)
+
+    raise ValueError("Staged imports are not supported for %s databases" % vendor)
+
+
+def StagedImport(vol_model, dataset_name=None, keep_previous=True, **import_kwargs):
+    '''Import into a copy of the dataset's database and publish the copy when the import succeeds.
+    :param vol_model: Volume model or path to VolumeData.xml
+    :param bool keep_previous: Keep the replaced database so RollbackDataset can restore it
+    :param import_kwargs: Passed to VolumeXMLImporter.Import
+    :return: The result of VolumeXMLImporter.Import'''
+
+    if isinstance(vol_model, str):
+        vol_model = import_xml.VolumeXMLImporter._LoadVolume(vol_model, import_kwargs.get('section_list', None))
+
+    if dataset_name is None:
+        dataset_name = vol_model.Name
+
+    stage = _Stage(dataset_name)
+    stage.Create()
+    print("Staging import of %s in %s" % (dataset_name, stage.alias))
+
+    try:
+        with partitions.RedirectDataset(dataset_name, stage.alias):
+            result = import_xml.VolumeXMLImporter.Import(vol_model, dataset_name=dataset_name, **import_kwargs)
+
+        stage.Publish(keep_previous)
+    except:
+        stage.Discard()
+        raise
+
+    print("Published staged import of %s" % dataset_name)
+    generations.AnnounceDataset(dataset_name)
+    return result
+
+
+def RollbackDataset(dataset):
+    '''Switch a dataset back to the database replaced by its last staged import'''
+    dataset_name = partitions.DatasetName(dataset)
+    _Stage(dataset_name).Rollback()
+    print("Restored previous database of %s" % dataset_name)
+    generations.AnnounceDataset(dataset_name)
@@ -0,0 +1,134 @@
+'''
+Created on Oct 19, 2026
+
+Table of overlapping tiles in each mosaic space.
+
+Comparing every pair of tile bounds is quadratic in the number of tiles.
+OverlappingPairs sweeps a line across the bounds in X order instead, keeping
+the tiles the line currently crosses sorted by minY.  A tile can only overlap
+active tiles whose minY lies within the tallest tile's height below its own
+minY, so each tile is compared with a bisected window of the active tiles.
+When tile heights are similar, as in a capture mosaic, the window holds only
+the tiles near it and the sweep costs O(n log n + k) for k overlapping pairs.
+A few very tall tiles widen every window towards O(n) tiles.
+
+The importer recomputes a section's pairs whenever it writes the section's
+mappings into a mosaic space, see VolumeXMLImporter.WriteMosaicBatch.
+Neighbors answers the tile server's prefetch question with one indexed query.
+
+Rectangles are (minY, minX, maxY, maxX), the same layout as nornir_imageregistration.
+'''
+
+import bisect
+import heapq
+
+from django.db import transaction
+
+from . import models
+from . import partitions
+
+
+def OverlappingPairs(rects):
+    '''Find every pair of rectangles with a positive area of overlap.
+    :param rects: Sequence of (minY, minX, maxY, maxX) rectangles
+    :return: List of (i, j, overlap_area) with i < j indexing rects'''
+    order = sorted(range(len(rects)), key=lambda i: rects[i][1])
+    tallest = max([rect[2] - rect[0] for rect in rects]) if len(rects) > 0 else 0
+
+    pairs = []
+    active = []     # (minY, index) of the rectangles the sweep line crosses, sorted
+    expiring = []   # Heap of (maxX, index) for the active rectangles
+    for i in order:
+        (minY, minX, maxY, maxX) = rects[i]
+
+        while len(expiring) > 0 and expiring[0][0] <= minX:
+            (expired_maxX, expired) = heapq.heappop(expiring)
+            del active[bisect.bisect_left(active, (rects[expired][0], expired))]
+
+        # Active rectangles starting more than the tallest height below minY end before it
+        first = bisect.bisect_left(active, (minY - tallest,))
+        last = bisect.bisect_left(active, (maxY,))
+        for (start, j) in active[first:last]:
+            (other_minY, other_minX, other_maxY, other_maxX) = rects[j]
+            height = min(maxY, other_maxY) - max(minY, other_minY)
+            if height <= 0:
+                continue
+
+            width = min(maxX, other_maxX) - minX
+            if width <= 0:
+                continue
+
+            pairs.append((min(i, j), max(i, j), float(height * width)))
+
+        bisect.insort(active, (minY, i))
+        heapq.heappush(expiring, (maxX, i))
+
+    return pairs
+
+
+def UpdateTileAdjacency(dataset, coord_space, section_number, using=None):
+    '''Recompute the overlapping tiles of one section of a mosaic space from the destination bounds of its mappings
+    :param dataset: Dataset model or name
+    :param coord_space: Mosaic CoordSpace model or name
+    :param int section_number: Section whose mappings changed
+    :return: Number of overlapping pairs'''
+    dataset_name = partitions.DatasetName(dataset)
+    coord_space_name = partitions.CoordSpaceName(coord_space)
+    if using is None:
+        using = partitions.DatabaseForDataset(dataset_name)
+
+    section_number = int(section_number)
+    tiles = list(models.Mapping2D.objects.using(using).filter(dest_coordinate_space=coord_space_name,
+                                                              dest_bounding_box__minZ=section_number).values_list('src_coordinate_space',
+                                                                                                                  'dest_bounding_box__minY',
+                                                                                                                  'dest_bounding_box__minX',
+                                                                                                                  'dest_bounding_box__maxY',
+                                                                                                                  'dest_bounding_box__maxX'))
+    pairs = OverlappingPairs([tile[1:5] for tile in tiles])
+
+    rows = []
+    for (i, j, overlap_area) in pairs:
+        for (tile_name, neighbor_name) in ((tiles[i][0], tiles[j][0]), (tiles[j][0], tiles[i][0])):
+            rows.append(models.TileAdjacency(dataset_id=dataset_name,
+                                             coord_space_id=coord_space_name,
+                                             section_number=section_number,
+                                             tile_space_id=tile_name,
+                                             neighbor_space_id=neighbor_name,
+                                             overlap_area=overlap_area))
+
+    with transaction.atomic(using=using):
+        models.TileAdjacency.objects.using(using).filter(coord_space=coord_space_name, section_number=section_number).delete()
+        models.TileAdjacency.objects.using(using).bulk_create(rows)
+
+    return len(pairs)
+
+
+def RebuildTileAdjacency(dataset):
+    '''Recompute the overlapping tiles of every section of a dataset.  Used for databases imported before the table existed.
+    :return: Number of overlapping pairs'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+
+    sections = models.Mapping2D.objects.using(using).filter(dest_coordinate_space__dataset=dataset_name,
+                                                            dest_coordinate_space__kind=models.CoordSpace.MOSAIC).values_list('dest_coordinate_space', 'dest_bounding_box__minZ').distinct()
+
+    num_pairs = 0
+    for (coord_space_name, Z) in sorted(set(sections)):
+        num_pairs += UpdateTileAdjacency(dataset_name, coord_space_name, Z, using=using)
+
+    return num_pairs
+
+
+def Neighbors(dataset, tile_space, coord_space=None):
+    '''Tiles overlapping a tile, largest overlap first
+    :param tile_space: Tile CoordSpace model or name
+    :param coord_space: Only report overlaps in this mosaic space
+    :return: List of (neighbor tile space name, mosaic space name, overlap_area)'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+
+    rows = models.TileAdjacency.objects.using(using).filter(tile_space=partitions.CoordSpaceName(tile_space))
+    if coord_space is not None:
+        rows = rows.filter(coord_space=partitions.CoordSpaceName(coord_space))
+
+    return list(rows.order_by('-overlap_area', 'neighbor_space').values_list('neighbor_space', 'coord_space', 'overlap_area'))
@@ -0,0 +1,180 @@
+'''
+Created on Oct 19, 2026
+
+Grid index resolving a viewport to the Data2D tiles under it.
+
+Capture tiles are placed in a mosaic space by their transforms, not on a
+regular grid, so the index is a uniform spatial hash laid over their bounds.
+Each section of a mosaic space gets a TileGrid whose cells are about one
+tile wide.  Each tile is listed in a TileGridCell row for every cell it
+overlaps, together with its bounds in the mosaic space.  A tile spans at most
+a few cells, so a viewport lookup reads the cells it covers in one indexed
+query and touches O(k) rows for the k tiles it returns.
+
+Every pyramid level of a tile shares the tile's coordinate space, so one grid
+serves every level.  TilesInViewport picks the level from the requested
+downsample and returns that level's Data2D rows.
+
+The importer rebuilds a section's grid whenever it writes the section's
+mappings into a mosaic space, see VolumeXMLImporter.WriteMosaicBatch.
+
+Rectangles are (minY, minX, maxY, maxX), the same layout as nornir_imageregistration.
+'''
+
+import math
+
+from django.db import transaction
+
+from . import models
+from . import partitions
+from . import read_rows
+
+
+def BuildTileGrid(dataset, coord_space, section_number, cell_size=None, using=None):
+    '''Rebuild the grid of one section of a mosaic space from the destination bounds of its mappings
+    :param dataset: Dataset model or name
+    :param coord_space: Mosaic CoordSpace model or name
+    :param int section_number: Section whose mappings changed
+    :param float cell_size: Cell width and height, defaults to the median tile size
+    :return: TileGrid, None if the section has no tiles in the space'''
+    dataset_name = partitions.DatasetName(dataset)
+    coord_space_name = partitions.CoordSpaceName(coord_space)
+    if using is None:
+        using = partitions.DatabaseForDataset(dataset_name)
+
+    section_number = int(section_number)
+    tiles = list(models.Mapping2D.objects.using(using).filter(dest_coordinate_space=coord_space_name,
+                                                              dest_bounding_box__minZ=section_number).values_list('src_coordinate_space',
+                                                                                                                  'dest_bounding_box__minY',
+                                                                                                                  'dest_bounding_box__minX',
+                                                                                                                  'dest_bounding_box__maxY',
+                                                                                                                  'dest_bounding_box__maxX'))
+
+    with transaction.atomic(using=using):
+        models.TileGridCell.objects.using(using).filter(coord_space=coord_space_name, section_number=section_number).delete()
+        models.TileGrid.objects.using(using).filter(coord_space=coord_space_name, section_number=section_number).delete()
+
+        if len(tiles) == 0:
+            return None
+
+        if cell_size is None:
+            sizes = sorted([max(maxY - minY, maxX - minX) for (tile_name, minY, minX, maxY, maxX) in tiles])
+            cell_size = float(sizes[len(sizes) // 2])
+            if cell_size <= 0:
+                cell_size = 1.0
+
+        originY = min([tile[1] for tile in tiles])
+        originX = min([tile[2] for tile in tiles])
+        extentY = max([tile[3] for tile in tiles]) - originY
+        extentX = max([tile[4] for tile in tiles]) - originX
+
+        db_grid = models.TileGrid(dataset_id=dataset_name, coord_space_id=coord_space_name, section_number=section_number,
+                                  cell_size=cell_size, originX=float(originX), originY=float(originY),
+                                  num_rows=int(math.floor(extentY / cell_size)) + 1, num_columns=int(math.floor(extentX / cell_size)) + 1)
+        db_grid.save(using=using)
+
+        rows = []
+        for (tile_name, minY, minX, maxY, maxX) in tiles:
+            (first_row, first_column) = db_grid.Cell(minY, minX)
+            (last_row, last_column) = db_grid.Cell(maxY, maxX)
+            for row in range(first_row, last_row + 1):
+                for column in range(first_column, last_column + 1):
+                    rows.append(models.TileGridCell(dataset_id=dataset_name, coord_space_id=coord_space_name, section_number=section_number,
+                                                    row=row, column=column, tile_space_id=tile_name,
+                                                    minX=minX, minY=minY, maxX=maxX, maxY=maxY))
+
+        models.TileGridCell.objects.using(using).bulk_create(rows)
+
+    return db_grid
+
+
+def RebuildTileGrids(dataset):
+    '''Rebuild the grid of every section of a dataset.  Used for databases imported before the tables existed.
+    :return: Number of grids built'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+
+    sections = models.Mapping2D.objects.using(using).filter(dest_coordinate_space__dataset=dataset_name,
+                                                            dest_coordinate_space__kind=models.CoordSpace.MOSAIC).values_list('dest_coordinate_space', 'dest_bounding_box__minZ').distinct()
+
+    num_grids = 0
+    for (coord_space_name, Z) in sorted(set(sections)):
+        if BuildTileGrid(dataset_name, coord_space_name, Z, using=using) is not None:
+            num_grids += 1
+
+    return num_grids
+
+
+def BestLevel(levels, downsample):
+    '''Choose the pyramid level to draw a viewport at
+    :param levels: Available level numbers, each the downsample factor of its images
+    :param float downsample: Mosaic pixels per screen pixel of the viewport
+    :return: The coarsest level that still has at least one image pixel per screen pixel, or the finest level if none does'''
+    levels = sorted(levels)
+    if len(levels) == 0:
+        return None
+
+    best = levels[0]
+    for level in levels:
+        if level <= downsample:
+            best = level
+
+    return best
+
+
+def TileLevels(dataset, section_number, channel_name, filter_name):
+    ''':return: Sorted level numbers with Data2D rows for the section'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+    levels = models.Data2D.objects.using(using).filter(coord_space__dataset=dataset_name, coord_space__section_number=int(section_number),
+                                                       filter__name=filter_name, filter__channel=channel_name).values_list('level', flat=True).distinct()
+    return sorted(levels)
+
+
+def TilesInViewport(dataset, coord_space, section_number, viewport, downsample, channel_name, filter_name):
+    '''Find the tiles to draw a viewport of a mosaic space
+    :param dataset: Dataset model or name
+    :param coord_space: Mosaic CoordSpace model or name
+    :param int section_number: Section to draw
+    :param viewport: (minY, minX, maxY, maxX) in the mosaic space
+    :param float downsample: Mosaic pixels per screen pixel
+    :return: (level, list of (tile bounds, Data2DRow)) sorted by tile, level is None if the section has no tiles'''
+    dataset_name = partitions.DatasetName(dataset)
+    coord_space_name = partitions.CoordSpaceName(coord_space)
+    using = partitions.DatabaseForDataset(dataset_name)
+    section_number = int(section_number)
+
+    level = BestLevel(TileLevels(dataset_name, section_number, channel_name, filter_name), downsample)
+    if level is None:
+        return (None, [])
+
+    grids = list(models.TileGrid.objects.using(using).filter(coord_space=coord_space_name, section_number=section_number))
+    if len(grids) == 0:
+        return (level, [])
+
+    db_grid = grids[0]
+    (minY, minX, maxY, maxX) = viewport
+    (first_row, first_column) = db_grid.Cell(minY, minX)
+    (last_row, last_column) = db_grid.Cell(maxY, maxX)
+
+    cells = models.TileGridCell.objects.using(using).filter(coord_space=coord_space_name, section_number=section_number,
+                                                            row__gte=max(first_row, 0), row__lte=min(last_row, db_grid.num_rows - 1),
+                                                            column__gte=max(first_column, 0), column__lte=min(last_column, db_grid.num_columns - 1))
+
+    tile_bounds = {}
+    for (tile_name, tile_minY, tile_minX, tile_maxY, tile_maxX) in cells.values_list('tile_space', 'minY', 'minX', 'maxY', 'maxX'):
+        if tile_minY <= maxY and tile_maxY >= minY and tile_minX <= maxX and tile_maxX >= minX:
+            tile_bounds[tile_name] = (tile_minY, tile_minX, tile_maxY, tile_maxX)
+
+    if len(tile_bounds) == 0:
+        return (level, [])
+
+    # A large viewport can cover more tiles than SQLite accepts parameters in one query
+    tiles = []
+    for chunk in partitions.Chunks(sorted(tile_bounds.keys())):
+        data = models.Data2D.objects.using(using).filter(coord_space__in=chunk, level=level,
+                                                         filter__name=filter_name, filter__channel=channel_name)
+        tiles.extend([(tile_bounds[row.coord_space_id], row) for row in read_rows.Rows(data)])
+
+    tiles.sort(key=lambda tile: tile[1].coord_space_id)
+    return (level, tiles)
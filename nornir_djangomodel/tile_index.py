@@ -0,0 +1,228 @@
+'''
+Created on Oct 19, 2026
+
+Flat binary index of tile locations for serving tiles without the database.
+
+ExportTileIndex writes the Data2D rows of a dataset to a single file.  A tile
+server opens it with TileIndex, which memory-maps the file and locates tiles
+by binary search.  Opening the index reads only the header, and lookups run no
+SQL.  The database is then only needed by writers.
+
+File layout, all integers little-endian:
+
+    Header   magic, version, group count, record count, group/record/pool offsets
+    Groups   one fixed-width entry per (section, level, channel, filter), sorted
+    Records  one fixed-width entry per tile, sorted by tile number within a group
+    Pool     UTF-8 strings referenced by (offset, length) from groups and records
+'''
+
+import mmap
+import os
+import struct
+
+from . import keyset
+from . import models
+from . import partitions
+
+Magic = b'NDTI'
+Version = 1
+
+# magic, version, num_groups, num_records, groups_offset, records_offset, pool_offset
+_Header = struct.Struct('<4sIIIQQQ')
+# section, level, key offset, key length, first record, num records
+_Group = struct.Struct('<iIIIII')
+# tile number, width, height, path offset, path length
+_Record = struct.Struct('<IIIII')
+
+
+def _GroupKey(channel_name, filter_name):
+    return '%s/%s' % (channel_name, filter_name)
+
+
+class _StringPool():
+    '''Collects strings for the pool, storing each distinct string once'''
+
+    def __init__(self):
+        self._offsets = {}
+        self._chunks = []
+        self._size = 0
+
+    def Add(self, value):
+        ''':return: (offset, length) of the encoded string'''
+        encoded = value.encode('utf-8')
+        offset = self._offsets.get(encoded, None)
+        if offset is None:
+            offset = self._size
+            self._offsets[encoded] = offset
+            self._chunks.append(encoded)
+            self._size += len(encoded)
+
+        return (offset, len(encoded))
+
+    def tobytes(self):
+        return b''.join(self._chunks)
+
+
+def _TileNumber(name):
+    (number, ext) = os.path.splitext(name)
+    return int(number)
+
+
+def ExportTileIndex(dataset, path):
+    '''Write the Data2D rows of a dataset to a tile index file.  The file is written
+       beside path and renamed into place so readers never see a partial index.
+       Raises ValueError if a tile's coordinate space has no section number.
+    :param dataset: Dataset model or name
+    :param str path: Output file
+    :return: Number of tiles written'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+
+    groups = {}
+    rows = keyset.StreamValues(models.Data2D.objects.using(using).filter(coord_space__dataset=dataset_name),
+                               ('name', 'relative_path', 'level', 'filter__name', 'filter__channel', 'coord_space__section_number', 'width', 'height'))
+    for (name, relative_path, level, filter_name, channel_name, section_number, width, height) in rows:
+        if section_number is None:
+            raise ValueError("Tile %s of %s has no section number, run bulk_sql.BackfillCoordSpaceIdentity on the dataset before exporting a tile index" % (relative_path, dataset_name))
+
+        group_key = (section_number, level, _GroupKey(channel_name, filter_name))
+        groups.setdefault(group_key, []).append((_TileNumber(name), width, height, relative_path))
+
+    pool = _StringPool()
+    group_entries = []
+    record_entries = []
+    for group_key in sorted(groups.keys()):
+        (section_number, level, key) = group_key
+        tiles = sorted(groups[group_key])
+
+        (key_offset, key_length) = pool.Add(key)
+        group_entries.append(_Group.pack(section_number, level, key_offset, key_length, len(record_entries), len(tiles)))
+
+        for (tile_number, width, height, relative_path) in tiles:
+            (path_offset, path_length) = pool.Add(relative_path)
+            record_entries.append(_Record.pack(tile_number, width, height, path_offset, path_length))
+
+    groups_offset = _Header.size
+    records_offset = groups_offset + (len(group_entries) * _Group.size)
+    pool_offset = records_offset + (len(record_entries) * _Record.size)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as index_file:
+        index_file.write(_Header.pack(Magic, Version, len(group_entries), len(record_entries), groups_offset, records_offset, pool_offset))
+        index_file.write(b''.join(group_entries))
+        index_file.write(b''.join(record_entries))
+        index_file.write(pool.tobytes())
+
+    os.replace(temp_path, path)
+
+    print("Exported %d tiles in %d groups of %s to %s" % (len(record_entries), len(group_entries), dataset_name, path))
+    return len(record_entries)
+
+
+class TileIndex():
+    '''Read-only view of a file written by ExportTileIndex'''
+
+    @property
+    def NumGroups(self):
+        return self._num_groups
+
+    @property
+    def NumTiles(self):
+        return self._num_records
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            self._file.close()
+            raise
+
+        (magic, version, self._num_groups, self._num_records,
+         self._groups_offset, self._records_offset, self._pool_offset) = _Header.unpack_from(self._map, 0)
+
+        if magic != Magic or version != Version:
+            self.close()
+            raise ValueError("%s is not a version %d tile index" % (path, Version))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._file.close()
+
+    def _String(self, offset, length):
+        start = self._pool_offset + offset
+        return self._map[start:start + length].decode('utf-8')
+
+    def _GroupAt(self, iGroup):
+        return _Group.unpack_from(self._map, self._groups_offset + (iGroup * _Group.size))
+
+    def _RecordAt(self, iRecord):
+        return _Record.unpack_from(self._map, self._records_offset + (iRecord * _Record.size))
+
+    def _FindGroup(self, section_number, level, channel_name, filter_name):
+        ''':return: (first_record, num_records) or None'''
+        target = (section_number, level, _GroupKey(channel_name, filter_name))
+
+        lo = 0
+        hi = self._num_groups
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (group_section, group_level, key_offset, key_length, first, count) = self._GroupAt(mid)
+            if (group_section, group_level, self._String(key_offset, key_length)) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == self._num_groups:
+            return None
+
+        (group_section, group_level, key_offset, key_length, first, count) = self._GroupAt(lo)
+        if (group_section, group_level, self._String(key_offset, key_length)) != target:
+            return None
+
+        return (first, count)
+
+    def Find(self, section_number, channel_name, filter_name, level, tile_number):
+        '''Locate a single tile
+        :return: (relative_path, width, height) or None if the tile is not in the index'''
+        group = self._FindGroup(section_number, level, channel_name, filter_name)
+        if group is None:
+            return None
+
+        (lo, count) = group
+        hi = lo + count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._RecordAt(mid)[0] < tile_number:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == group[0] + count:
+            return None
+
+        (number, width, height, path_offset, path_length) = self._RecordAt(lo)
+        if number != tile_number:
+            return None
+
+        return (self._String(path_offset, path_length), width, height)
+
+    def Tiles(self, section_number, channel_name, filter_name, level):
+        '''Iterate the tiles of one level of a section
+        :return: Generator of (tile_number, relative_path, width, height) tuples in tile number order'''
+        group = self._FindGroup(section_number, level, channel_name, filter_name)
+        if group is None:
+            return
+
+        (first, count) = group
+        for iRecord in range(first, first + count):
+            (number, width, height, path_offset, path_length) = self._RecordAt(iRecord)
+            yield (number, self._String(path_offset, path_length), width, height)
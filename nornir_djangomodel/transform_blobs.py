@@ -0,0 +1,283 @@
+'''
+Created on Oct 19, 2026
+
+Content-addressed, compressed storage for transform text.
+
+Tiles of a mosaic often share a transform, and mesh transforms are long lists
+of ASCII floats.  Rather than keep the text on every Mapping2D row, each
+distinct transform is stored once in TransformBlob, keyed by the SHA-256 of
+its text and compressed with zstd when the zstandard package is installed,
+zlib otherwise.  Mapping2D.transform_blob references the blob and
+Mapping2D.transform_string is left empty.  Mapping2D.transform reads either.
+
+Writing a transform that is already stored costs one indexed lookup, so a
+re-import of an unchanged mosaic writes no transform text at all.
+
+Blobs are immutable, so decompressed text is cached by hash.
+
+Blobs are shared by every mapping with the same text, so PurgeSection may
+delete a blob that an import has just found in StoreTransforms.  Writers call
+EnsureTransforms after writing their mappings, in the same transaction, to
+store any such blob again.
+
+Functions given no database alias use the one Django's routers choose, which
+is the active dataset's database under partitions.DatasetRouter.
+
+Set NORNIR_DJANGOMODEL_TRANSFORMBLOBS to False to keep writing the text to
+Mapping2D.transform_string.  MigrateTransformStrings moves the text of
+existing rows into blobs.
+'''
+
+import collections
+import hashlib
+import zlib
+
+from django.db import connections, router, transaction, IntegrityError
+
+from . import generations
+from . import models
+from . import partitions
+from . import schema
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+
+DefaultCodec = ZSTD if zstandard is not None else ZLIB
+
+# Number of decompressed transforms kept in memory
+CacheSize = 4096
+
+_cache = collections.OrderedDict()
+
+
+def TransformHash(text):
+    ''':return: Hex SHA-256 of the transform text, the TransformBlob key'''
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def Compress(text, codec=None):
+    ''':return: (codec, compressed bytes)'''
+    if codec is None:
+        codec = DefaultCodec
+
+    data = text.encode('utf-8')
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ValueError("The zstandard package is required for %s transform blobs" % ZSTD)
+        return (codec, zstandard.ZstdCompressor().compress(data))
+    elif codec == ZLIB:
+        return (codec, zlib.compress(data))
+
+    raise ValueError("Unknown transform blob codec %s" % codec)
+
+
+def Decompress(codec, data):
+    ''':return: Transform text'''
+    data = bytes(data)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ValueError("The zstandard package is required to read %s transform blobs" % ZSTD)
+        return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+    elif codec == ZLIB:
+        return zlib.decompress(data).decode('utf-8')
+
+    raise ValueError("Unknown transform blob codec %s" % codec)
+
+
+def _WriteDatabase(using):
+    if using is None:
+        return router.db_for_write(models.TransformBlob)
+
+    return using
+
+
+def _ReadDatabase(using):
+    if using is None:
+        return router.db_for_read(models.TransformBlob)
+
+    return using
+
+
+def _Remember(blob_hash, text):
+    _cache[blob_hash] = text
+    if len(_cache) > CacheSize:
+        _cache.popitem(last=False)
+
+
+def _StoreMissing(by_hash, using):
+    '''Store the transforms of a dictionary of hash to text whose hash has no blob'''
+    existing = set()
+    for chunk in partitions.Chunks(by_hash.keys()):
+        existing.update(models.TransformBlob.objects.using(using).filter(hash__in=chunk).values_list('hash', flat=True))
+
+    new_blobs = []
+    for blob_hash in by_hash.keys():
+        if blob_hash in existing:
+            continue
+
+        text = by_hash[blob_hash]
+        (codec, data) = Compress(text)
+        new_blobs.append(models.TransformBlob(hash=blob_hash, codec=codec, length=len(text), data=data))
+
+    try:
+        with transaction.atomic(using=using):
+            models.TransformBlob.objects.using(using).bulk_create(new_blobs)
+    except IntegrityError:
+        # Another writer stored some of the same transforms first
+        for db_blob in new_blobs:
+            if not models.TransformBlob.objects.using(using).filter(hash=db_blob.hash).exists():
+                db_blob.save(using=using)
+
+    return len(new_blobs)
+
+
+def StoreTransforms(texts, using=None):
+    '''Store every distinct transform not already stored.  Call EnsureTransforms after writing the mappings that reference them.
+    :param texts: Iterable of transform text
+    :return: Dictionary of text to TransformBlob hash'''
+    using = _WriteDatabase(using)
+
+    hashes = {}
+    for text in texts:
+        if text not in hashes:
+            hashes[text] = TransformHash(text)
+
+    _StoreMissing(dict([(blob_hash, text) for (text, blob_hash) in hashes.items()]), using)
+    return hashes
+
+
+def EnsureTransforms(hashes, using=None):
+    '''Store again any transform deleted by DeleteUnreferencedTransforms since StoreTransforms returned.
+       Call after writing the mappings that reference the hashes, inside the same transaction.
+       Those writes keep a concurrent purge from deleting the blobs again before the transaction commits.
+    :param hashes: Dictionary of text to hash returned by StoreTransforms
+    :return: Number of transforms stored again'''
+    return _StoreMissing(dict([(blob_hash, text) for (text, blob_hash) in hashes.items()]), _WriteDatabase(using))
+
+
+def StoreTransform(text, using=None):
+    ''':return: TransformBlob hash of the stored transform'''
+    return StoreTransforms([text], using=using)[text]
+
+
+def LoadTransforms(hashes, using=None):
+    '''Read and decompress transforms
+    :return: Dictionary of hash to transform text'''
+    using = _ReadDatabase(using)
+
+    texts = {}
+    missing = []
+    for blob_hash in set(hashes):
+        text = _cache.get(blob_hash, None)
+        if text is None:
+            missing.append(blob_hash)
+        else:
+            texts[blob_hash] = text
+
+    for chunk in partitions.Chunks(missing):
+        for (blob_hash, codec, data) in models.TransformBlob.objects.using(using).filter(hash__in=chunk).values_list('hash', 'codec', 'data'):
+            text = Decompress(codec, data)
+            _Remember(blob_hash, text)
+            texts[blob_hash] = text
+
+    return texts
+
+
+def _Missing(blob_hashes):
+    return ValueError("Transform blobs referenced by mappings are missing: %s" % ", ".join(sorted(blob_hashes)))
+
+
+def LoadTransform(blob_hash, using=None):
+    ''':return: Text of one stored transform'''
+    texts = LoadTransforms([blob_hash], using=using)
+    if blob_hash not in texts:
+        raise _Missing([blob_hash])
+
+    return texts[blob_hash]
+
+
+def ResolveTransforms(pairs, using=None):
+    '''Transform text of mapping rows read with values_list('transform_string', 'transform_blob')
+    :param pairs: Sequence of (transform_string, transform_blob hash or None)
+    :return: List of transform text in the same order'''
+    blob_hashes = set([blob_hash for (transform_string, blob_hash) in pairs if blob_hash is not None])
+    texts = LoadTransforms(blob_hashes, using=using)
+    if len(texts) < len(blob_hashes):
+        raise _Missing(blob_hashes - set(texts.keys()))
+
+    return [transform_string if blob_hash is None else texts[blob_hash] for (transform_string, blob_hash) in pairs]
+
+
+def MigrateTransformStrings(dataset, batch_size=1000):
+    '''Move the transform text of a dataset's mappings into TransformBlob.  Used for databases imported before the table existed.
+    Adds the transform_blob column first if the database predates it.  syncdb must have created the TransformBlob table.
+    :return: Number of mappings moved'''
+    dataset_name = partitions.DatasetName(dataset)
+    using = partitions.DatabaseForDataset(dataset_name)
+    schema.UpgradeSchema(using=using)
+
+    num_moved = 0
+    while True:
+        rows = list(models.Mapping2D.objects.using(using).filter(src_coordinate_space__dataset=dataset_name,
+                                                                 transform_blob__isnull=True).order_by('id').values_list('id', 'transform_string', 'dest_bounding_box__minZ')[:batch_size])
+        if len(rows) == 0:
+            break
+
+        with transaction.atomic(using=using):
+            hashes = StoreTransforms([text for (mapping_id, text, Z) in rows], using=using)
+            mapping_ids = {}
+            for (mapping_id, text, Z) in rows:
+                mapping_ids.setdefault(hashes[text], []).append(mapping_id)
+
+            for (blob_hash, ids) in mapping_ids.items():
+                for chunk in partitions.Chunks(ids):
+                    models.Mapping2D.objects.using(using).filter(id__in=chunk).update(transform_blob=blob_hash, transform_string='')
+
+            EnsureTransforms(hashes, using=using)
+
+            generations.BumpGeneration(dataset_name, [Z for (mapping_id, text, Z) in rows], using=using)
+
+        num_moved += len(rows)
+
+    print("Moved %d transforms of %s into transform blobs" % (num_moved, dataset_name))
+    return num_moved
+
+
+def DeleteUnreferencedTransforms(using=None, hash_list=None):
+    '''Delete blobs no mapping references
+    :param hash_list: Only consider these blobs, all blobs if None
+    :return: Number of blobs deleted'''
+    using = _WriteDatabase(using)
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    blob_table = quote(models.TransformBlob._meta.db_table)
+    blob_hash = "%s.%s" % (blob_table, quote(models.TransformBlob._meta.get_field('hash').column))
+    mapping_table = quote(models.Mapping2D._meta.db_table)
+    sql = "DELETE FROM %s WHERE NOT EXISTS (SELECT 1 FROM %s WHERE %s.%s = %s)" % (
+        blob_table, mapping_table,
+        mapping_table, quote(models.Mapping2D._meta.get_field('transform_blob').column),
+        blob_hash)
+
+    cursor = connection.cursor()
+    try:
+        if hash_list is None:
+            cursor.execute(sql)
+            return cursor.rowcount
+
+        num_deleted = 0
+        for chunk in partitions.Chunks(set(hash_list)):
+            cursor.execute("%s AND %s IN (%s)" % (sql, blob_hash, ", ".join(["%s"] * len(chunk))), chunk)
+            num_deleted += cursor.rowcount
+
+        for blob_hash in hash_list:
+            _cache.pop(blob_hash, None)
+
+        return num_deleted
+    finally:
+        cursor.close()
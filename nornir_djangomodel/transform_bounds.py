@@ -0,0 +1,127 @@
+'''
+Created on Oct 19, 2026
+
+Bounding boxes computed directly from the control points in transform strings.
+
+Building a nornir_imageregistration Mosaic parses every transform into full
+transform objects just so the importer can read FixedBoundingBox and
+MappedBoundingBox.  For grid transforms the control points are read straight
+into NumPy arrays here and reduced with vectorized min/max.  Transforms of
+any other type fall back to the full nornir_imageregistration parser.
+
+Bounds are returned as (minY minX MaxY maxX) lists, the same layout as
+nornir_imageregistration rectangles.
+'''
+
+import numpy
+
+
+def _FallbackBounds(transform_string):
+    '''Bounds from the full nornir_imageregistration transform parser'''
+    import nornir_imageregistration.transforms.factory
+    transform = nornir_imageregistration.transforms.factory.LoadTransform(transform_string)
+    return (list(transform.MappedBoundingBox), list(transform.FixedBoundingBox))
+
+
+def _ParseGridTransform(transform_string):
+    '''Read a GridTransform string.
+
+       The string has the form
+       GridTransform_double_2_2 vp <N> x0 y0 x1 y1 ... fp 7 0 <rows-1> <cols-1> <left> <bottom> <width> <height>
+       where the variable parameters are the control points in the fixed space and the mapped
+       points are a regular grid over the image.
+    :return: (grid_rows, grid_cols, (left, bottom, width, height), Nx2 array of fixed (X, Y) points)
+             or None if the string is not a grid transform we can read
+    '''
+    parts = transform_string.split()
+    if len(parts) == 0 or not parts[0].startswith('GridTransform'):
+        return None
+
+    try:
+        iVP = parts.index('vp')
+        iFP = parts.index('fp')
+    except ValueError:
+        return None
+
+    if iFP < iVP:
+        return None
+
+    fixed_parameters = numpy.array(parts[iFP + 2:], dtype=numpy.float64)
+    if len(fixed_parameters) < 7:
+        return None
+
+    grid_rows = int(fixed_parameters[1]) + 1
+    grid_cols = int(fixed_parameters[2]) + 1
+
+    num_values = int(parts[iVP + 1])
+    points = numpy.array(parts[iVP + 2:iFP], dtype=numpy.float64)
+    if num_values != len(points) or num_values != grid_rows * grid_cols * 2:
+        # Not the layout we expect, let the full parser decide
+        return None
+
+    return (grid_rows, grid_cols, tuple(fixed_parameters[3:7]), points.reshape((-1, 2)))
+
+
+def ParseGridTransformBounds(transform_string):
+    '''Bounds of a GridTransform without building the transform.
+    :return: (mapped_bounds, fixed_bounds) or None if the string is not a grid transform we can read
+    '''
+    grid = _ParseGridTransform(transform_string)
+    if grid is None:
+        return None
+
+    (grid_rows, grid_cols, (left, bottom, width, height), points) = grid
+    mins = points.min(0)
+    maxs = points.max(0)
+
+    fixed_bounds = [float(mins[1]), float(mins[0]), float(maxs[1]), float(maxs[0])]
+    mapped_bounds = [float(bottom), float(left), float(bottom + height), float(left + width)]
+    return (mapped_bounds, fixed_bounds)
+
+
+def ParseGridTransformPoints(transform_string):
+    '''Control points of a GridTransform without building the transform.
+    :return: Nx4 array of (fixedY, fixedX, mappedY, mappedX) rows, the point pair layout of
+             nornir_imageregistration mesh transforms, or None if the string is not a grid transform we can read
+    '''
+    grid = _ParseGridTransform(transform_string)
+    if grid is None:
+        return None
+
+    (grid_rows, grid_cols, (left, bottom, width, height), points) = grid
+
+    # Control points are listed row by row over a regular grid of the image
+    iPoint = numpy.arange(grid_rows * grid_cols)
+    mappedY = bottom + ((iPoint // grid_cols) * (height / max(grid_rows - 1, 1)))
+    mappedX = left + ((iPoint % grid_cols) * (width / max(grid_cols - 1, 1)))
+
+    return numpy.column_stack((points[:, 1], points[:, 0], mappedY, mappedX))
+
+
+def TransformBounds(transform_string):
+    ''':return: (mapped_bounds, fixed_bounds) of a transform string'''
+    bounds = ParseGridTransformBounds(transform_string)
+    if bounds is None:
+        bounds = _FallbackBounds(transform_string)
+
+    return bounds
+
+
+def MosaicBounds(ImageToTransformString):
+    '''Bounds of every tile in a mosaic and of the mosaic as a whole
+    :param dict ImageToTransformString: Tile image name to transform string, as read from a .mosaic file
+    :return: (dictionary of image name to (mapped_bounds, fixed_bounds), mosaic fixed_bounds)'''
+
+    tile_bounds = {}
+    for (name, transform_string) in ImageToTransformString.items():
+        tile_bounds[name] = TransformBounds(transform_string)
+
+    if len(tile_bounds) == 0:
+        return (tile_bounds, None)
+
+    all_fixed = numpy.array([fixed for (mapped, fixed) in tile_bounds.values()], dtype=numpy.float64)
+    mins = all_fixed[:, 0:2].min(0)
+    maxs = all_fixed[:, 2:4].max(0)
+    mosaic_bounds = [float(mins[0]), float(mins[1]), float(maxs[0]), float(maxs[1])]
+
+    return (tile_bounds, mosaic_bounds)
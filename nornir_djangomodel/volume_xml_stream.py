@@ -0,0 +1,403 @@
+'''
+Created on Oct 19, 2026
+
+Streaming reader for VolumeData.xml restricted to a list of sections.
+
+nornir_volumemodel.Load_Xml builds the entire volume before the importer can
+filter by section.  This module walks the XML with iterparse, builds only the
+subtrees of the requested sections, and clears every element once it has
+been processed.  A section index stored beside VolumeData.xml records the
+byte range, or linked file, of each section so later single-section loads
+read only that section.
+
+The objects returned expose the subset of the nornir_volumemodel interface
+used by VolumeXMLImporter: Blocks, Sections, Channels, Filters, TilePyramid,
+Levels, Transforms and Scale.
+'''
+
+import json
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+VolumeXMLFilename = 'VolumeData.xml'
+SectionIndexFilename = 'VolumeData.sections.json'
+SectionIndexVersion = 1
+
+_attribute_regex = re.compile(r'([\w:.-]+)\s*=\s*"([^"]*)"')
+_section_tag_regex = re.compile(rb'<(/?)(Block|Section|Block_Link|Section_Link)(?=[\s/>])([^>]*)>')
+
+
+class XMLNode():
+    '''An element of the volume.  Paths are resolved against the parent chain.'''
+
+    def __init__(self, parent, attrib):
+        self.Parent = parent
+        self.attrib = attrib
+        self.Name = attrib.get('Name', None)
+        self.Path = attrib.get('Path', '')
+
+    @property
+    def RelativePath(self):
+        if self.Parent is None:
+            return ''
+
+        return os.path.join(self.Parent.RelativePath, self.Path)
+
+    @property
+    def FullPath(self):
+        if self.Parent is None:
+            return self.Path
+
+        return os.path.join(self.Parent.FullPath, self.Path)
+
+
+class Volume(XMLNode):
+
+    def __init__(self, attrib, volume_dir):
+        super(Volume, self).__init__(None, attrib)
+        self.Path = volume_dir
+        self.Blocks = []
+
+
+class Block(XMLNode):
+
+    def __init__(self, parent, attrib):
+        super(Block, self).__init__(parent, attrib)
+        self.Sections = []
+
+
+class Section(XMLNode):
+
+    def __init__(self, parent, attrib):
+        super(Section, self).__init__(parent, attrib)
+        self.Number = int(attrib['Number'])
+        self.Channels = []
+
+
+class Channel(XMLNode):
+
+    def __init__(self, parent, attrib):
+        super(Channel, self).__init__(parent, attrib)
+        self.Scale = None
+        self.Filters = {}
+        self.Transforms = {}
+
+
+class Filter(XMLNode):
+
+    def __init__(self, parent, attrib):
+        super(Filter, self).__init__(parent, attrib)
+        self.TilePyramid = None
+        self.ImageSet = None
+
+
+class TilePyramid(XMLNode):
+
+    def __init__(self, parent, attrib):
+        super(TilePyramid, self).__init__(parent, attrib)
+        self.ImageFormatExt = attrib.get('ImageFormatExt', '.png')
+        self.Levels = []
+
+
+class Level(XMLNode):
+
+    def __init__(self, parent, attrib):
+        super(Level, self).__init__(parent, attrib)
+        self.Number = int(float(attrib.get('Downsample', attrib.get('Number', 1))))
+
+
+class Transform(XMLNode):
+    pass
+
+
+class AxisScale():
+
+    def __init__(self, attrib):
+        self.UnitsOfMeasure = attrib.get('UnitsOfMeasure', None)
+        self.UnitsPerPixel = float(attrib['UnitsPerPixel'])
+
+
+class Scale():
+
+    def __init__(self, element):
+        self.X = None
+        self.Y = None
+        self.Z = None
+        for axis in element:
+            if axis.tag in ('X', 'Y', 'Z'):
+                setattr(self, axis.tag, AxisScale(axis.attrib))
+
+
+def _LinkedElementRoot(parent_dir, link_element):
+    '''Load the root element of the VolumeData.xml a *_Link element points to'''
+    linked_path = os.path.join(parent_dir, link_element.attrib['Path'], VolumeXMLFilename)
+    return ElementTree.parse(linked_path).getroot()
+
+
+def _BuildChannel(section, element):
+    channel = Channel(section, element.attrib)
+    for child in element:
+        if child.tag.endswith('_Link'):
+            child = _LinkedElementRoot(channel.FullPath, child)
+
+        if child.tag == 'Scale':
+            channel.Scale = Scale(child)
+        elif child.tag == 'Filter':
+            filter_obj = Filter(channel, child.attrib)
+            for filter_child in child:
+                if filter_child.tag == 'TilePyramid':
+                    pyramid = TilePyramid(filter_obj, filter_child.attrib)
+                    pyramid.Levels = sorted([Level(pyramid, level.attrib) for level in filter_child if level.tag == 'Level'],
+                                            key=lambda level: level.Number)
+                    filter_obj.TilePyramid = pyramid
+            channel.Filters[filter_obj.Name] = filter_obj
+        elif child.tag == 'Transform':
+            transform_obj = Transform(channel, child.attrib)
+            channel.Transforms[transform_obj.Name] = transform_obj
+
+    return channel
+
+
+def _BuildSection(block, element):
+    section = Section(block, element.attrib)
+    for child in element:
+        if child.tag == 'Channel_Link':
+            child = _LinkedElementRoot(section.FullPath, child)
+
+        if child.tag == 'Channel':
+            section.Channels.append(_BuildChannel(section, child))
+
+    return section
+
+
+def _ParseAttributes(attribute_text):
+    return dict(_attribute_regex.findall(attribute_text))
+
+
+def _ReadRootAttributes(xml_path, tag):
+    '''Read the attributes of the first element with the given tag without parsing the file'''
+    with open(xml_path, 'rb') as xml_file:
+        head = xml_file.read(8192).decode('utf-8', 'replace')
+
+    match = re.search(r'<%s(?=[\s/>])([^>]*)>' % tag, head)
+    if match is None:
+        return None
+
+    return _ParseAttributes(match.group(1))
+
+
+def _LinkedBlockAttributes(link_attrib, linked_root_attrib):
+    '''Attributes of a linked block.  The link decides where the block lives relative to the volume.'''
+    attrib = dict(linked_root_attrib or {})
+    attrib['Path'] = link_attrib['Path']
+    return attrib
+
+
+def _IndexVolumeFile(xml_path, block_attrib, sections):
+    '''Scan one XML file for Section elements and links, recording where each section is stored.
+    :param dict block_attrib: Attributes of the enclosing block if the file is the target of a Block_Link'''
+    with open(xml_path, 'rb') as xml_file:
+        data = xml_file.read()
+
+    xml_dir = os.path.dirname(xml_path)
+    linked_block = block_attrib is not None
+    section_start = None
+    section_attrib = None
+
+    for match in _section_tag_regex.finditer(data):
+        (closing, tag, attribute_text) = (match.group(1), match.group(2).decode('ascii'), match.group(3).decode('utf-8', 'replace'))
+        self_closing = attribute_text.rstrip().endswith('/')
+
+        if tag == 'Block' and not closing:
+            if not linked_block:
+                block_attrib = _ParseAttributes(attribute_text)
+        elif tag == 'Block_Link':
+            attrib = _ParseAttributes(attribute_text)
+            linked_path = os.path.join(xml_dir, attrib['Path'], VolumeXMLFilename)
+            _IndexVolumeFile(linked_path, _LinkedBlockAttributes(attrib, _ReadRootAttributes(linked_path, 'Block')), sections)
+        elif tag == 'Section_Link':
+            attrib = _ParseAttributes(attribute_text)
+            block_dir = xml_dir if linked_block else os.path.join(xml_dir, block_attrib.get('Path', ''))
+            linked_path = os.path.join(block_dir, attrib['Path'], VolumeXMLFilename)
+            linked_attrib = _ReadRootAttributes(linked_path, 'Section')
+            sections[int(linked_attrib['Number'])] = {'block': block_attrib,
+                                                      'link': attrib,
+                                                      'file': linked_path,
+                                                      'start': None,
+                                                      'end': None}
+        elif tag == 'Section' and not closing:
+            section_start = match.start()
+            section_attrib = _ParseAttributes(attribute_text)
+            if self_closing:
+                section_start = None
+        elif tag == 'Section' and closing and section_start is not None:
+            sections[int(section_attrib['Number'])] = {'block': block_attrib,
+                                                       'link': None,
+                                                       'file': xml_path,
+                                                       'start': section_start,
+                                                       'end': match.end()}
+            section_start = None
+
+    return sections
+
+
+def _FileStamp(xml_path):
+    stat = os.stat(xml_path)
+    return [stat.st_mtime, stat.st_size]
+
+
+def BuildSectionIndex(volume_xml_path):
+    '''Scan the volume and write the section index beside VolumeData.xml
+    :return: The index dictionary'''
+    sections = _IndexVolumeFile(volume_xml_path, None, {})
+
+    stamps = {}
+    for entry in sections.values():
+        stamps[entry['file']] = _FileStamp(entry['file'])
+    stamps[volume_xml_path] = _FileStamp(volume_xml_path)
+
+    index = {'version': SectionIndexVersion,
+             'volume': _ReadRootAttributes(volume_xml_path, 'Volume'),
+             'files': stamps,
+             'sections': dict([(str(number), entry) for (number, entry) in sections.items()])}
+
+    index_path = os.path.join(os.path.dirname(volume_xml_path), SectionIndexFilename)
+    try:
+        with open(index_path, 'w') as index_file:
+            json.dump(index, index_file)
+    except (IOError, OSError):
+        print("Unable to save section index: %s" % index_path)
+
+    return index
+
+
+def ReadOrBuildSectionIndex(volume_xml_path):
+    '''Load the section index, rebuilding it if any indexed XML file changed since it was written'''
+    index_path = os.path.join(os.path.dirname(volume_xml_path), SectionIndexFilename)
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, 'r') as index_file:
+                index = json.load(index_file)
+
+            if index.get('version', None) == SectionIndexVersion and \
+               all([os.path.exists(path) and _FileStamp(path) == stamp for (path, stamp) in index['files'].items()]):
+                return index
+        except ValueError:
+            pass
+
+    return BuildSectionIndex(volume_xml_path)
+
+
+def _ReadSectionElement(entry):
+    if entry['start'] is None:
+        return ElementTree.parse(entry['file']).getroot()
+
+    with open(entry['file'], 'rb') as xml_file:
+        xml_file.seek(entry['start'])
+        return ElementTree.fromstring(xml_file.read(entry['end'] - entry['start']))
+
+
+def LoadVolumeSections(volume_xml_path, section_list):
+    '''Build a volume containing only the requested sections, using the section index
+    :param str volume_xml_path: Path to VolumeData.xml
+    :param section_list: Section numbers to load
+    :return: Volume'''
+    index = ReadOrBuildSectionIndex(volume_xml_path)
+    volume = Volume(index['volume'] or {}, os.path.dirname(volume_xml_path))
+
+    blocks = {}
+    for number in sorted(set(section_list)):
+        entry = index['sections'].get(str(number), None)
+        if entry is None:
+            continue
+
+        block_attrib = entry['block'] or {}
+        block_key = block_attrib.get('Name', None)
+        block = blocks.get(block_key, None)
+        if block is None:
+            block = Block(volume, block_attrib)
+            blocks[block_key] = block
+            volume.Blocks.append(block)
+
+        section_element = _ReadSectionElement(entry)
+        section = _BuildSection(block, section_element)
+        if entry['link'] is not None:
+            section.Path = entry['link'].get('Path', section.Path)
+
+        block.Sections.append(section)
+
+    return volume
+
+
+def IterateSections(volume_xml_path, section_list=None):
+    '''Stream the sections of a volume with iterparse, building only the requested sections.
+       Processed elements are cleared and detached so memory use is bounded by one section.
+    :param section_list: Section numbers to build, or None for every section
+    :return: Generator of (Volume, Block, Section) tuples.  Each section is appended to its block as it is yielded.'''
+
+    if section_list is not None:
+        section_list = frozenset(section_list)
+
+    volume_dir = os.path.dirname(volume_xml_path)
+    volume = None
+    block = None
+    stack = []
+
+    for (event, element) in ElementTree.iterparse(volume_xml_path, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'Volume':
+                volume = Volume(element.attrib, volume_dir)
+            elif element.tag == 'Block':
+                block = Block(volume, element.attrib)
+                volume.Blocks.append(block)
+
+            stack.append(element)
+            continue
+
+        stack.pop()
+
+        if element.tag == 'Section' or element.tag == 'Section_Link':
+            section_element = element
+            if element.tag == 'Section_Link':
+                section_element = _LinkedElementRoot(block.FullPath, element)
+
+            if section_list is None or int(section_element.attrib['Number']) in section_list:
+                section = _BuildSection(block, section_element)
+                if element.tag == 'Section_Link':
+                    section.Path = element.attrib['Path']
+
+                block.Sections.append(section)
+                yield (volume, block, section)
+
+        elif element.tag == 'Block_Link':
+            linked_block = _LinkedElementRoot(volume_dir, element)
+            block = Block(volume, _LinkedBlockAttributes(element.attrib, linked_block.attrib))
+            volume.Blocks.append(block)
+            for child in linked_block:
+                if child.tag == 'Section_Link':
+                    child = _LinkedElementRoot(block.FullPath, child)
+
+                if child.tag == 'Section' and (section_list is None or int(child.attrib['Number']) in section_list):
+                    section = _BuildSection(block, child)
+                    block.Sections.append(section)
+                    yield (volume, block, section)
+        else:
+            continue
+
+        element.clear()
+        if len(stack) > 0:
+            stack[-1].remove(element)
+
+
+def LoadVolume(volume_xml_path, section_list=None):
+    '''Stream the volume and return it with only the requested sections populated'''
+    volume = None
+    for (volume, block, section) in IterateSections(volume_xml_path, section_list):
+        pass
+
+    if volume is None:
+        attrib = _ReadRootAttributes(volume_xml_path, 'Volume') or {}
+        volume = Volume(attrib, os.path.dirname(volume_xml_path))
+
+    return volume
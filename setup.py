@@ -21,7 +21,8 @@ if __name__ == '__main__':
 
     packages = find_packages()
 
-    install_requires = ["nornir_volumemodel>=1.2.0",
+    install_requires = ["numpy",
+                        "nornir_volumemodel>=1.2.0",
                         "nornir_imageregistration>=1.2.0"]
 
     dependency_links = ["git+http://github.com/nornir/nornir-imageregistration#egg=nornir_imageregistration-1.2.0",
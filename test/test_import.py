@@ -1,9 +1,25 @@
 import test.test_base
 import os
 from django.core.management import call_command
+from django.db import connections, router
 from nornir_djangomodel import import_xml
 
+from nornir_djangomodel import bulk_load
+from nornir_djangomodel import bulk_sql
+from nornir_djangomodel import composed_transforms
+from nornir_djangomodel import generations
+from nornir_djangomodel import inverse_lookup
+from nornir_djangomodel import keyset
 from nornir_djangomodel import models
+from nornir_djangomodel import partitions
+from nornir_djangomodel import profiling
+from nornir_djangomodel import section_extents
+from nornir_djangomodel import staging
+from nornir_djangomodel import tile_adjacency
+from nornir_djangomodel import tile_grid
+from nornir_djangomodel import tile_index
+from nornir_djangomodel import transform_blobs
+import nornir_djangomodel.settings as settings
 
 
 class ImportVolumeXMLTestCase(test.test_base.PlatformTest):
@@ -37,6 +53,448 @@ class ImportSubVolume(ImportVolumeXMLTestCase):
         self.assertEqual(len(vlist), 1, "Only one volume expected")
         self.assertEqual(vlist[0].path, self.ImportedDataPath)
 
+    def test_replace_section(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        num_data = models.Data2D.objects.count()
+        num_mappings = models.Mapping2D.objects.count()
+
+        deleted = import_xml.VolumeXMLImporter.ReplaceSection(self.VolumeXMLFullPath, 691)
+        self.assertEqual(deleted['Data2D'], num_data, "Every Data2D row of the section should be purged")
+        self.assertEqual(deleted['Mapping2D'], num_mappings, "Every Mapping2D row of the section should be purged")
+
+        self.assertEqual(models.Data2D.objects.count(), num_data, "Replacing a section should not change the number of rows")
+        self.assertEqual(models.Mapping2D.objects.count(), num_mappings, "Replacing a section should not change the number of rows")
+
+    def test_resume_import(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        num_checkpoints = models.ImportCheckpoint.objects.count()
+        num_mappings = models.Mapping2D.objects.count()
+        self.assertGreater(num_checkpoints, 0, "Completed tasks should be checkpointed")
+
+        # Pretend the import died before the mosaics were written
+        mosaic_checkpoints = models.ImportCheckpoint.objects.filter(task_key__contains='.mosaic.')
+        mosaic_checkpoints.delete()
+        models.Mapping2D.objects.all().delete()
+
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], resume=True)
+        self.assertEqual(models.ImportCheckpoint.objects.count(), num_checkpoints, "Resume should checkpoint only the unfinished tasks")
+        self.assertEqual(models.Mapping2D.objects.count(), num_mappings, "Resume should import the unfinished mosaics")
+
+    def test_dry_run(self):
+        changeset = import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], dry_run=True)
+        self.assertEqual(models.Data2D.objects.count(), 0, "Dry run should not write to the database")
+        self.assertEqual(models.Dataset.objects.count(), 0, "Dry run should not write to the database")
+
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        self.assertEqual(changeset.counts['Data2D']['create'], models.Data2D.objects.count())
+        self.assertEqual(changeset.counts['Mapping2D']['create'], models.Mapping2D.objects.count())
+        self.assertEqual(changeset.counts['CoordSpace']['create'], models.CoordSpace.objects.count(), "Tile and mosaic coordinate spaces should be counted")
+
+        diff_path = os.path.join(self.TestOutputPath, 'reimport.diff')
+        changeset = import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], dry_run=True, diff_path=diff_path)
+        self.assertEqual(changeset.counts['Data2D']['create'], 0, "Reimporting should not create new Data2D rows")
+        self.assertEqual(changeset.counts['Data2D']['unchanged'], models.Data2D.objects.count())
+        self.assertEqual(changeset.counts['CoordSpace']['create'], 0)
+        self.assertEqual(changeset.counts['CoordSpace']['unchanged'], models.CoordSpace.objects.count())
+        self.assertTrue(os.path.exists(diff_path))
+
+    def test_section_extents(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691, 692])
+
+        for db_extent in models.SectionExtent.objects.filter(span=1):
+            expected = section_extents.SectionRangeExtent(db_extent.dataset, db_extent.coord_space, db_extent.start, db_extent.start)
+            self.assertEqual(db_extent.as_tuple(), expected)
+
+            volume_extent = section_extents.VolumeExtent(db_extent.dataset, db_extent.coord_space)
+            db_bounds = db_extent.coord_space.bounds
+            self.assertEqual(volume_extent, (db_bounds.minY, db_bounds.minX, db_bounds.maxY, db_bounds.maxX), "Volume extent should match the mosaic coordinate space bounds")
+
+        num_extents = models.SectionExtent.objects.count()
+        self.assertGreater(num_extents, 0)
+        section_extents.RebuildSectionExtents(models.Dataset.objects.all()[0])
+        self.assertEqual(models.SectionExtent.objects.count(), num_extents, "Rebuild should produce the same summary rows")
+
+    def test_tile_index(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+
+        index_path = os.path.join(self.TestOutputPath, 'tiles.idx')
+        num_tiles = tile_index.ExportTileIndex(models.Dataset.objects.all()[0], index_path)
+        self.assertEqual(num_tiles, models.Data2D.objects.count())
+
+        with tile_index.TileIndex(index_path) as index:
+            self.assertEqual(index.NumTiles, num_tiles)
+            for db_data in models.Data2D.objects.select_related('filter'):
+                (tile_number, ext) = os.path.splitext(db_data.name)
+                found = index.Find(691, db_data.filter.channel_id, db_data.filter.name, db_data.level, int(tile_number))
+                self.assertEqual(found, (db_data.relative_path, db_data.width, db_data.height))
+
+            self.assertIsNone(index.Find(692, db_data.filter.channel_id, db_data.filter.name, db_data.level, int(tile_number)), "Section 692 was not imported")
+
+        # Tiles imported before the identity columns existed cannot be placed in a section
+        models.CoordSpace.objects.filter(section_number=691).update(section_number=None)
+        with self.assertRaises(ValueError):
+            tile_index.ExportTileIndex(models.Dataset.objects.all()[0], index_path)
+
+        with tile_index.TileIndex(index_path) as index:
+            self.assertEqual(index.NumTiles, num_tiles, "A failed export should leave the previous index in place")
+
+    def test_read_rows(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+
+        data_rows = list(models.Data2D.objects.ForSection(691).Rows())
+        self.assertEqual(len(data_rows), models.Data2D.objects.count())
+
+        evaluated = models.Data2D.objects.ForSection(691)
+        self.assertEqual(len(evaluated), evaluated.count(), "count() of an evaluated queryset should use its results")
+        for row in data_rows:
+            db_data = models.Data2D.objects.get(relative_path=row.relative_path)
+            self.assertEqual((row.width, row.height, row.level, row.coord_space_id), (db_data.width, db_data.height, db_data.level, db_data.coord_space_id))
+
+        for row in models.Mapping2D.objects.ForSection(691).Rows():
+            db_mapping = models.Mapping2D.objects.get(id=row.id)
+            self.assertEqual(row.transform_string, db_mapping.transform)
+            self.assertEqual(row.dest_bounding_box.as_tuple(), db_mapping.dest_bounding_box.as_tuple())
+            self.assertEqual(row.Z, 691)
+
+    def test_coord_space_identity(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+
+        tile_spaces = models.CoordSpace.objects.ForSection(691)
+        self.assertGreater(tile_spaces.count(), 0)
+        for db_coordspace in tile_spaces:
+            self.assertEqual(db_coordspace.kind, models.CoordSpace.TILE)
+            self.assertEqual(db_coordspace.name, models.CoordSpace.SectionChannelName(691, db_coordspace.channel_id, 'Tile%d' % db_coordspace.tile_number))
+
+        expected = sorted(models.CoordSpace.objects.values_list('name', 'kind', 'section_number', 'channel', 'tile_number'))
+
+        # Simulate a database imported before the identity columns existed
+        models.CoordSpace.objects.update(kind=None, section_number=None, channel=None, tile_number=None)
+        dataset_name = models.Dataset.objects.get().name
+        generation = generations.CurrentGeneration(dataset_name)
+        bulk_sql.BackfillCoordSpaceIdentity(dataset_name)
+        self.assertEqual(sorted(models.CoordSpace.objects.values_list('name', 'kind', 'section_number', 'channel', 'tile_number')), expected)
+        self.assertGreater(generations.CurrentGeneration(dataset_name), generation, "Backfilling should advance the dataset generation")
+
+        generation = generations.CurrentGeneration(dataset_name)
+        self.assertEqual(bulk_sql.BackfillCoordSpaceIdentity(dataset_name), 0, "Backfilled spaces should not be picked again")
+        self.assertEqual(generations.CurrentGeneration(dataset_name), generation)
+
+    def test_profile_import(self):
+        baseline_path = os.path.join(self.TestOutputPath, 'profile_baseline')
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], profile=baseline_path)
+        self.assertTrue(os.path.exists(os.path.join(baseline_path, 'import.profile')))
+
+        report = profiling.LoadReport(baseline_path)
+        self.assertEqual(list(report['phases'].keys()), list(profiling.ImportPhases))
+        self.assertGreater(sum([count for (count, seconds) in report['phases']['tiles']['sql'].values()]), 0, "Tile import should record SQL statements")
+
+        sampled_path = os.path.join(self.TestOutputPath, 'profile_sampled')
+        profiler = profiling.ImportProfiler(sampled_path, mode=profiling.SAMPLING, phases=['mosaics'])
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], profile=profiler)
+        self.assertEqual(list(profiler.phases.keys()), ['mosaics'])
+        self.assertTrue(os.path.exists(os.path.join(sampled_path, 'mosaics.samples')))
+
+        comparison = profiling.CompareReports(baseline_path, sampled_path)
+        self.assertIn('mosaics', comparison)
+
+    def test_bulk_import(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], bulk=True)
+        num_data = models.Data2D.objects.count()
+        num_mappings = models.Mapping2D.objects.count()
+        self.assertGreater(num_mappings, 0)
+
+        with bulk_load.BulkLoad() as loader:
+            self.assertGreater(len(loader.dropped_indexes), 0, "Bulk load should drop the BoundingBox indexes")
+
+        self.assertEqual(len(loader.dropped_indexes), 0, "Every dropped index should be rebuilt")
+
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        self.assertEqual(models.Data2D.objects.count(), num_data, "Bulk and normal imports should produce the same rows")
+        self.assertEqual(models.Mapping2D.objects.count(), num_mappings, "Bulk and normal imports should produce the same rows")
+
+    def test_generations(self):
+        with generations.Subscription() as subscription:
+            import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+            dataset_name = models.Dataset.objects.get().name
+            imported = generations.CurrentGeneration(dataset_name)
+            self.assertGreater(imported, 0, "An import should advance the dataset generation")
+            self.assertEqual(generations.ChangedSections(dataset_name, 0), [691])
+            self.assertGreater(len(subscription.Drain()), 0, "Subscribers should be told about the import")
+
+            bulk_sql.PurgeSection(dataset_name, 691)
+            self.assertEqual(generations.ChangedSections(dataset_name, imported), [691])
+            (event_dataset, event_generation, event_sections) = subscription.Get(timeout=1)
+            self.assertEqual(event_dataset, dataset_name)
+            self.assertEqual(event_sections, [691])
+            self.assertEqual(event_generation, generations.CurrentGeneration(dataset_name))
+
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        self.assertIsNone(subscription.Get(timeout=0), "Unsubscribed queues should not receive events")
+
+    def test_composed_transforms(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        dataset_name = models.Dataset.objects.get().name
+        self.assertEqual(composed_transforms.StaleSections(dataset_name), [691])
+
+        num_written = composed_transforms.MaterializeComposedTransforms(dataset_name)
+        self.assertEqual(num_written, models.Mapping2D.objects.count(), "Without onward mappings each tile mapping is composed once")
+        self.assertEqual(composed_transforms.StaleSections(dataset_name), [])
+        self.assertEqual(composed_transforms.MaterializeComposedTransforms(dataset_name), 0, "Unchanged sections should not be recomposed")
+
+        for db_mapping in models.Mapping2D.objects.all()[:10]:
+            composed = composed_transforms.ComposedTransformFor(dataset_name, db_mapping.src_coordinate_space, db_mapping.dest_coordinate_space)
+            self.assertIsNotNone(composed)
+            self.assertEqual(composed.num_mappings, 1)
+            self.assertEqual(len(composed_transforms.DecodePoints(composed.points)), composed.num_points)
+            box = db_mapping.dest_bounding_box
+            for (composed_value, box_value) in zip(composed.as_tuple(), (box.minY, box.minX, box.maxY, box.maxX)):
+                self.assertAlmostEqual(composed_value, box_value, msg="Composed bounds should match the mapping's destination bounds")
+
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        self.assertEqual(composed_transforms.StaleSections(dataset_name), [691], "A re-import should mark the section stale")
+
+    def test_inverse_lookup(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        dataset_name = models.Dataset.objects.get().name
+
+        db_mapping = models.Mapping2D.objects.ForSection(691)[0]
+        box = db_mapping.dest_bounding_box
+        center = ((box.minY + box.maxY) / 2.0, (box.minX + box.maxX) / 2.0)
+        outside = (box.minY - 1000000.0, box.minX - 1000000.0)
+
+        hits = inverse_lookup.SourcePoints(dataset_name, db_mapping.dest_coordinate_space, 691, [center, outside])
+        hits = dict([(hit.tile_space, hit) for hit in hits])
+        self.assertIn(db_mapping.src_coordinate_space_id, hits, "The tile whose bounds hold the point should cover it")
+
+        hit = hits[db_mapping.src_coordinate_space_id]
+        self.assertEqual(list(hit.indices), [0], "Points outside every tile should not be reported")
+        src_box = db_mapping.src_bounding_box
+        self.assertTrue(src_box.minY - 1 <= hit.source_points[0][0] <= src_box.maxY + 1)
+        self.assertTrue(src_box.minX - 1 <= hit.source_points[0][1] <= src_box.maxX + 1)
+
+        regions = inverse_lookup.SourceRegions(dataset_name, db_mapping.dest_coordinate_space, 691,
+                                               (center[0] - 1, center[1] - 1, center[0] + 1, center[1] + 1))
+        self.assertIn(db_mapping.src_coordinate_space_id, [region.tile_space for region in regions])
+
+    def test_tile_adjacency(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        dataset_name = models.Dataset.objects.get().name
+        num_rows = models.TileAdjacency.objects.count()
+        self.assertGreater(num_rows, 0, "Mosaic tiles overlap their neighbors")
+        self.assertEqual(num_rows % 2, 0, "Each pair is stored in both directions")
+
+        db_adjacency = models.TileAdjacency.objects.all()[0]
+        neighbors = tile_adjacency.Neighbors(dataset_name, db_adjacency.tile_space, db_adjacency.coord_space)
+        self.assertIn(db_adjacency.neighbor_space_id, [neighbor[0] for neighbor in neighbors])
+        self.assertIn(db_adjacency.tile_space_id, [neighbor[0] for neighbor in tile_adjacency.Neighbors(dataset_name, db_adjacency.neighbor_space)])
+
+        self.assertEqual(tile_adjacency.RebuildTileAdjacency(dataset_name) * 2, num_rows, "Rebuilding should find the pairs the importer stored")
+
+    def test_tile_grid(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        dataset_name = models.Dataset.objects.get().name
+
+        db_grid = models.TileGrid.objects.get(section_number=691)
+        db_filter = models.Data2D.objects.ForSection(691)[0].filter
+        levels = tile_grid.TileLevels(dataset_name, 691, db_filter.channel_id, db_filter.name)
+        self.assertGreater(len(levels), 0)
+
+        num_tiles = models.Mapping2D.objects.filter(dest_coordinate_space=db_grid.coord_space).count()
+        everything = (db_grid.originY - 1, db_grid.originX - 1,
+                      db_grid.originY + (db_grid.num_rows * db_grid.cell_size), db_grid.originX + (db_grid.num_columns * db_grid.cell_size))
+        (level, tiles) = tile_grid.TilesInViewport(dataset_name, db_grid.coord_space, 691, everything, levels[-1], db_filter.channel_id, db_filter.name)
+        self.assertEqual(level, levels[-1], "A coarse viewport should use the coarsest level")
+        self.assertEqual(len(tiles), num_tiles, "A viewport over the whole section should return every tile")
+        self.assertTrue(all([row.level == level for (bounds, row) in tiles]))
+
+        # Split the tile lookup into one query per tile, as a viewport over more tiles than the parameter limit would be
+        Chunks = partitions.Chunks
+        partitions.Chunks = lambda items: Chunks(items, 1)
+        try:
+            (chunked_level, chunked_tiles) = tile_grid.TilesInViewport(dataset_name, db_grid.coord_space, 691, everything, levels[-1], db_filter.channel_id, db_filter.name)
+        finally:
+            partitions.Chunks = Chunks
+
+        self.assertEqual([(bounds, row.relative_path) for (bounds, row) in chunked_tiles], [(bounds, row.relative_path) for (bounds, row) in tiles])
+
+        corner = (db_grid.originY, db_grid.originX, db_grid.originY + 1, db_grid.originX + 1)
+        (level, tiles) = tile_grid.TilesInViewport(dataset_name, db_grid.coord_space, 691, corner, 0.5, db_filter.channel_id, db_filter.name)
+        self.assertEqual(level, levels[0], "Zooming past full resolution should use the finest level")
+        self.assertGreater(len(tiles), 0)
+        self.assertLess(len(tiles), num_tiles, "A small viewport should only return the tiles under it")
+
+    def test_transform_blobs(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+
+        num_mappings = models.Mapping2D.objects.count()
+        num_blobs = models.TransformBlob.objects.count()
+        self.assertGreater(num_blobs, 0)
+        self.assertLessEqual(num_blobs, num_mappings, "Each distinct transform should be stored once")
+
+        for db_mapping in models.Mapping2D.objects.all():
+            self.assertEqual(db_mapping.transform_string, '')
+            self.assertEqual(transform_blobs.TransformHash(db_mapping.transform), db_mapping.transform_blob_id)
+
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+        self.assertEqual(models.TransformBlob.objects.count(), num_blobs, "Re-importing unchanged transforms should not store them again")
+
+        # Simulate mappings imported before transform blobs existed
+        dataset_name = models.Dataset.objects.get().name
+        expected = dict([(db_mapping.id, db_mapping.transform) for db_mapping in models.Mapping2D.objects.all()])
+        for (mapping_id, text) in expected.items():
+            models.Mapping2D.objects.filter(id=mapping_id).update(transform_string=text, transform_blob=None)
+
+        generation = generations.CurrentGeneration(dataset_name)
+        self.assertEqual(transform_blobs.MigrateTransformStrings(dataset_name), num_mappings)
+        self.assertEqual(dict([(db_mapping.id, db_mapping.transform) for db_mapping in models.Mapping2D.objects.all()]), expected)
+        self.assertEqual(generations.ChangedSections(dataset_name, generation), [691], "Moving transforms should advance the generation of their sections")
+
+        # A purge deleting a blob after StoreTransforms found it
+        text = db_mapping.transform
+        hashes = transform_blobs.StoreTransforms([text])
+        models.Mapping2D.objects.filter(transform_blob=hashes[text]).update(transform_blob=None, transform_string=text)
+        transform_blobs.DeleteUnreferencedTransforms(hash_list=hashes.values())
+        self.assertFalse(models.TransformBlob.objects.filter(hash=hashes[text]).exists())
+        with self.assertRaises(ValueError):
+            transform_blobs.ResolveTransforms([('', hashes[text])])
+
+        models.Mapping2D.objects.filter(transform_string=text).update(transform_blob=hashes[text], transform_string='')
+        self.assertEqual(transform_blobs.EnsureTransforms(hashes), 1, "EnsureTransforms should store the deleted blob again")
+        self.assertEqual(transform_blobs.ResolveTransforms([('', hashes[text])]), [text])
+
+        for codec in (transform_blobs.ZLIB, transform_blobs.DefaultCodec):
+            (codec, data) = transform_blobs.Compress(db_mapping.transform, codec)
+            self.assertEqual(transform_blobs.Decompress(codec, data), db_mapping.transform)
+
+    def test_keyset(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691])
+
+        expected = list(models.Data2D.objects.order_by('relative_path').values_list('relative_path', flat=True))
+        self.assertGreater(len(expected), 3)
+
+        pages = list(keyset.RowPages(models.Data2D.objects.all(), page_size=3))
+        self.assertTrue(all([len(page) <= 3 for page in pages]))
+        self.assertEqual([row.relative_path for page in pages for row in page], expected, "Pages should cover every row once in key order")
+        self.assertEqual([obj.relative_path for obj in keyset.Stream(models.Data2D.objects.all(), page_size=3)], expected)
+        self.assertEqual([row.relative_path for row in models.Data2D.objects.Stream(page_size=3)], expected)
+
+        boxes = models.BoundingBox.objects.ForSection(691)
+        batches = list(keyset.RecordBatches(boxes, ('minX', 'maxX'), page_size=3))
+        self.assertEqual(sum([len(batch) for batch in batches]), boxes.count())
+        self.assertEqual(max([batch['maxX'].max() for batch in batches]), max(boxes.values_list('maxX', flat=True)))
+
+        with self.assertRaises(ValueError):
+            list(keyset.Stream(models.Data2D.objects.all()[:2]))
+
+    def test_staged_import_requires_dataset_database(self):
+        # The test database is shared by every dataset, so there is no file or schema to swap
+        with self.assertRaises(ValueError):
+            import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], staged=True)
+
+        self.assertEqual(models.Data2D.objects.count(), 0, "A refused staged import should not write to the database")
+
+class StagedImport(ImportVolumeXMLTestCase):
+    '''Staged imports into a dataset with its own SQLite file'''
+
+    Alias = 'staged_dataset'
+
+    def setUp(self):
+        super(StagedImport, self).setUp()
+
+        self.DatasetName = import_xml.VolumeXMLImporter._LoadVolume(self.VolumeXMLFullPath, None).Name
+        self.DatabasePath = os.path.join(self.TestOutputPath, 'staged_dataset.sqlite3')
+
+        staging._AddAlias(StagedImport.Alias, dict(connections['default'].settings_dict, NAME=self.DatabasePath))
+        settings.NORNIR_DJANGOMODEL_DATASET_DATABASES[self.DatasetName] = StagedImport.Alias
+        self._routers = router.routers
+        router.routers = [partitions.DatasetRouter()]
+
+    def tearDown(self):
+        router.routers = self._routers
+        del settings.NORNIR_DJANGOMODEL_DATASET_DATABASES[self.DatasetName]
+        staging._RemoveAlias(StagedImport.Alias)
+
+        super(StagedImport, self).tearDown()
+
+    def LiveData(self, section_number):
+        ''':return: Number of Data2D rows of a section in the published database'''
+        return models.Data2D.objects.using(StagedImport.Alias).filter(coord_space__section_number=section_number).count()
+
+    def test_publish_and_rollback(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], staged=True)
+        num_data = self.LiveData(691)
+        self.assertGreater(num_data, 0, "Publishing should make the first import live")
+        self.assertEqual(models.Data2D.objects.using('default').count(), 0, "A dataset with its own database should not write to the default database")
+
+        # Record what readers of the live database see while the import runs
+        live_during_import = []
+        AddChannelDetails = import_xml.VolumeXMLImporter.AddChannelDetails
+
+        def RecordLive(importer_obj, *args, **kwargs):
+            live_during_import.append(self.LiveData(692))
+            self.assertNotEqual(importer_obj.db_alias, StagedImport.Alias, "The import should write to the staging copy")
+            return AddChannelDetails(importer_obj, *args, **kwargs)
+
+        import_xml.VolumeXMLImporter.AddChannelDetails = RecordLive
+        try:
+            import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[692], staged=True)
+        finally:
+            import_xml.VolumeXMLImporter.AddChannelDetails = AddChannelDetails
+
+        self.assertEqual(live_during_import, [0], "The live database should not change before the import is published")
+        self.assertGreater(self.LiveData(692), 0, "Publishing should make the imported section live")
+        self.assertEqual(self.LiveData(691), num_data)
+
+        staging.RollbackDataset(self.DatasetName)
+        self.assertEqual(self.LiveData(692), 0, "Rolling back should restore the database before the last import")
+        self.assertEqual(self.LiveData(691), num_data)
+
+    def test_failed_import_leaves_live_untouched(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], staged=True)
+        num_data = self.LiveData(691)
+
+        AddChannelDetails = import_xml.VolumeXMLImporter.AddChannelDetails
+
+        def Fail(importer_obj, *args, **kwargs):
+            raise RuntimeError("Simulated import failure")
+
+        import_xml.VolumeXMLImporter.AddChannelDetails = Fail
+        try:
+            with self.assertRaises(RuntimeError):
+                import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[692], staged=True)
+        finally:
+            import_xml.VolumeXMLImporter.AddChannelDetails = AddChannelDetails
+
+        self.assertEqual(self.LiveData(691), num_data)
+        self.assertEqual(self.LiveData(692), 0, "A failed staged import should leave the live database untouched")
+        self.assertFalse(os.path.exists(self.DatabasePath + '.staging'), "A failed staged import should discard its staging copy")
+        self.assertNotIn(StagedImport.Alias + '__staging', connections.databases)
+
+    def test_publish_refuses_lost_writes(self):
+        import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[691], staged=True)
+        num_data = self.LiveData(691)
+
+        AddChannelDetails = import_xml.VolumeXMLImporter.AddChannelDetails
+
+        def WriteLive(importer_obj, *args, **kwargs):
+            # Committed to the live database after the staging copy was made
+            models.Dataset.objects.using(StagedImport.Alias).filter(name=self.DatasetName).update(path='written during import')
+            return AddChannelDetails(importer_obj, *args, **kwargs)
+
+        import_xml.VolumeXMLImporter.AddChannelDetails = WriteLive
+        try:
+            with self.assertRaises(ValueError):
+                import_xml.VolumeXMLImporter.Import(self.VolumeXMLFullPath, section_list=[692], staged=True)
+        finally:
+            import_xml.VolumeXMLImporter.AddChannelDetails = AddChannelDetails
+
+        self.assertEqual(models.Dataset.objects.using(StagedImport.Alias).get(name=self.DatasetName).path, 'written during import', "Refusing to publish should keep writes to the live database")
+        self.assertEqual(self.LiveData(691), num_data)
+        self.assertEqual(self.LiveData(692), 0)
+        self.assertFalse(os.path.exists(self.DatabasePath + '.staging'), "A refused publish should discard its staging copy")
+        for suffix in ('-wal', '-shm'):
+            self.assertFalse(os.path.exists(self.DatabasePath + '.staging' + suffix))
+
 class ImportFullVolume(ImportVolumeXMLTestCase):
 
     def test_import_volumexml(self):
@@ -0,0 +1,39 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import unittest
+
+from nornir_djangomodel import import_plan
+from nornir_djangomodel import volume_xml_stream
+
+import test.test_volume_xml_stream
+
+
+class TestImportPlan(test.test_volume_xml_stream.VolumeXMLTestBase):
+
+    def test_plan(self):
+        volume = volume_xml_stream.LoadVolume(self.VolumeXMLPath)
+        plan = import_plan.ImportPlan.Build(volume, section_list=[1, 3])
+
+        self.assertEqual(plan.Sections, [1, 3])
+        self.assertEqual(plan.Summary(), {'sections': 2,
+                                          import_plan.ImportPlan.FILTER: 2,
+                                          import_plan.ImportPlan.TILE_LEVEL: 4,
+                                          import_plan.ImportPlan.MOSAIC: 2})
+
+        self.assertEqual(len(plan.ForSections([3])), 4)
+
+    def test_shard(self):
+        volume = volume_xml_stream.LoadVolume(self.VolumeXMLPath)
+        plan = import_plan.ImportPlan.Build(volume)
+
+        shards = plan.Shard(2)
+        self.assertEqual([shard.Sections for shard in shards], [[1, 3], [2]], "Sections should be dealt to shards in order")
+        self.assertEqual(sum([len(shard) for shard in shards]), len(plan), "Every task should land in exactly one shard")
+
+        self.assertEqual(len(plan.Shard(10)), 3, "Empty shards should not be returned")
+
+
+if __name__ == "__main__":
+    unittest.main()
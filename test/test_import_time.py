@@ -0,0 +1,25 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import unittest
+
+from nornir_djangomodel import profiling
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_read_path_skips_image_stack(self):
+        (seconds, loaded) = profiling.MeasureImportTime(profiling.ReadPathModules)
+        print("Read path import: %.3fs" % seconds)
+        self.assertEqual(loaded, [], "Reading the models should not import the image stack")
+
+    def test_importer_loads_image_stack_lazily(self):
+        (seconds, loaded) = profiling.MeasureImportTime(['nornir_djangomodel.import_xml', 'nornir_djangomodel.staging'])
+        print("Importer import: %.3fs" % seconds)
+        self.assertNotIn('nornir_imageregistration', loaded, "nornir_imageregistration should load at first use")
+        self.assertNotIn('nornir_volumemodel', loaded, "nornir_volumemodel should load at first use")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import pickle
+
+import django.test
+import numpy
+
+from nornir_djangomodel import models
+from nornir_djangomodel import scale_conversion
+
+
+class TestScale(django.test.TestCase):
+
+    def test_interned(self):
+        scale = models.Scale(2.18, 'nm')
+        self.assertIs(scale, models.Scale(2.18, 'nm'))
+        self.assertIs(scale, pickle.loads(pickle.dumps(scale)))
+        self.assertNotEqual(scale, models.Scale(2.18, 'um'))
+
+        with self.assertRaises(AttributeError):
+            scale.value = 1.0
+
+        with self.assertRaises(ValueError):
+            models.Scale(2, 'nm')
+
+    def test_scalebase_accessors_interned(self):
+        db_space = models.CoordSpace(name='0001.TEM.Tile1')
+        db_space.xscale = models.Scale(2.5, 'nm')
+        self.assertIs(db_space.xscale, db_space.xscale, "Repeated accesses should return the same Scale")
+        self.assertIn((2.5, 'nm'), models.Scale._interned)
+
+    def test_unit_conversion(self):
+        scale = models.Scale(1.5, 'um')
+        self.assertEqual(scale.nanometers, 1500.0)
+        self.assertIs(scale.ConvertTo('nm'), models.Scale(1500.0, 'nm'))
+        self.assertIs(scale.ConvertTo('um'), scale)
+
+        with self.assertRaises(ValueError):
+            scale.ConvertTo('furlong')
+
+    def test_convert_points(self):
+        db_dataset = models.Dataset.objects.create(name='ScaleTest', path='ScaleTest')
+        db_a = models.CoordSpace(name='0001.TEM.Tile1', dataset=db_dataset)
+        db_a.xscale = models.Scale(2.0, 'nm')
+        db_a.yscale = models.Scale(4.0, 'nm')
+        db_a.save()
+
+        db_b = models.CoordSpace(name='0001.TEM.Tile2', dataset=db_dataset)
+        db_b.xscale = models.Scale(0.01, 'um')
+        db_b.yscale = models.Scale(0.01, 'um')
+        db_b.save()
+
+        points = numpy.array([[1.0, 1.0], [10.0, 20.0]])
+        nm_points = scale_conversion.ConvertPoints(points, scale_conversion.PIXEL, scale_conversion.NANOMETER, from_space=db_a)
+        self.assertTrue(numpy.allclose(nm_points, [[4.0, 2.0], [40.0, 40.0]]))
+
+        per_point = scale_conversion.ConvertPoints(points, scale_conversion.PIXEL, scale_conversion.MICROMETER, from_space=[db_a, db_b])
+        self.assertTrue(numpy.allclose(per_point, [[0.004, 0.002], [0.1, 0.2]]))
+
+        b_points = scale_conversion.ConvertPoints(points, scale_conversion.PIXEL, scale_conversion.PIXEL, from_space=db_a, to_space=db_b)
+        self.assertTrue(numpy.allclose(b_points, [[0.4, 0.2], [4.0, 4.0]]))
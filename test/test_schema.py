@@ -0,0 +1,135 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.core.management import call_command
+from django.db import connections
+
+from nornir_djangomodel import models
+from nornir_djangomodel import schema
+from nornir_djangomodel import staging
+from nornir_djangomodel import transform_blobs
+import nornir_djangomodel.settings as settings
+
+# Tables as syncdb created them before any column in schema.Upgrades existed
+BaselineTables = (
+    'CREATE TABLE "nornir_djangomodel_boundingbox" ("id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, "minX" real NOT NULL, "minY" real NOT NULL, "minZ" real NOT NULL, "maxX" real NOT NULL, "maxY" real NOT NULL, "maxZ" real NOT NULL)',
+    'CREATE TABLE "nornir_djangomodel_dataset" ("name" varchar(64) NOT NULL PRIMARY KEY, "path" varchar(100) NOT NULL UNIQUE)',
+    'CREATE TABLE "nornir_djangomodel_channel" ("name" varchar(64) NOT NULL PRIMARY KEY, "dataset_id" varchar(64) NOT NULL REFERENCES "nornir_djangomodel_dataset" ("name"))',
+    'CREATE TABLE "nornir_djangomodel_filter" ("id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, "name" varchar(64) NOT NULL, "channel_id" varchar(64) NOT NULL REFERENCES "nornir_djangomodel_channel" ("name"))',
+    'CREATE TABLE "nornir_djangomodel_coordspace" ("scale_value_X" real NULL, "scale_units_X" varchar(2) NULL, "scale_value_Y" real NULL, "scale_units_Y" varchar(2) NULL, "scale_value_Z" real NULL, "scale_units_Z" varchar(2) NULL, "name" varchar(128) NOT NULL PRIMARY KEY, "dataset_id" varchar(64) NOT NULL REFERENCES "nornir_djangomodel_dataset" ("name"), "bounds_id" integer NULL REFERENCES "nornir_djangomodel_boundingbox" ("id"))',
+    'CREATE TABLE "nornir_djangomodel_data2d" ("name" varchar(64) NOT NULL, "relative_path" varchar(100) NOT NULL PRIMARY KEY, "image" text NOT NULL, "level" integer unsigned NOT NULL, "filter_id" integer NOT NULL REFERENCES "nornir_djangomodel_filter" ("id"), "coord_space_id" varchar(128) NOT NULL REFERENCES "nornir_djangomodel_coordspace" ("name"), "width" integer unsigned NOT NULL, "height" integer unsigned NOT NULL)',
+    'CREATE TABLE "nornir_djangomodel_mapping2d" ("id" integer NOT NULL PRIMARY KEY AUTOINCREMENT, "transform_string" text NOT NULL, "dest_coordinate_space_id" varchar(128) NOT NULL REFERENCES "nornir_djangomodel_coordspace" ("name"), "dest_bounding_box_id" integer NOT NULL REFERENCES "nornir_djangomodel_boundingbox" ("id"), "src_coordinate_space_id" varchar(128) NOT NULL REFERENCES "nornir_djangomodel_coordspace" ("name"), "src_bounding_box_id" integer NOT NULL REFERENCES "nornir_djangomodel_boundingbox" ("id"))',
+    'CREATE INDEX "nornir_djangomodel_boundingbox_minZ" ON "nornir_djangomodel_boundingbox" ("minZ")',
+    'CREATE UNIQUE INDEX "nornir_djangomodel_coordspace_dataset_id_name_uniq" ON "nornir_djangomodel_coordspace" ("dataset_id", "name")',
+    'CREATE INDEX "nornir_djangomodel_coordspace_dataset_id" ON "nornir_djangomodel_coordspace" ("dataset_id")',
+    'CREATE INDEX "nornir_djangomodel_mapping2d_dest_coordinate_space_id" ON "nornir_djangomodel_mapping2d" ("dest_coordinate_space_id")',
+)
+
+
+class TestUpgradeSchema(unittest.TestCase):
+    '''Upgrade a SQLite database built from the original models'''
+
+    Alias = 'baseline_schema'
+
+    def setUp(self):
+        self.TempPath = tempfile.mkdtemp()
+        staging._AddAlias(TestUpgradeSchema.Alias, {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(self.TempPath, 'baseline.sqlite3')})
+
+        cursor = connections[TestUpgradeSchema.Alias].cursor()
+        for sql in BaselineTables:
+            cursor.execute(sql)
+
+        cursor.execute('INSERT INTO "nornir_djangomodel_dataset" ("name", "path") VALUES (%s, %s)', ['D', 'D'])
+        cursor.execute('INSERT INTO "nornir_djangomodel_channel" ("name", "dataset_id") VALUES (%s, %s)', ['TEM', 'D'])
+        for name in ('0691.TEM.Tile1', '0691.TEM.Tile2', 'Grid'):
+            cursor.execute('INSERT INTO "nornir_djangomodel_coordspace" ("name", "dataset_id") VALUES (%s, %s)', [name, 'D'])
+        cursor.close()
+
+    def tearDown(self):
+        staging._RemoveAlias(TestUpgradeSchema.Alias)
+        shutil.rmtree(self.TempPath)
+
+    def Columns(self, model):
+        connection = connections[TestUpgradeSchema.Alias]
+        cursor = connection.cursor()
+        try:
+            return set([column.name for column in connection.introspection.get_table_description(cursor, model._meta.db_table)])
+        finally:
+            cursor.close()
+
+    def Indexes(self, model):
+        connection = connections[TestUpgradeSchema.Alias]
+        cursor = connection.cursor()
+        try:
+            return schema._IndexedColumns(connection, cursor, model._meta.db_table)
+        finally:
+            cursor.close()
+
+    def test_upgrade_is_idempotent(self):
+        statements = schema.UpgradeSchema(using=TestUpgradeSchema.Alias)
+        self.assertGreater(len(statements), 0)
+        self.assertEqual(schema.UpgradeSchema(using=TestUpgradeSchema.Alias), [], "A second upgrade should find nothing to do")
+
+    def test_coord_space_identity_columns(self):
+        schema.UpgradeSchema(using=TestUpgradeSchema.Alias)
+
+        self.assertTrue(set(['kind', 'section_number', 'channel_id', 'tile_number']).issubset(self.Columns(models.CoordSpace)))
+        self.assertIn(('dataset_id', 'section_number', 'kind', 'tile_number'), self.Indexes(models.CoordSpace))
+        self.assertIn(('minZ', 'maxZ'), self.Indexes(models.BoundingBox))
+
+        spaces = models.CoordSpace.objects.using(TestUpgradeSchema.Alias)
+        self.assertEqual(spaces.filter(dataset='D', kind__isnull=True, section_number__isnull=True).count(), 3, "Existing rows should have null identity columns")
+        self.assertEqual(spaces.filter(section_number=691).count(), 0)
+
+    def test_dataset_generation(self):
+        schema.UpgradeSchema(using=TestUpgradeSchema.Alias)
+
+        self.assertIn('generation', self.Columns(models.Dataset))
+        datasets = models.Dataset.objects.using(TestUpgradeSchema.Alias)
+        self.assertEqual(datasets.get(name='D').generation, 0, "Existing datasets should start at generation 0")
+
+        (db_dataset, created) = datasets.get_or_create(name='E', defaults={'path': 'E'})
+        self.assertTrue(created)
+        self.assertEqual(datasets.get(name='E').generation, 0)
+
+    def test_upgrade_on_connect(self):
+        '''The first connection a process opens to a database upgrades it before any query'''
+        connection = connections[TestUpgradeSchema.Alias]
+        connection.close()
+        schema._upgraded.discard((TestUpgradeSchema.Alias, connection.settings_dict['NAME']))
+
+        (db_dataset, created) = models.Dataset.objects.using(TestUpgradeSchema.Alias).get_or_create(name='D', defaults={'path': 'D'})
+        self.assertFalse(created)
+        self.assertEqual(db_dataset.generation, 0)
+
+    def test_migrate_transform_strings(self):
+        cursor = connections[TestUpgradeSchema.Alias].cursor()
+        cursor.execute('INSERT INTO "nornir_djangomodel_boundingbox" ("id", "minX", "minY", "minZ", "maxX", "maxY", "maxZ") VALUES (1, 0, 0, 691, 10, 10, 691)')
+        cursor.execute('INSERT INTO "nornir_djangomodel_mapping2d" ("transform_string", "dest_coordinate_space_id", "dest_bounding_box_id", "src_coordinate_space_id", "src_bounding_box_id") '
+                       'VALUES (%s, %s, 1, %s, 1)', ['GridTransform_1', 'Grid', '0691.TEM.Tile1'])
+        cursor.close()
+
+        # syncdb only adds the tables the baseline lacks, the migration adds the transform_blob column
+        call_command('syncdb', database=TestUpgradeSchema.Alias, interactive=False, verbosity=0)
+
+        settings.NORNIR_DJANGOMODEL_DATASET_DATABASES['D'] = TestUpgradeSchema.Alias
+        try:
+            self.assertEqual(transform_blobs.MigrateTransformStrings('D'), 1)
+        finally:
+            del settings.NORNIR_DJANGOMODEL_DATASET_DATABASES['D']
+
+        self.assertIn('transform_blob_id', self.Columns(models.Mapping2D))
+        db_mapping = models.Mapping2D.objects.using(TestUpgradeSchema.Alias).get()
+        self.assertIsNotNone(db_mapping.transform_blob_id)
+        self.assertEqual(db_mapping.transform, 'GridTransform_1')
+        self.assertGreater(models.Dataset.objects.using(TestUpgradeSchema.Alias).get(name='D').generation, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
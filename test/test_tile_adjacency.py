@@ -0,0 +1,50 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import random
+import unittest
+
+from nornir_djangomodel import tile_adjacency
+
+
+def BruteForcePairs(rects):
+    pairs = []
+    for i in range(len(rects)):
+        for j in range(i + 1, len(rects)):
+            height = min(rects[i][2], rects[j][2]) - max(rects[i][0], rects[j][0])
+            width = min(rects[i][3], rects[j][3]) - max(rects[i][1], rects[j][1])
+            if height > 0 and width > 0:
+                pairs.append((i, j, height * width))
+
+    return pairs
+
+
+class TestTileAdjacency(unittest.TestCase):
+
+    def test_row_of_tiles(self):
+        rects = [(0, 0, 100, 200), (0, 150, 100, 350), (0, 300, 100, 500), (0, 500, 100, 700)]
+        pairs = tile_adjacency.OverlappingPairs(rects)
+        self.assertEqual(sorted(pairs), [(0, 1, 5000.0), (1, 2, 5000.0)], "Tiles that only touch should not be adjacent")
+
+    def test_matches_pairwise_comparison(self):
+        rng = random.Random(1)
+        rects = []
+        for i in range(300):
+            (y, x) = (rng.uniform(0, 1000), rng.uniform(0, 1000))
+            rects.append((y, x, y + rng.uniform(1, 100), x + rng.uniform(1, 100)))
+
+        expected = sorted(BruteForcePairs(rects))
+        pairs = sorted(tile_adjacency.OverlappingPairs(rects))
+        self.assertEqual([pair[0:2] for pair in pairs], [pair[0:2] for pair in expected])
+        for (pair, expected_pair) in zip(pairs, expected):
+            self.assertAlmostEqual(pair[2], expected_pair[2])
+
+    def test_grid_with_tall_tile(self):
+        rects = [(row * 90.0, column * 90.0, (row * 90.0) + 100, (column * 90.0) + 100) for row in range(20) for column in range(20)]
+        rects.append((0.0, 500.0, 1800.0, 600.0))
+        self.assertEqual(sorted(tile_adjacency.OverlappingPairs(rects)), sorted(BruteForcePairs(rects)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import unittest
+
+from nornir_djangomodel import transform_bounds
+
+GridTransformA = 'GridTransform_double_2_2 vp 8 10 5 210 7 12 105 208 99 fp 7 0 1 1 0 0 200 100'
+GridTransformB = 'GridTransform_double_2_2 vp 8 -10 5 210 7 12 105 208 399 fp 7 0 1 1 0 0 200 100'
+
+
+class TestTransformBounds(unittest.TestCase):
+
+    def test_grid_transform_bounds(self):
+        (mapped_bounds, fixed_bounds) = transform_bounds.ParseGridTransformBounds(GridTransformA)
+        self.assertEqual(mapped_bounds, [0, 0, 100, 200], "Mapped bounds should cover the image")
+        self.assertEqual(fixed_bounds, [5, 10, 105, 210], "Fixed bounds should cover the control points")
+
+    def test_grid_transform_points(self):
+        points = transform_bounds.ParseGridTransformPoints(GridTransformA)
+        self.assertEqual(points.shape, (4, 4))
+        self.assertEqual(points[0].tolist(), [5, 10, 0, 0], "First control point should map the image origin")
+        self.assertEqual(points[3].tolist(), [99, 208, 100, 200], "Last control point should map the far image corner")
+
+    def test_unexpected_layout_is_not_parsed(self):
+        self.assertIsNone(transform_bounds.ParseGridTransformBounds('GridTransform_double_2_2 vp 6 10 5 210 7 12 105 fp 7 0 1 1 0 0 200 100'),
+                          "Point count that does not match the grid size should defer to the full parser")
+        self.assertIsNone(transform_bounds.ParseGridTransformBounds('Rigid2DTransform_double_2_2 vp 3 0 10 10 fp 2 0 0'),
+                          "Only grid transforms are read directly")
+
+    def test_mosaic_bounds(self):
+        (tile_bounds, mosaic_bounds) = transform_bounds.MosaicBounds({'001.png': GridTransformA,
+                                                                      '002.png': GridTransformB})
+        self.assertEqual(len(tile_bounds), 2)
+        self.assertEqual(mosaic_bounds, [5, -10, 399, 210], "Mosaic bounds should be the union of the tile bounds")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+'''
+Created on Oct 19, 2026
+
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+import test.test_base
+from nornir_djangomodel import import_xml
+from nornir_djangomodel import volume_xml_stream
+
+
+def _SectionXML(number):
+    return '''<Section Number="%d" Path="%04d">
+  <Channel Name="TEM" Path="TEM">
+    <Scale><X UnitsOfMeasure="nm" UnitsPerPixel="2.18"/><Y UnitsOfMeasure="nm" UnitsPerPixel="2.18"/></Scale>
+    <Filter Name="Leveled" Path="Leveled">
+      <TilePyramid Path="TilePyramid" ImageFormatExt=".png"><Level Downsample="2" Path="002"/><Level Downsample="1" Path="001"/></TilePyramid>
+    </Filter>
+    <Transform Name="Grid" Path="Grid.mosaic"/>
+  </Channel>
+</Section>
+''' % (number, number)
+
+
+class VolumeXMLTestBase(unittest.TestCase):
+    '''Writes a three section volume, with the last section linked from its own VolumeData.xml'''
+
+    def setUp(self):
+        self.VolumeDir = tempfile.mkdtemp()
+        self.VolumeXMLPath = os.path.join(self.VolumeDir, volume_xml_stream.VolumeXMLFilename)
+
+        with open(self.VolumeXMLPath, 'w') as xml_file:
+            xml_file.write('<?xml version="1.0" encoding="utf-8"?>\n<Volume Name="Test" Path="Test">\n<Block Name="TEM" Path="TEM">\n')
+            xml_file.write(_SectionXML(1))
+            xml_file.write(_SectionXML(2))
+            xml_file.write('<Section_Link Path="0003"/>\n</Block>\n</Volume>\n')
+
+        os.makedirs(os.path.join(self.VolumeDir, 'TEM', '0003'))
+        with open(os.path.join(self.VolumeDir, 'TEM', '0003', volume_xml_stream.VolumeXMLFilename), 'w') as xml_file:
+            xml_file.write(_SectionXML(3))
+
+    def tearDown(self):
+        shutil.rmtree(self.VolumeDir)
+
+
+class TestVolumeXMLStream(VolumeXMLTestBase):
+
+    def CheckSections(self, volume, expected_sections):
+        self.assertEqual(volume.Name, 'Test')
+        self.assertEqual(len(volume.Blocks), 1)
+        self.assertEqual([section.Number for section in volume.Blocks[0].Sections], expected_sections)
+
+        section = volume.Blocks[0].Sections[-1]
+        channel = section.Channels[0]
+        self.assertEqual(channel.Scale.X.UnitsPerPixel, 2.18)
+        self.assertEqual([level.Number for level in channel.Filters['Leveled'].TilePyramid.Levels], [1, 2], "Levels should be sorted by downsample")
+
+        level = channel.Filters['Leveled'].TilePyramid.Levels[0]
+        expected_relative_path = os.path.join('TEM', '%04d' % section.Number, 'TEM', 'Leveled', 'TilePyramid', '001')
+        self.assertEqual(level.RelativePath, expected_relative_path)
+        self.assertEqual(level.FullPath, os.path.join(self.VolumeDir, expected_relative_path))
+        self.assertEqual(channel.Transforms['Grid'].FullPath, os.path.join(self.VolumeDir, 'TEM', '%04d' % section.Number, 'TEM', 'Grid.mosaic'))
+
+    def test_stream_selected_sections(self):
+        self.CheckSections(volume_xml_stream.LoadVolume(self.VolumeXMLPath, [2, 3]), [2, 3])
+        self.CheckSections(volume_xml_stream.LoadVolume(self.VolumeXMLPath), [1, 2, 3])
+
+    def test_section_index(self):
+        self.CheckSections(volume_xml_stream.LoadVolumeSections(self.VolumeXMLPath, [2]), [2])
+        self.assertTrue(os.path.exists(os.path.join(self.VolumeDir, volume_xml_stream.SectionIndexFilename)))
+
+        # Second load reads the saved index
+        self.CheckSections(volume_xml_stream.LoadVolumeSections(self.VolumeXMLPath, [3, 1]), [1, 3])
+
+
+def _Summarize(volume_model):
+    ''':return: The attributes of a volume that VolumeXMLImporter reads, as nested lists ordered by section'''
+    sections = []
+    for block in volume_model.Blocks:
+        for section in block.Sections:
+            channels = []
+            for channel in section.Channels:
+                scale = None
+                if channel.Scale is not None:
+                    scale = [(axis.UnitsOfMeasure, float(axis.UnitsPerPixel)) for axis in (channel.Scale.X, channel.Scale.Y)]
+
+                filters = []
+                for filter_name in sorted(channel.Filters.keys()):
+                    tile_pyramid = channel.Filters[filter_name].TilePyramid
+                    if tile_pyramid is None:
+                        filters.append((filter_name, None))
+                        continue
+
+                    levels = sorted([(int(level.Number), level.RelativePath, level.FullPath) for level in tile_pyramid.Levels])
+                    filters.append((filter_name, (tile_pyramid.ImageFormatExt, levels)))
+
+                transforms = sorted([(transform_obj.Name, transform_obj.FullPath) for transform_obj in channel.Transforms.values()])
+                channels.append((channel.Name, scale, filters, transforms))
+
+            sections.append((int(section.Number), sorted(channels)))
+
+    return sorted(sections)
+
+
+class TestVolumeModelParity(test.test_base.PlatformTest):
+    '''The streamed model must match nornir_volumemodel on the VolumeData.xml the import tests use'''
+
+    @property
+    def VolumePath(self):
+        return "IDocBuildTest"
+
+    @property
+    def Platform(self):
+        return "IDOC"
+
+    def test_matches_volumemodel(self):
+        volume_xml_path = os.path.join(self.ImportedDataPath, volume_xml_stream.VolumeXMLFilename)
+        expected = import_xml.VolumeXMLImporter._LoadVolume(volume_xml_path, None)
+        expected_sections = _Summarize(expected)
+        self.assertGreater(len(expected_sections), 0)
+
+        section_list = [section[0] for section in expected_sections]
+        streamed = volume_xml_stream.LoadVolumeSections(volume_xml_path, section_list)
+        self.assertEqual(streamed.Name, expected.Name)
+        self.assertEqual(_Summarize(streamed), expected_sections)
+
+        # A subset of the sections matches the same subset of the full model
+        streamed = volume_xml_stream.LoadVolumeSections(volume_xml_path, section_list[:1])
+        self.assertEqual(_Summarize(streamed), expected_sections[:1])
+
+
+if __name__ == "__main__":
+    unittest.main()